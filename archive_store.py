@@ -0,0 +1,210 @@
+# filename: archive_store.py
+# one copy of every archive, no matter how many output folders want it.
+# archives live under their sha256, output folders get reflinks or hardlinks to them,
+# and a mod that's already in the store doesn't get downloaded again.
+#
+#     python3 archive_store.py stats
+#     python3 archive_store.py gc --dry-run
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import zipfile
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+from resolution_cache import CACHE_DIR
+from manifest import file_sha256
+from extractor import archive_fingerprint
+from filelinks import materialize
+
+DEFAULT_STORE_PATH = CACHE_DIR / "store"
+
+
+class ArchiveStore:
+    def __init__(self, root=DEFAULT_STORE_PATH, link=None):
+        self.root = Path(root)
+        self.link = link or "auto"
+        self.objects = self.root / "objects"
+        # extracted archives, keyed by the zip's fingerprint. output folders link into these.
+        self.trees = self.root / "trees"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.trees.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False)
+        with self.lock, self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS objects (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    fingerprint TEXT,
+                    stored_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS mods (
+                    mod_id TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    archive TEXT NOT NULL,
+                    steam_updated INTEGER,
+                    stored_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS refs (
+                    folder TEXT NOT NULL,
+                    archive TEXT NOT NULL,
+                    mod_id TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    added_at REAL NOT NULL,
+                    PRIMARY KEY (folder, archive)
+                );
+            """)
+
+    def object_path(self, sha256):
+        return self.objects / sha256[:2] / sha256
+
+    def add(self, mod_id, path, steam_updated=None, sha256=None):
+        # takes a finished download into the store and makes the original a link to it.
+        # returns the sha256, so the manifest doesn't have to hash it again.
+        path = Path(path).resolve()
+        sha256 = sha256 or file_sha256(path)
+        stored = self.object_path(sha256)
+        if not stored.exists():
+            stored.parent.mkdir(parents=True, exist_ok=True)
+            materialize(path, stored, "hardlink" if self.link in ("auto", "hardlink") else self.link)
+            logging.info(f"store: added {path.name} ({sha256[:12]})")
+        elif not os.path.samefile(stored, path):
+            # we already had it. the download becomes a link and the duplicate goes away.
+            materialize(stored, path, self.link)
+        try:
+            with zipfile.ZipFile(stored) as zf:
+                fingerprint = archive_fingerprint(zf)
+        except zipfile.BadZipFile:
+            fingerprint = None
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR IGNORE INTO objects (sha256, size, fingerprint, stored_at) VALUES (?, ?, ?, ?)", (sha256, stored.stat().st_size, fingerprint, now))
+            self.db.execute(
+                "INSERT OR REPLACE INTO mods (mod_id, sha256, archive, steam_updated, stored_at) VALUES (?, ?, ?, ?, ?)",
+                (str(mod_id), sha256, path.name, steam_updated, now),
+            )
+        self.reference(mod_id, path, sha256)
+        return sha256
+
+    def reference(self, mod_id, path, sha256):
+        path = Path(path).resolve()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO refs (folder, archive, mod_id, sha256, added_at) VALUES (?, ?, ?, ?, ?)",
+                (str(path.parent), path.name, str(mod_id), sha256, time.time()),
+            )
+
+    def lookup(self, mod_id, steam_updated=None):
+        # what the store has for this mod, if it's still the current version. None otherwise.
+        with self.lock:
+            row = self.db.execute("SELECT sha256, archive, steam_updated FROM mods WHERE mod_id = ?", (str(mod_id),)).fetchone()
+        if not row:
+            return None
+        sha256, archive, stored_updated = row
+        if steam_updated and (stored_updated or 0) < steam_updated:
+            return None
+        if not self.object_path(sha256).exists():
+            return None
+        return {"sha256": sha256, "archive": archive, "steam_updated": stored_updated}
+
+    def checkout(self, mod_id, folder, steam_updated=None):
+        # puts the stored archive into folder. returns the store entry, or None if we don't have it.
+        entry = self.lookup(mod_id, steam_updated)
+        if not entry:
+            return None
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        target = folder / entry["archive"]
+        if not (target.exists() and os.path.samefile(target, self.object_path(entry["sha256"]))):
+            how = materialize(self.object_path(entry["sha256"]), target, self.link)
+            logging.info(f"store: {mod_id} -> {target.name} ({how}), no download needed.")
+        self.reference(mod_id, target, entry["sha256"])
+        return entry
+
+    def tree_path(self, fingerprint):
+        return self.trees / fingerprint
+
+    def stats(self):
+        with self.lock:
+            objects, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+            mods = self.db.execute("SELECT COUNT(*) FROM mods").fetchone()[0]
+            refs = self.db.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        trees = sum(1 for t in self.trees.iterdir() if not t.name.startswith(".")) if self.trees.exists() else 0
+        return {"objects": objects, "bytes": size, "mods": mods, "refs": refs, "trees": trees}
+
+    def gc(self, dry_run=False, keep_days=0):
+        # drops references to files that are gone, then objects nobody references
+        # (unless they're younger than keep_days), then extracted trees of dropped objects.
+        with self.lock:
+            refs = self.db.execute("SELECT folder, archive, sha256 FROM refs").fetchall()
+            objects = self.db.execute("SELECT sha256, size, fingerprint, stored_at FROM objects").fetchall()
+        sizes = {sha: size for sha, size, _, _ in objects}
+        stale_refs = []
+        for folder, archive, sha256 in refs:
+            path = Path(folder) / archive
+            try:
+                if path.stat().st_size != sizes.get(sha256):
+                    stale_refs.append((folder, archive))
+            except FileNotFoundError:
+                stale_refs.append((folder, archive))
+        stale = set(stale_refs)
+        live = {sha for folder, archive, sha in refs if (folder, archive) not in stale}
+        cutoff = time.time() - keep_days * 86400
+        dead = [(sha, size, fingerprint) for sha, size, fingerprint, stored_at in objects if sha not in live and stored_at < cutoff]
+        dead_shas = {sha for sha, _, _ in dead}
+        keep_trees = {fingerprint for sha, size, fingerprint, stored_at in objects if fingerprint and sha not in dead_shas}
+        dead_trees = [t for t in self.trees.iterdir() if t.name not in keep_trees and not t.name.startswith(".")] if self.trees.exists() else []
+
+        freed = sum(size for _, size, _ in dead)
+        verb = "would remove" if dry_run else "removed"
+        logging.info(f"store gc: {verb} {len(stale_refs)} stale refs, {len(dead)} archives ({freed / 2**20:.1f} MB), {len(dead_trees)} extracted trees.")
+        if dry_run:
+            return {"refs": len(stale_refs), "objects": len(dead), "bytes": freed, "trees": len(dead_trees)}
+
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM refs WHERE folder = ? AND archive = ?", stale_refs)
+            for sha, _, _ in dead:
+                self.db.execute("DELETE FROM objects WHERE sha256 = ?", (sha,))
+                self.db.execute("DELETE FROM mods WHERE sha256 = ?", (sha,))
+        for sha, _, _ in dead:
+            try:
+                self.object_path(sha).unlink()
+            except FileNotFoundError:
+                pass
+        for tree in dead_trees:
+            shutil.rmtree(tree, ignore_errors=True)
+        return {"refs": len(stale_refs), "objects": len(dead), "bytes": freed, "trees": len(dead_trees)}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    parser = argparse.ArgumentParser(description="looks after the shared archive store.")
+    parser.add_argument('command', choices=["stats", "gc"])
+    parser.add_argument('--store', type=str, default=str(DEFAULT_STORE_PATH), help="store folder")
+    parser.add_argument('--dry-run', action='store_true', help="gc: just say what would go")
+    parser.add_argument('--keep-days', type=float, default=0, help="gc: keep unreferenced archives younger than this")
+    args = parser.parse_args()
+
+    if not Path(args.store).exists():
+        print(f"error: no store at {args.store}", flush=True)
+        sys.exit(1)
+    store = ArchiveStore(args.store)
+    if args.command == "stats":
+        s = store.stats()
+        print(f"{s['objects']} archives ({s['bytes'] / 2**20:.1f} MB) for {s['mods']} mods, {s['refs']} output files, {s['trees']} extracted trees.")
+    else:
+        store.gc(dry_run=args.dry_run, keep_days=args.keep_days)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
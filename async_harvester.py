@@ -0,0 +1,303 @@
+# filename: async_harvester.py
+# the harvester for people who want to call it from their own code instead of a terminal.
+#
+#     async with AsyncHarvester(download_folder="mods", engine="http", unzip=True) as harvester:
+#         async for event in await harvester.fetch(["2858562094", "1234567890"]):
+#             print(event)
+#
+# resolve, download and extract run as separate stages connected by small queues. when
+# a stage falls behind, the one in front of it waits. nothing in here calls sys.exit.
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from mod_harvester import ModHarvester, HarvesterError, preset_for_app
+from http_engine import HttpEngine, EngineError
+from extractor import ExtractionPipeline
+from verifier import VerificationPipeline, quarantine, DEFAULT_VERIFY_WORKERS
+from steam_api import SteamApiError
+
+DEFAULT_RESOLVE_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 8
+# marks the end of a stage queue
+DONE = object()
+
+
+class FetchRun:
+    # what fetch() hands back. iterate it with async for, or await it for the same iterator.
+    def __init__(self, owner, mod_ids):
+        self.owner = owner
+        self.mod_ids = list(dict.fromkeys(str(m) for m in mod_ids))
+        self.events = asyncio.Queue(maxsize=owner.queue_size * 4)
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.owner.run(self.mod_ids, self.events))
+        return self
+
+    def __await__(self):
+        async def started():
+            return self.start()
+        return started().__await__()
+
+    def __aiter__(self):
+        return self.start()
+
+    async def __anext__(self):
+        while True:
+            if not self.events.empty():
+                return self.events.get_nowait()
+            if self.task.done():
+                # re-raises whatever killed the run
+                self.task.result()
+                raise StopAsyncIteration
+            getter = asyncio.ensure_future(self.events.get())
+            await asyncio.wait({getter, self.task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                return getter.result()
+            getter.cancel()
+
+    async def aclose(self):
+        # stop early. whatever is in flight gets cancelled, drivers get closed.
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def results(self):
+        # just the per-mod results, once everything is done
+        return [event async for event in self if event["event"] == "result"]
+
+
+class AsyncHarvester:
+    def __init__(self, harvester=None, resolve_workers=DEFAULT_RESOLVE_WORKERS, download_workers=None, queue_size=DEFAULT_QUEUE_SIZE, **options):
+        # takes a ready ModHarvester, or the same keyword arguments one would take
+        self.harvester = harvester or ModHarvester(**options)
+        self.resolve_workers = max(1, resolve_workers)
+        self.download_workers = max(1, download_workers or self.harvester.workers)
+        self.queue_size = max(1, queue_size)
+        # blocking work (pages, sockets, firefox) runs here so the event loop never stalls
+        self.executor = ThreadPoolExecutor(max_workers=self.resolve_workers + self.download_workers + 1, thread_name_prefix="harvest")
+
+    def fetch(self, mod_ids):
+        return FetchRun(self, mod_ids)
+
+    async def call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    # --- stages ---
+
+    async def route(self, mod_ids):
+        # mod id -> smods site. one bulk steam lookup unless a base url was given.
+        owner = self.harvester
+        if owner.base_url:
+            return {m: owner.base_url for m in mod_ids}, []
+        try:
+            app_ids = await self.call(owner.steam.app_ids, mod_ids)
+        except SteamApiError as e:
+            raise HarvesterError(f"could not look up games for {len(mod_ids)} mods: {e}. pass base_url.") from e
+        routes = {}
+        unresolved = []
+        for mod_id in mod_ids:
+            if app_ids.get(mod_id):
+                routes[mod_id] = preset_for_app(app_ids[mod_id])[1]
+            else:
+                unresolved.append(mod_id)
+        return routes, unresolved
+
+    def locate(self, mod_id, base_url):
+        # runs in a thread. None means "let firefox figure it out".
+        owner = self.harvester
+        if owner.engine != "http":
+            return None, None
+        engine = HttpEngine(base_url, owner.download_folder, mirror_domain=owner.mirror_domain, cache=owner.cache, segments=owner.segments, throttle=owner.throttle)
+        try:
+            with owner.step("http resolve", mod_id):
+                return engine, engine.locate(mod_id)
+        except EngineError as e:
+            logging.warning(f"http engine could not resolve {mod_id} ({e}). firefox will try.")
+            return None, None
+
+    def download(self, worker, mod_id, base_url, engine, resolved):
+        # runs in a thread. returns the archive name in the owner's download folder.
+        owner = self.harvester
+        if engine:
+            try:
+                with owner.step("transfer", mod_id) as record:
+                    path = engine.store(mod_id, resolved)
+                    record["bytes"] = path.stat().st_size
+                owner.downloads[mod_id] = path.name
+                owner.expected_sizes[mod_id] = engine.expected.get(path.name)
+                return path.name
+            except EngineError as e:
+                logging.warning(f"http engine gave up on {mod_id} ({e}). falling back to firefox.")
+
+        # the worker is a clone with its own firefox. it passes finished files up to the owner.
+        worker.base_url = base_url
+        if not worker.driver:
+            worker.setup_driver()
+        if not worker.download_mod(mod_id, worker.main_window_handle):
+            return None
+        worker.wait_for_downloads()
+        worker.keep_fresh()
+        return owner.downloads.get(mod_id)
+
+    async def resolve_stage(self, inbox, outbox, routes, emit):
+        while True:
+            mod_id = await inbox.get()
+            if mod_id is DONE:
+                return
+            base_url = routes[mod_id]
+            try:
+                if self.harvester.endpoints:
+                    base_url = await self.call(self.harvester.endpoints.choose, base_url)
+                engine, resolved = await self.call(self.locate, mod_id, base_url)
+            except Exception as e:
+                await emit(self.result(mod_id, False, error=f"resolve failed: {e}"))
+                continue
+            await emit({"event": "resolved", "mod_id": mod_id, "base_url": base_url, "browser": engine is None})
+            # blocks here when downloads are behind. that's the backpressure.
+            await outbox.put((mod_id, base_url, engine, resolved))
+
+    async def download_stage(self, index, inbox, outbox, emit):
+        worker = self.harvester.spawn_worker(f"async_{index}")
+        worker.download_folder.mkdir(parents=True, exist_ok=True)
+        try:
+            while True:
+                job = await inbox.get()
+                if job is DONE:
+                    return
+                mod_id = job[0]
+                try:
+                    archive = await self.call(self.download, worker, *job)
+                except HarvesterError as e:
+                    await emit(self.result(mod_id, False, error=str(e)))
+                    continue
+                except Exception as e:
+                    await emit(self.result(mod_id, False, error=f"download failed: {e}"))
+                    continue
+                if not archive:
+                    failure = self.harvester.failures.get(mod_id)
+                    error = f"{failure['kind']}: {failure['error']}" if failure else "download failed. see the log."
+                    await emit(self.result(mod_id, False, error=error))
+                    continue
+                self.harvester.failures.pop(mod_id, None)
+                await emit({"event": "downloaded", "mod_id": mod_id, "archive": archive})
+                await outbox.put((mod_id, archive))
+        finally:
+            await self.call(worker.quit_driver)
+            await self.call(self.harvester.merge_worker_folder, worker.download_folder)
+
+    async def extract_stage(self, inbox, pipeline, verifier, emit):
+        while True:
+            job = await inbox.get()
+            if job is DONE:
+                return
+            mod_id, archive = job
+            if verifier:
+                # a broken archive never gets extracted or into the manifest
+                path = self.harvester.download_folder / archive
+                try:
+                    checked = await asyncio.wrap_future(verifier.submit(mod_id, path, self.harvester.expected_sizes.pop(mod_id, None)))
+                except Exception as e:
+                    quarantine(path)
+                    self.harvester.downloads.pop(mod_id, None)
+                    await emit(self.result(mod_id, False, archive=archive, error=f"broken archive: {e}"))
+                    continue
+                self.harvester.hashes[mod_id] = checked["sha256"]
+            if not pipeline:
+                await emit(self.result(mod_id, True, archive=archive))
+                continue
+            future = pipeline.submit(mod_id, self.harvester.download_folder / archive)
+            try:
+                extracted = await asyncio.wrap_future(future)
+            except Exception as e:
+                extracted = {"status": "failed", "error": str(e)}
+            ok = extracted["status"] != "failed"
+            await emit(self.result(mod_id, ok, archive=archive, extracted=extracted["status"], error=extracted.get("error")))
+
+    def result(self, mod_id, ok, archive=None, extracted=None, error=None):
+        return {"event": "result", "mod_id": mod_id, "ok": ok, "archive": archive, "extracted": extracted, "error": error}
+
+    async def run(self, mod_ids, events):
+        owner = self.harvester
+        owner.download_folder.mkdir(parents=True, exist_ok=True)
+        started = time.time()
+        stats = {"done": 0, "failed": 0}
+        total = len(mod_ids)
+
+        async def emit(event):
+            if event["event"] == "result":
+                event["elapsed"] = round(time.time() - started, 2)
+                await events.put(event)
+                stats["done"] += 1
+                stats["failed"] += not event["ok"]
+                rate = stats["done"] / max((time.time() - started) / 60, 1e-6)
+                event = {"event": "progress", "done": stats["done"], "total": total, "failed": stats["failed"], "mods_per_min": round(rate, 1)}
+            await events.put(event)
+
+        # extraction goes through our own stage so results can wait for it
+        pipeline = ExtractionPipeline(owner.download_folder, workers=owner.unzip_workers, skip_current=not owner.reextract, metrics=owner.metrics) if owner.unzip else None
+        # same for the checks before it. index.json gets written as they finish.
+        verifier = VerificationPipeline(owner.download_folder, metrics=owner.metrics) if owner.verify else None
+        try:
+            routes, unresolved = await self.route(mod_ids)
+            for mod_id in unresolved:
+                await emit(self.result(mod_id, False, error="steam doesn't know which game this is"))
+
+            to_resolve = asyncio.Queue(self.queue_size)
+            to_download = asyncio.Queue(self.queue_size)
+            to_extract = asyncio.Queue(self.queue_size)
+
+            async def feed():
+                for mod_id in routes:
+                    await to_resolve.put(mod_id)
+                for _ in range(self.resolve_workers):
+                    await to_resolve.put(DONE)
+
+            async def close_after(tasks, queue, consumers):
+                # once every worker of a stage is done, the next stage gets told to finish up
+                await asyncio.gather(*tasks)
+                for _ in range(consumers):
+                    await queue.put(DONE)
+
+            resolvers = [asyncio.ensure_future(self.resolve_stage(to_resolve, to_download, routes, emit)) for _ in range(self.resolve_workers)]
+            downloaders = [asyncio.ensure_future(self.download_stage(i, to_download, to_extract, emit)) for i in range(self.download_workers)]
+            # one consumer per pool slot. each waits on its own archive, so the pools stay busy.
+            extract_workers = max(1, owner.unzip_workers if pipeline else 0, DEFAULT_VERIFY_WORKERS if verifier else 0)
+            extractors = [asyncio.ensure_future(self.extract_stage(to_extract, pipeline, verifier, emit)) for _ in range(extract_workers)]
+            stages = resolvers + downloaders + extractors
+            try:
+                await asyncio.gather(
+                    feed(),
+                    close_after(resolvers, to_download, self.download_workers),
+                    close_after(downloaders, to_extract, extract_workers),
+                    *stages,
+                )
+            finally:
+                for task in stages:
+                    task.cancel()
+                await asyncio.gather(*stages, return_exceptions=True)
+
+            await self.call(owner.record_downloads, list(routes))
+        finally:
+            if verifier:
+                await self.call(verifier.close)
+            if pipeline:
+                await self.call(pipeline.close)
+            await self.call(owner.finish_metrics)
+            elapsed = time.time() - started
+            logging.info(f"async fetch: {stats['done']}/{total} mods, {stats['failed']} failed, in {elapsed:.0f}s.")
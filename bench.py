@@ -0,0 +1,390 @@
+# filename: bench.py
+# offline benchmark. a fake smods + modsbase on localhost, the real harvester pointed at it.
+# measures mods/minute, per-phase latency and memory for single, batch and parallel runs,
+# and writes json you can diff against the last commit's numbers.
+#
+#     python3 bench.py --engine http --mods 20 --size-mb 2 --out bench.json
+#     python3 bench.py --engine http --mods 20 --size-mb 2 --compare bench.json
+import io
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import zipfile
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from mod_harvester import ModHarvester, HarvesterError
+from memory_budget import process_rss, descendants
+from steam_api import SteamClient
+
+BENCH_APP_ID = "255710"
+MODES = ("single", "batch", "parallel")
+# spam tabs go here. nothing listens on it, firefox shows an error page, the harvester kills the tab.
+SPAM_HOST = "127.0.0.2"
+
+# --- the fake site ---
+
+SEARCH_PAGE = """<html><body><main>
+<article class="post"><a href="/archives/{mod_id}"><h2>Mod {mod_id}</h2></a></article>
+</main></body></html>"""
+
+MOD_PAGE = """<html><body>{popup}
+<article><h1>Mod {mod_id}</h1>
+<a class="skymods-excerpt-btn" target="_blank" href="{mirror}/mirror/{mod_id}">Download</a>
+</article></body></html>"""
+
+MIRROR_PAGE = """<html><body>{popup}
+<div id="cookie">we use cookies <button onclick="this.parentNode.remove()">Accept</button></div>
+<form method="post" action="/mirror/{mod_id}">
+<input type="hidden" name="op" value="download2"><input type="hidden" name="id" value="{mod_id}">
+<span id="countdown">{countdown}</span>
+<button type="submit" id="downloadbtn" name="method_free" value="Create download link"{disabled}>Create download link</button>
+</form>
+<script>
+var left = {countdown};
+var tick = setInterval(function () {{
+  left -= 1;
+  document.getElementById('countdown').textContent = Math.max(left, 0);
+  if (left <= 0) {{
+    clearInterval(tick);
+    document.getElementById('countdown').style.display = 'none';
+    document.getElementById('downloadbtn').disabled = false;
+  }}
+}}, 1000);
+</script></body></html>"""
+
+LINK_PAGE = """<html><body><a href="/files/{mod_id}.zip">{mod_id}.zip</a></body></html>"""
+
+# first click anywhere opens a spam tab. like the real thing, but only once per page.
+POPUP_SCRIPT = """<script>
+document.addEventListener('click', function once() {{
+  document.removeEventListener('click', once, true);
+  window.open('http://{spam}/ad', '_blank');
+}}, true);
+</script>"""
+
+
+def build_zip(size):
+    # one stored member of the requested size. stored so the bytes on the wire are the size you asked for.
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("mod/readme.txt", "benchmark mod\n")
+        zf.writestr("mod/data.bin", (b"mod_harvester bench " * (size // 20 + 1))[:size])
+    return buffer.getvalue()
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_page(self, html, status=200):
+        body = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        site = self.server.site
+        site.count_request()
+        time.sleep(site.latency)
+        url = urlparse(self.path)
+        popup = POPUP_SCRIPT.format(spam=f"{SPAM_HOST}:{site.port}") if site.popups else ""
+
+        if url.path == "/" and "s" in parse_qs(url.query):
+            self.send_page(SEARCH_PAGE.format(mod_id=parse_qs(url.query)["s"][0]))
+        elif match := re.fullmatch(r"/archives/(\d+)", url.path):
+            self.send_page(MOD_PAGE.format(mod_id=match.group(1), mirror=site.mirror_url, popup=popup))
+        elif match := re.fullmatch(r"/mirror/(\d+)", url.path):
+            disabled = " disabled" if site.countdown > 0 else ""
+            self.send_page(MIRROR_PAGE.format(mod_id=match.group(1), countdown=site.countdown, disabled=disabled, popup=popup))
+        elif match := re.fullmatch(r"/files/(\d+)\.zip", url.path):
+            self.send_zip(match.group(1))
+        else:
+            self.send_page("<html><body>not found</body></html>", status=404)
+
+    def do_POST(self):
+        self.server.site.count_request()
+        time.sleep(self.server.site.latency)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        match = re.fullmatch(r"/mirror/(\d+)", urlparse(self.path).path)
+        if not match:
+            self.send_page("<html><body>not found</body></html>", status=404)
+            return
+        self.send_page(LINK_PAGE.format(mod_id=match.group(1)))
+
+    def send_zip(self, mod_id):
+        site = self.server.site
+        data = site.archive
+        start, end = 0, len(data) - 1
+        ranged = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if ranged:
+            start = int(ranged.group(1))
+            end = min(int(ranged.group(2) or end), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Disposition", f'attachment; filename="{mod_id}.zip"')
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        chunk = 1 << 16
+        for offset in range(start, end + 1, chunk):
+            piece = data[offset:min(offset + chunk, end + 1)]
+            self.wfile.write(piece)
+            if site.bandwidth:
+                time.sleep(len(piece) / site.bandwidth)
+
+
+class FakeSite:
+    # smods on 127.0.0.1, modsbase on localhost. same server, different "domains".
+    def __init__(self, archive_size=1 << 20, countdown=0, latency=0.0, bandwidth=None, popups=False, port=0):
+        self.archive = build_zip(archive_size)
+        self.countdown = countdown
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.popups = popups
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), FakeSiteHandler)
+        self.server.daemon_threads = True
+        self.server.site = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def mirror_url(self):
+        return f"http://localhost:{self.port}"
+
+    @property
+    def mirror_domain(self):
+        return f"localhost:{self.port}"
+
+    @property
+    def trusted_domains(self):
+        return (self.mirror_domain, f"127.0.0.1:{self.port}")
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-site", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def offline_steam(app_id=BENCH_APP_ID):
+    # every mod belongs to the bench game and nothing ever updates. no network.
+    def post(url, fields, timeout=30):
+        ids = [v for k, v in fields.items() if k.startswith("publishedfileids")]
+        if "Collection" in url:
+            return {"response": {"collectiondetails": [{"publishedfileid": m, "result": 9} for m in ids]}}
+        return {"response": {"publishedfiledetails": [
+            {"publishedfileid": m, "result": 1, "consumer_app_id": int(app_id), "time_updated": 0} for m in ids
+        ]}}
+    return SteamClient(post=post)
+
+
+# --- measuring ---
+
+class MemorySampler:
+    # peak rss of this process plus everything it started, sampled in the background
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="memory-sampler", daemon=True)
+
+    def sample(self):
+        pids = [os.getpid()] + descendants(os.getpid())
+        total = sum(process_rss(pid) or 0 for pid in pids)
+        self.peak = max(self.peak, total)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_mode(mode, site, mod_ids, workdir, engine="http", workers=4, headless=True, profile=None, lean=False, rate=0):
+    folder = workdir / mode
+    options = dict(
+        base_url=site.base_url,
+        app_id=BENCH_APP_ID,
+        download_folder=folder,
+        profile_path=profile,
+        headless=headless,
+        engine=engine,
+        cache_path=None,
+        steam=offline_steam(),
+        mirror_domain=site.mirror_domain,
+        trusted_domains=site.trusted_domains,
+        lean=lean,
+        rate=rate,
+    )
+    if mode == "single":
+        mod_ids = mod_ids[:1]
+    else:
+        mod_file = workdir / f"{mode}_ids.txt"
+        mod_file.write_text("\n".join(mod_ids) + "\n")
+        options.update(mod_file=mod_file, workers=workers if mode == "parallel" else 1)
+
+    requests_before = site.requests
+    started = time.monotonic()
+    with MemorySampler() as memory:
+        harvester = ModHarvester(**options)
+        if mode == "single":
+            harvester.run_single(f"https://steamcommunity.com/sharedfiles/filedetails/?id={mod_ids[0]}")
+        else:
+            harvester.run_batch()
+    elapsed = time.monotonic() - started
+
+    done = [m for m, name in harvester.downloads.items() if name and (folder / name).exists()]
+    phases = {
+        phase: {"count": s["count"], "p50": round(s["p50"], 4), "p95": round(s["p95"], 4), "bytes": s["bytes"], "retries": s["retries"]}
+        for phase, s in harvester.metrics.summary().items()
+    }
+    counters = {name: value for (name, labels), value in harvester.metrics.counters.items() if not labels}
+    return {
+        "mods": len(mod_ids),
+        "ok": len(done),
+        "seconds": round(elapsed, 3),
+        "mods_per_min": round(len(done) / max(elapsed / 60, 1e-9), 2),
+        "peak_rss_mb": round(memory.peak / 2**20, 1),
+        "requests": site.requests - requests_before,
+        "phases": phases,
+        "counters": counters,
+    }
+
+
+def compare(old, new):
+    # prints what got faster and what got slower. positive means better.
+    print(f"\ncomparing {old.get('commit') or '?'} -> {new.get('commit') or '?'}")
+    # lean vs full is the comparison, not a different setup
+    if {k: v for k, v in old.get("config", {}).items() if k != "lean"} != {k: v for k, v in new.get("config", {}).items() if k != "lean"}:
+        print("warning: different bench settings, numbers may not be comparable.")
+    for mode, result in new["results"].items():
+        before = old.get("results", {}).get(mode)
+        if not before:
+            continue
+        change = (result["mods_per_min"] - before["mods_per_min"]) / max(before["mods_per_min"], 1e-9) * 100
+        print(f"{mode}: {before['mods_per_min']:.1f} -> {result['mods_per_min']:.1f} mods/min ({change:+.1f}%), "
+              f"rss {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        for phase, stats in sorted(result["phases"].items()):
+            # "page load (lean)" lines up with "page load (full)"
+            old_stats = before["phases"].get(phase) or before["phases"].get(phase.replace("(lean)", "(full)")) or before["phases"].get(phase.replace("(full)", "(lean)"))
+            if old_stats:
+                print(f"    {phase:<16} p50 {old_stats['p50']:.3f}s -> {stats['p50']:.3f}s   p95 {old_stats['p95']:.3f}s -> {stats['p95']:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks the harvester against a fake smods on localhost.")
+    parser.add_argument('--engine', choices=["browser", "http"], default="http", help="which engine to measure")
+    parser.add_argument('--modes', default=",".join(MODES), help=f"comma separated, any of {', '.join(MODES)}")
+    parser.add_argument('--mods', type=int, default=10, help="mods per batch/parallel run")
+    parser.add_argument('-w', '--workers', type=int, default=4, help="workers for the parallel run")
+    parser.add_argument('--size-mb', type=float, default=1.0, help="size of every fake zip")
+    parser.add_argument('--countdown', type=int, default=0, help="seconds on the fake modsbase timer")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument('--bandwidth-mb', type=float, help="cap each transfer at this many MB/s")
+    parser.add_argument('--popups', action='store_true', help="open a spam tab on the first click of every page")
+    parser.add_argument('-p', '--profile', type=str, help="firefox profile path (browser engine)")
+    parser.add_argument('--lean', action='store_true', help="browser engine: run firefox in lean mode. compare against a run without it.")
+    parser.add_argument('--rate', type=float, default=0, help="per-host request rate, like the harvester's --rate. off by default, it's localhost.")
+    parser.add_argument('--show', action='store_true', help="browser engine: show the window")
+    parser.add_argument('--out', type=str, help="write results as json here")
+    parser.add_argument('--compare', type=str, help="json from an earlier run to compare against")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the harvester's log")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    config = {
+        "engine": args.engine, "mods": args.mods, "workers": args.workers, "size_mb": args.size_mb,
+        "countdown": args.countdown, "latency": args.latency, "bandwidth_mb": args.bandwidth_mb, "popups": args.popups,
+        "lean": args.lean, "rate": args.rate,
+    }
+    bandwidth = args.bandwidth_mb * 2**20 if args.bandwidth_mb else None
+    mod_ids = [str(1000000000 + i) for i in range(args.mods)]
+    results = {}
+    workdir = Path(tempfile.mkdtemp(prefix="mod_harvester_bench_"))
+    try:
+        with FakeSite(int(args.size_mb * 2**20), args.countdown, args.latency, bandwidth, args.popups) as site:
+            print(f"fake site on {site.base_url}, mirror on {site.mirror_url}")
+            for mode in modes:
+                try:
+                    results[mode] = run_mode(mode, site, mod_ids, workdir, args.engine, args.workers, not args.show, args.profile, args.lean, args.rate)
+                except HarvesterError as e:
+                    print(f"error: {mode} run could not start: {e}", flush=True)
+                    sys.exit(1)
+                r = results[mode]
+                print(f"{mode}: {r['ok']}/{r['mods']} mods in {r['seconds']:.1f}s, {r['mods_per_min']:.1f} mods/min, "
+                      f"peak rss {r['peak_rss_mb']} MB, {r['requests']} requests")
+                for phase, s in sorted(r["phases"].items(), key=lambda item: -item[1]["p50"]):
+                    print(f"    {phase:<16} n={s['count']:<4} p50={s['p50']:.3f}s p95={s['p95']:.3f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"commit": git_commit(), "when": time.time(), "python": platform.python_version(), "config": config, "results": results}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# filename: download_tracker.py
+# knows which file in the download folder belongs to which mod, and how it's doing.
+# one scandir per poll, and only tracked files get looked at. hundreds of old zips cost nothing.
+import os
+import time
+import logging
+
+# what browsers call a file while they're still writing it
+TEMP_SUFFIXES = (".part", ".crdownload", ".partial")
+# what a finished download looks like. everything else in the folder is somebody else's.
+ARCHIVE_SUFFIXES = (".zip",)
+
+
+def looks_like_download(entry):
+    # a zip or a browser's temp file for one. no dotfiles (index, locks, job store, .runs),
+    # no folders (extraction), no .corrupt leftovers.
+    if entry.name.startswith(".") or not entry.is_file():
+        return False
+    return entry.name.endswith(ARCHIVE_SUFFIXES) or entry.name.endswith(TEMP_SUFFIXES)
+
+
+def final_name(name):
+    for suffix in TEMP_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class Download:
+    def __init__(self, mod_id, name):
+        self.mod_id = mod_id
+        self.name = name
+        self.started = time.monotonic()
+        self.last_growth = self.started
+        self.size = 0
+        self.finished = None
+        self.stalled = False
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def rate(self, now=None):
+        elapsed = (self.finished or now or time.monotonic()) - self.started
+        return self.size / max(elapsed, 1e-6)
+
+
+def human_rate(bytes_per_sec):
+    for unit in ("B", "KB", "MB", "GB"):
+        if bytes_per_sec < 1024:
+            return f"{bytes_per_sec:.1f} {unit}/s"
+        bytes_per_sec /= 1024
+    return f"{bytes_per_sec:.1f} TB/s"
+
+
+class DownloadTracker:
+    def __init__(self, folder, stall_after=120, poll_interval=1.0, report_every=10, on_complete=None, metrics=None):
+        self.folder = folder
+        # transfers get recorded here if it's set
+        self.metrics = metrics
+        # called with (mod_id, archive name) the moment a file finishes
+        self.on_complete = on_complete
+        self.stall_after = stall_after
+        self.poll_interval = poll_interval
+        self.report_every = report_every
+        self.downloads = {}  # archive name -> Download
+        self.last_report = 0
+
+    def listing(self):
+        with os.scandir(self.folder) as entries:
+            return {entry.name: entry for entry in entries}
+
+    def snapshot(self):
+        # names that existed before a click. anything new after it belongs to that click.
+        return set(self.listing())
+
+    def claim(self, mod_id, before):
+        # returns the archive name this mod just produced, or None if nothing showed up yet
+        entries = self.listing()
+        for name in sorted(set(entries) - before):
+            if not looks_like_download(entries[name]):
+                continue
+            archive = final_name(name)
+            previous = self.downloads.get(archive)
+            if previous and not previous.done and not previous.stalled:
+                continue
+            # a finished or dead one under the same name is an earlier try (e.g. quarantined as corrupt). this is the retry.
+            self.downloads[archive] = Download(mod_id, archive)
+            logging.info(f"{mod_id}: download started as {archive}")
+            return archive
+        return None
+
+    def pending(self):
+        return [d for d in self.downloads.values() if not d.done]
+
+    def is_done(self, name):
+        download = self.downloads.get(name)
+        return download is None or download.done
+
+    def poll(self):
+        entries = self.listing()
+        now = time.monotonic()
+        for download in self.pending():
+            temp = next((entries[download.name + s] for s in TEMP_SUFFIXES if download.name + s in entries), None)
+            final = entries.get(download.name)
+            current = temp or final
+            try:
+                size = current.stat().st_size if current else 0
+            except FileNotFoundError:
+                # renamed between scandir and stat. catch it next poll.
+                continue
+            if size > download.size:
+                download.size = size
+                download.last_growth = now
+                if download.stalled:
+                    logging.info(f"{download.mod_id}: {download.name} is moving again.")
+                download.stalled = False
+
+            if temp is None and final is not None and size > 0:
+                self.complete(download, now)
+            elif not download.stalled and now - download.last_growth > self.stall_after:
+                download.stalled = True
+                logging.warning(f"{download.mod_id}: {download.name} stalled at {size} bytes. nothing for {self.stall_after:.0f}s.")
+
+        if self.report_every and now - self.last_report >= self.report_every:
+            self.last_report = now
+            active = self.pending()
+            if active:
+                total = sum(d.rate(now) for d in active if not d.stalled)
+                logging.info(f"{len(active)} downloads active, {human_rate(total)} total.")
+
+    def complete(self, download, now=None):
+        download.finished = now or time.monotonic()
+        took = download.finished - download.started
+        logging.info(f"{download.mod_id}: {download.name} done, {download.size} bytes in {took:.1f}s ({human_rate(download.rate())})")
+        if self.metrics:
+            self.metrics.observe("transfer", took, mod_id=download.mod_id, nbytes=download.size)
+        if self.on_complete:
+            self.on_complete(download.mod_id, download.name)
+
+    def finish(self, name):
+        # somebody else finished this one (e.g. resumed over http). take their word for it.
+        download = self.downloads[name]
+        download.size = (self.folder / name).stat().st_size
+        download.stalled = False
+        self.complete(download)
+
+    def wait(self):
+        # returns once everything is done or whatever is left has stalled for good
+        while True:
+            self.poll()
+            active = self.pending()
+            if not active or all(d.stalled for d in active):
+                return [d.name for d in active]
+            time.sleep(self.poll_interval)
@@ -0,0 +1,224 @@
+# filename: endpoints.py
+# a game's smods subdomain is not the only place its mods are. catalogue.smods.ru has them too.
+# this probes the candidates, remembers how fast and alive they were for a while, sends each
+# mod to the best one, and stops sending anything to a host that keeps failing (circuit breaker).
+import json
+import time
+import logging
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from preset_registry import PRESETS, DEFAULT_BASE_URL, clean_base_url
+from resolution_cache import CACHE_DIR
+from retry import ModFailure, SITE_DOWN, SITE_DOWN_PATTERNS
+from throttle import page_title
+
+DEFAULT_HEALTH_PATH = CACHE_DIR / "endpoints.json"
+# how long a probe result is trusted
+DEFAULT_HEALTH_TTL = 600
+DEFAULT_PROBE_TIMEOUT = 5
+# this many failures in a row and the host is left alone for the cooldown
+DEFAULT_BREAK_AFTER = 3
+DEFAULT_COOLDOWN = 120
+# the game's own site wins unless another one is this many times faster
+PREFER_PRIMARY = 2.0
+# only the first bit of the front page. enough to see an error page.
+PROBE_BYTES = 1 << 15
+
+
+def host_of(url):
+    return urlparse(url).netloc
+
+
+class Endpoint:
+    # one site's health. closed circuit = use it, open = don't, half-open = one try allowed.
+    def __init__(self, url):
+        self.url = url
+        self.ok = None
+        self.latency = None
+        self.checked_at = 0
+        self.failures = 0
+        self.open_until = 0
+        self.cooldown = DEFAULT_COOLDOWN
+
+    def state(self, now):
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+
+class EndpointManager:
+    def __init__(self, path=DEFAULT_HEALTH_PATH, ttl=DEFAULT_HEALTH_TTL, timeout=DEFAULT_PROBE_TIMEOUT, break_after=DEFAULT_BREAK_AFTER, cooldown=DEFAULT_COOLDOWN, metrics=None, opener=None, throttle=None):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.break_after = break_after
+        self.cooldown = cooldown
+        self.metrics = metrics
+        self.opener = opener or urllib.request.build_opener()
+        # probes are requests to the host like any other. they wait their turn and count towards its limits.
+        self.throttle = throttle
+        self.endpoints = {}   # base url -> Endpoint
+        self.lock = threading.Lock()
+        # one round of probes at a time. workers that show up meanwhile use its results.
+        self.probing = threading.Lock()
+        self.load()
+
+    def endpoint(self, url):
+        with self.lock:
+            if url not in self.endpoints:
+                self.endpoints[url] = Endpoint(url)
+                self.endpoints[url].cooldown = self.cooldown
+            return self.endpoints[url]
+
+    def load(self):
+        # probe results from earlier runs. circuits always start closed.
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+            for url, health in saved.items():
+                endpoint = self.endpoint(url)
+                endpoint.ok, endpoint.latency, endpoint.checked_at = health["ok"], health["latency"], health["checked_at"]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning(f"endpoint health file is broken ({e}). probing from scratch.")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            saved = {url: {"ok": e.ok, "latency": e.latency, "checked_at": e.checked_at} for url, e in self.endpoints.items() if e.checked_at}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + f".{threading.get_ident()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(saved, f, indent=2)
+            tmp.replace(self.path)
+        except OSError as e:
+            logging.warning(f"could not save endpoint health: {e}")
+
+    def candidates(self, base_url):
+        # the site itself, mirrors its preset lists, and the catalogue if it's an smods site.
+        # anything else (-u pointing somewhere odd) only ever gets itself.
+        base_url = clean_base_url(base_url)
+        found = [base_url]
+        preset = PRESETS.for_base_url(base_url) or {}
+        found += [clean_base_url(m) for m in preset.get("mirrors") or []]
+        if host_of(base_url).endswith("smods.ru"):
+            found.append(DEFAULT_BASE_URL)
+        return list(dict.fromkeys(found))
+
+    def probe(self, url):
+        # front page, timed. anything that loads and doesn't look like an error page counts.
+        endpoint = self.endpoint(url)
+        if self.throttle:
+            # the wait for a slot doesn't count as latency
+            with self.throttle.slot(url):
+                ok, latency, status, title = self.fetch_front(url)
+            if status is not None or title is not None:
+                self.throttle.report(url, status=status, title=title)
+        else:
+            ok, latency, _, _ = self.fetch_front(url)
+        with self.lock:
+            endpoint.ok, endpoint.latency, endpoint.checked_at = ok, latency, time.time()
+        if ok:
+            self.close_circuit(endpoint)
+        elif endpoint.open_until:
+            # the half-open try didn't work out either
+            with self.lock:
+                endpoint.cooldown = min(endpoint.cooldown * 2, 3600)
+                endpoint.open_until = time.time() + endpoint.cooldown
+        logging.info(f"probe: {host_of(url)} {'up' if ok else 'DOWN'} in {latency:.2f}s")
+        if self.metrics:
+            self.metrics.gauge("endpoint_up", int(ok), host=host_of(url))
+            self.metrics.gauge("endpoint_latency_seconds", round(latency, 4), host=host_of(url))
+        return endpoint
+
+    def fetch_front(self, url):
+        # (ok, seconds, http status, page title). status and title are None if nothing answered.
+        started = time.monotonic()
+        ok, status, title = False, None, None
+        try:
+            request = urllib.request.Request(url + "/", headers={"User-Agent": "Mozilla/5.0"})
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status = response.status
+                body = response.read(PROBE_BYTES).decode("utf-8", errors="replace")
+            title = page_title(body)
+            ok = not SITE_DOWN_PATTERNS.search(body)
+        except urllib.error.HTTPError as e:
+            # a 404 on the front page is still a site that answers
+            status = e.code
+            ok = e.code < 500 and e.code != 429
+        except (urllib.error.URLError, OSError) as e:
+            logging.info(f"probe: {host_of(url)} unreachable ({e})")
+        return ok, time.monotonic() - started, status, title
+
+    def choose(self, base_url):
+        # the endpoint this mod should go to. raises a site-down failure if every circuit is open.
+        candidates = self.candidates(base_url)
+        now = time.time()
+        usable = [self.endpoint(url) for url in candidates if self.endpoint(url).state(now) != "open"]
+        if not usable:
+            raise ModFailure(SITE_DOWN, f"{', '.join(host_of(u) for u in candidates)} failed too often. not trying for now.")
+        if len(candidates) == 1:
+            # nothing to choose between. the circuit breaker is all we need.
+            return usable[0].url
+
+        with self.probing:
+            now = time.time()
+            stale = [e for e in usable if e.checked_at + self.ttl < now or e.state(now) == "half-open"]
+            if stale:
+                with ThreadPoolExecutor(max_workers=len(stale), thread_name_prefix="probe") as pool:
+                    list(pool.map(lambda e: self.probe(e.url), stale))
+                self.save()
+        usable = [e for e in usable if e.state(time.time()) != "open"]
+        if not usable:
+            raise ModFailure(SITE_DOWN, f"{', '.join(host_of(u) for u in candidates)} failed too often. not trying for now.")
+        alive = [e for e in usable if e.ok]
+        if not alive:
+            # the probes say nothing is up. try the site itself anyway, the probe may be wrong.
+            return usable[0].url
+        best = min(alive, key=lambda e: e.latency)
+        primary = self.endpoint(candidates[0])
+        if primary in alive and primary.latency <= best.latency * PREFER_PRIMARY:
+            best = primary
+        if best.url != candidates[0]:
+            if self.metrics:
+                self.metrics.count("endpoint_failovers", host=host_of(candidates[0]))
+            logging.info(f"using {host_of(best.url)} instead of {host_of(candidates[0])} ({best.latency:.2f}s)")
+        return best.url
+
+    def succeeded(self, url):
+        self.close_circuit(self.endpoint(url))
+
+    def failed(self, url):
+        # a mod failed in a way that smells like the host. enough of those open the circuit.
+        endpoint = self.endpoint(url)
+        with self.lock:
+            endpoint.failures += 1
+            half_open = endpoint.state(time.time()) == "half-open"
+            trip = half_open or endpoint.failures >= self.break_after
+            if trip:
+                if half_open:
+                    # still broken after the cooldown. wait longer next time.
+                    endpoint.cooldown = min(endpoint.cooldown * 2, 3600)
+                endpoint.open_until = time.time() + endpoint.cooldown
+                # the next probe has to happen before anyone believes it's fine again
+                endpoint.ok = False
+        if trip:
+            logging.warning(f"{host_of(url)} failed {endpoint.failures} times. leaving it alone for {endpoint.cooldown:.0f}s.")
+            if self.metrics:
+                self.metrics.count("circuit_opened", host=host_of(url))
+                self.metrics.gauge("endpoint_up", 0, host=host_of(url))
+
+    def close_circuit(self, endpoint):
+        with self.lock:
+            if endpoint.open_until:
+                logging.info(f"{host_of(endpoint.url)} is back.")
+            endpoint.failures = 0
+            endpoint.open_until = 0
+            endpoint.cooldown = self.cooldown
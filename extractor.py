@@ -0,0 +1,170 @@
+# filename: extractor.py
+# unzips archives as soon as they land, each mod into its own folder, several at once.
+# checks crcs while extracting and refuses zips that try to write outside their folder.
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import zipfile
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from filelinks import materialize_tree
+
+MARKER_NAME = ".extracted.json"
+# half-extracted mods live here until they're complete. a dotted folder, so the download tracker leaves it alone.
+STAGING_NAME = ".staging"
+DEFAULT_EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class UnsafeArchiveError(Exception):
+    # somebody put "../../etc/passwd" in a mod zip. no.
+    pass
+
+
+def archive_fingerprint(zf):
+    # name + crc + size of every entry, straight from the central directory. no decompression.
+    digest = hashlib.sha256()
+    for info in zf.infolist():
+        digest.update(f"{info.filename}\0{info.CRC}\0{info.file_size}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+def safe_target(root, member_name):
+    target = (root / member_name).resolve()
+    if target != root and root not in target.parents:
+        raise UnsafeArchiveError(f"entry '{member_name}' would land outside {root}")
+    return target
+
+
+def is_current(target_dir, fingerprint):
+    try:
+        with open(Path(target_dir) / MARKER_NAME, "r") as f:
+            return json.load(f).get("fingerprint") == fingerprint
+    except (OSError, ValueError):
+        return False
+
+
+def extract_archive(archive_path, target_dir, skip_current=True, tree_root=None, link="auto"):
+    # runs in a worker process. returns a dict because exceptions across processes are a pain to read.
+    # with tree_root, each archive gets extracted once into tree_root/<fingerprint> and linked from there.
+    started = time.monotonic()
+    archive_path = Path(archive_path)
+    target_dir = Path(target_dir).resolve()
+    with zipfile.ZipFile(archive_path, "r") as zf:
+        fingerprint = archive_fingerprint(zf)
+        if skip_current and is_current(target_dir, fingerprint):
+            return {"archive": archive_path.name, "status": "skipped", "files": 0, "bytes": 0, "seconds": time.monotonic() - started}
+
+        if tree_root:
+            tree = Path(tree_root) / fingerprint
+            written = 0
+            if not is_current(tree, fingerprint):
+                written = extract_archive(archive_path, tree)["bytes"]
+            counts = materialize_tree(tree, target_dir, link)
+            # the marker counts as a file too. it isn't one of the mod's.
+            return {"archive": archive_path.name, "status": "linked", "files": sum(counts.values()) - 1, "bytes": written, "seconds": time.monotonic() - started}
+
+        # extract next to the target, swap it in at the end. a bad crc never leaves half a mod behind.
+        staging = target_dir.parent / STAGING_NAME / target_dir.name
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        root = staging.resolve()
+        files = 0
+        total = 0
+        try:
+            for info in zf.infolist():
+                destination = safe_target(root, info.filename)
+                if info.is_dir():
+                    destination.mkdir(parents=True, exist_ok=True)
+                    continue
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                # zipfile checks the crc when the member is read to the end
+                with zf.open(info) as src, open(destination, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                files += 1
+                total += info.file_size
+            with open(root / MARKER_NAME, "w") as f:
+                json.dump({"archive": archive_path.name, "fingerprint": fingerprint}, f)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    if target_dir.exists():
+        shutil.rmtree(target_dir)
+    staging.replace(target_dir)
+    return {"archive": archive_path.name, "status": "extracted", "files": files, "bytes": total, "seconds": time.monotonic() - started}
+
+
+class ExtractionPipeline:
+    def __init__(self, output_folder, workers=DEFAULT_EXTRACT_WORKERS, skip_current=True, metrics=None, tree_root=None, link="auto", on_done=None):
+        self.output_folder = Path(output_folder)
+        # called with (mod id, result) once an archive is dealt with
+        self.on_done = on_done
+        # shared extracted copies (see archive_store). None extracts into every folder separately.
+        self.tree_root = str(tree_root) if tree_root else None
+        self.link = link
+        self.metrics = metrics
+        self.skip_current = skip_current
+        self.pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        self.jobs = {}  # mod id -> future, while it's being extracted
+        self.results = {}
+        # batch workers submit from their own threads
+        self.lock = threading.Lock()
+
+    def submit(self, mod_id, archive_path):
+        # a mod downloaded again later in the run gets extracted again. only one at a time though.
+        with self.lock:
+            running = self.jobs.get(mod_id)
+            if running and not running.done():
+                return running
+            target = self.output_folder / str(mod_id)
+            logging.info(f"queued extraction: {Path(archive_path).name} -> {target.name}/")
+            future = self.pool.submit(extract_archive, str(archive_path), str(target), self.skip_current, self.tree_root, self.link)
+            future.queued_at = time.monotonic()
+            self.jobs[mod_id] = future
+        future.add_done_callback(lambda f, mod_id=mod_id: self.finished(mod_id, f))
+        return future
+
+    def finished(self, mod_id, future):
+        try:
+            result = future.result()
+        except zipfile.BadZipFile as e:
+            result = {"status": "failed", "error": f"bad zip: {e}"}
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        with self.lock:
+            if self.jobs.get(mod_id) is future:
+                self.jobs.pop(mod_id)
+            self.results[mod_id] = result
+        if self.metrics:
+            # failures don't report their own time. queue time is close enough for those.
+            seconds = result.get("seconds", time.monotonic() - future.queued_at)
+            self.metrics.observe("extraction", seconds, mod_id=mod_id, nbytes=result.get("bytes"), ok=result["status"] != "failed")
+        if result["status"] == "failed":
+            logging.error(f"failed to extract {mod_id}: {result['error']}")
+        elif result["status"] == "skipped":
+            logging.info(f"{mod_id}: already extracted and unchanged. skipped.")
+        elif result["status"] == "linked":
+            logging.info(f"linked {result['archive']} -> {mod_id}/ ({result['files']} files from the store)")
+        else:
+            logging.info(f"extracted {result['archive']} -> {mod_id}/ ({result['files']} files)")
+        if self.on_done:
+            self.on_done(mod_id, result)
+
+    def close(self):
+        # waits for the stragglers and says how it went
+        self.pool.shutdown(wait=True)
+        counts = {}
+        for result in self.results.values():
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        if not self.results:
+            logging.info("no new files extracted.")
+        else:
+            summary = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+            logging.info(f"extraction done: {summary}.")
+        return self.results
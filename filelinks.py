@@ -0,0 +1,71 @@
+# filename: filelinks.py
+# puts a file (or a whole folder) somewhere else without copying it, if the filesystem lets us.
+# reflinks are copy-on-write. hardlinks are the same file, so don't edit those in place.
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # windows. no reflinks, hardlinks and copies still work.
+    fcntl = None
+
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")
+# linux's "make this file share blocks with that one". btrfs, xfs, bcachefs.
+FICLONE = 0x40049409
+
+
+def reflink(source, target):
+    if fcntl is None:
+        raise OSError("reflinks need fcntl")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(target)
+            raise
+
+
+def materialize(source, target, mode="auto"):
+    # puts source at target the cheapest way the filesystem allows. returns how.
+    # reflinks are copy-on-write, hardlinks are the same file: don't edit those in place.
+    target = Path(target)
+    tmp = target.with_name(target.name + ".linking")
+    if tmp.exists():
+        tmp.unlink()
+    attempts = {"auto": ("reflink", "hardlink", "copy"), "reflink": ("reflink", "copy"), "hardlink": ("hardlink", "copy"), "copy": ("copy",)}[mode]
+    for how in attempts:
+        try:
+            if how == "reflink":
+                reflink(source, tmp)
+            elif how == "hardlink":
+                os.link(source, tmp)
+            else:
+                shutil.copyfile(source, tmp)
+        except OSError:
+            continue
+        tmp.replace(target)
+        return how
+    raise OSError(f"could not put {source} at {target}")
+
+
+def materialize_tree(source, target, mode="auto"):
+    # same thing for a whole folder. files get linked, folders get made.
+    source = Path(source)
+    target = Path(target)
+    staging = target.with_name(target.name + ".linking")
+    if staging.exists():
+        shutil.rmtree(staging)
+    counts = {}
+    for root, dirs, files in os.walk(source):
+        relative = Path(root).relative_to(source)
+        (staging / relative).mkdir(parents=True, exist_ok=True)
+        for name in files:
+            how = materialize(Path(root) / name, staging / relative / name, mode)
+            counts[how] = counts.get(how, 0) + 1
+    if target.exists():
+        shutil.rmtree(target)
+    staging.replace(target)
+    return counts
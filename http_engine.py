@@ -0,0 +1,301 @@
+# filename: http_engine.py
+# same dance as the browser, minus the browser. search -> article -> modsbase -> zip.
+# if a page looks weird, it raises EngineError and the harvester goes back to firefox.
+import re
+import time
+import logging
+import http.cookiejar
+import urllib.request
+import urllib.error
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin, urlencode, urlparse
+
+from resumable import RangeDownloader, ResumeError, filename_from, total_size, PARTIAL_SUFFIX
+from throttle import page_title
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+# modsbase makes you stare at a countdown. the server checks it, so we stare too.
+COUNTDOWN_PATTERN = re.compile(r'id=["\']countdown["\'][^>]*>(?:\s*<[^>]+>)*\s*(\d+)', re.IGNORECASE)
+
+
+class EngineError(Exception):
+    # the page didn't look like i expected. not fatal, just use the browser.
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class PageParser(HTMLParser):
+    # grabs the only things i care about: links and forms.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.anchors = []
+        self.forms = []
+        self._article_depth = 0
+        self._anchor = None
+        self._form = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: (v or "") for k, v in attrs}
+        if tag == "article":
+            self._article_depth += 1
+        elif tag == "a":
+            self._anchor = {
+                "href": attrs.get("href", ""),
+                "classes": attrs.get("class", "").split(),
+                "in_article": self._article_depth > 0,
+                "text": "",
+            }
+        elif tag == "form":
+            self._form = {
+                "action": attrs.get("action", ""),
+                "method": attrs.get("method", "get").lower(),
+                "fields": {},
+                "ids": set(),
+                "submit": None,
+            }
+        elif tag in ("input", "button", "select", "textarea") and self._form is not None:
+            if attrs.get("id"):
+                self._form["ids"].add(attrs["id"])
+            name = attrs.get("name")
+            kind = attrs.get("type", "submit" if tag == "button" else "text").lower()
+            if kind in ("submit", "button", "image"):
+                # only the button i actually "click" gets submitted
+                if attrs.get("id") == "downloadbtn" and name:
+                    self._form["submit"] = (name, attrs.get("value", ""))
+            elif name:
+                self._form["fields"][name] = attrs.get("value", "")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == "a":
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "article" and self._article_depth:
+            self._article_depth -= 1
+        elif tag == "a" and self._anchor is not None:
+            self._anchor["text"] = " ".join(self._anchor["text"].split())
+            self.anchors.append(self._anchor)
+            self._anchor = None
+        elif tag == "form" and self._form is not None:
+            self.forms.append(self._form)
+            self._form = None
+
+    def handle_data(self, data):
+        if self._anchor is not None:
+            self._anchor["text"] += data
+
+
+def parse_page(html):
+    parser = PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+class HttpEngine:
+    def __init__(self, base_url, download_folder, mirror_domain="modsbase.com", timeout=30, honor_countdown=True, chunk_size=1 << 16, cache=None, segments=1, throttle=None):
+        self.base_url = base_url.rstrip("/")
+        self.download_folder = Path(download_folder)
+        self.mirror_domain = mirror_domain
+        self.timeout = timeout
+        self.honor_countdown = honor_countdown
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.segments = segments
+        # archive name -> size the server announced. the verifier holds the file to it.
+        self.expected = {}
+        # per-host rate limits shared with everything else in the run. None means no limits.
+        self.throttle = throttle
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.opener.addheaders = [("User-Agent", USER_AGENT)]
+
+    def open(self, url, data=None, referer=None):
+        if not self.throttle:
+            return self.request(url, data, referer)
+        with self.throttle.slot(url):
+            try:
+                response = self.request(url, data, referer)
+            except EngineError as e:
+                self.throttle.report(url, status=e.status)
+                raise
+        if response.headers.get_content_type() != "text/html":
+            # pages get reported in read_page, with their title
+            self.throttle.report(url, status=response.status)
+        return response
+
+    def request(self, url, data=None, referer=None):
+        request = urllib.request.Request(url, data=data)
+        if referer:
+            request.add_header("Referer", referer)
+        try:
+            return self.opener.open(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise EngineError(f"http {e.code} for {url}", status=e.code) from e
+        except (urllib.error.URLError, OSError) as e:
+            raise EngineError(f"could not reach {url}: {e}") from e
+
+    def read_page(self, response):
+        charset = response.headers.get_content_charset() or "utf-8"
+        url, html = response.geturl(), response.read().decode(charset, errors="replace")
+        if self.throttle and self.throttle.report(url, title=page_title(html)):
+            # a captcha page. the retry later counts it as the site pushing back.
+            raise EngineError(f"{url} wants a captcha", status=429)
+        return url, html
+
+    def get_page(self, url, referer=None):
+        with self.open(url, referer=referer) as response:
+            return self.read_page(response)
+
+    def find_mod_page(self, mod_id):
+        search_url = f"{self.base_url}/?s={mod_id}"
+        logging.info(f"[http] searching: {search_url}")
+        page_url, html = self.get_page(search_url)
+        for anchor in parse_page(html).anchors:
+            if anchor["in_article"] and anchor["href"]:
+                return urljoin(page_url, anchor["href"])
+        raise EngineError(f"no search result for {mod_id}")
+
+    def find_mirror_link(self, mod_page_url):
+        page_url, html = self.get_page(mod_page_url)
+        anchors = [a for a in parse_page(html).anchors if a["href"]]
+        # same order of desperation as the browser version
+        for check in (
+            lambda a: self.mirror_domain in a["href"],
+            lambda a: "skymods-excerpt-btn" in a["classes"],
+            lambda a: "Download" in a["text"],
+        ):
+            for anchor in anchors:
+                if check(anchor):
+                    return urljoin(page_url, anchor["href"])
+        raise EngineError(f"no download link on {mod_page_url}")
+
+    def wait_countdown(self, html):
+        match = COUNTDOWN_PATTERN.search(html)
+        if match and self.honor_countdown and int(match.group(1)) > 0:
+            # a countdown that already says 0 costs nothing. every form hop has one.
+            seconds = int(match.group(1))
+            logging.info(f"[http] countdown says {seconds}s. waiting like a good citizen.")
+            time.sleep(seconds + 0.5)
+
+    def resolve(self, mirror_url):
+        # modsbase pages are a form or two, then a link. returns (zip url, referer, response).
+        # response is only set when a form handed us the file directly instead of a link.
+        referer = None
+        response = self.open(mirror_url)
+        for _ in range(4):
+            if "html" not in response.headers.get_content_type():
+                return response.geturl(), referer, response
+            with response:
+                page_url, html = self.read_page(response)
+            parsed = parse_page(html)
+
+            for anchor in parsed.anchors:
+                href = anchor["href"]
+                if ".zip" in anchor["text"] or urlparse(href).path.lower().endswith(".zip"):
+                    zip_url = urljoin(page_url, href)
+                    logging.info(f"[http] found final link: {zip_url}")
+                    return zip_url, page_url, None
+
+            form = next((f for f in parsed.forms if "downloadbtn" in f["ids"]), None)
+            if not form:
+                raise EngineError(f"no download form or zip link on {page_url}")
+
+            self.wait_countdown(html)
+            fields = dict(form["fields"])
+            if form["submit"]:
+                fields[form["submit"][0]] = form["submit"][1]
+            action = urljoin(page_url, form["action"] or page_url)
+            logging.info(f"[http] submitting download form to {action}")
+            if form["method"] == "post":
+                response = self.open(action, data=urlencode(fields).encode(), referer=page_url)
+            else:
+                sep = "&" if "?" in action else "?"
+                response = self.open(f"{action}{sep}{urlencode(fields)}", referer=page_url)
+            referer = page_url
+        raise EngineError(f"gave up after too many forms on {mirror_url} (last: {referer})")
+
+    def save(self, resolved):
+        zip_url, referer, response = resolved
+        if response is None:
+            # a real link. ranges, resume, maybe segments.
+            downloader = RangeDownloader(self.download_folder, opener=self.opener, timeout=self.timeout, chunk_size=self.chunk_size, segments=self.segments, throttle=self.throttle)
+            try:
+                path = downloader.download(zip_url, referer=referer)
+            except ResumeError as e:
+                raise EngineError(str(e), status=e.status) from e
+            self.expected.update(downloader.expected)
+            return path
+
+        with response:
+            name = filename_from(response)
+            if not name:
+                raise EngineError("server didn't say what the file is called")
+            total = total_size(response)
+            target = self.download_folder / name
+            part = target.with_name(name + PARTIAL_SUFFIX)
+            self.download_folder.mkdir(parents=True, exist_ok=True)
+            written = 0
+            with open(part, "wb") as f:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        if total is not None and written != total:
+            # the connection died halfway and nobody said so
+            raise EngineError(f"{name} stopped at {written} of {total} bytes")
+        part.replace(target)
+        if total is not None:
+            self.expected[name] = total
+        return target
+
+    def fetch_cached(self, mod_id, entry):
+        # skip the search. straight to modsbase if we know it, else the article.
+        if entry.get("modsbase_url"):
+            logging.info(f"[http] cache hit for {mod_id}: {entry['modsbase_url']}")
+            return self.resolve(entry["modsbase_url"]), None
+        logging.info(f"[http] cache hit for {mod_id}: {entry['article_url']}")
+        mirror_url = self.find_mirror_link(entry["article_url"])
+        return self.resolve(mirror_url), mirror_url
+
+    def locate(self, mod_id):
+        # everything up to the zip. returns what save() needs.
+        entry = self.cache.get(self.base_url, mod_id) if self.cache else None
+        response = None
+        if entry:
+            try:
+                response, mirror_url = self.fetch_cached(mod_id, entry)
+                if mirror_url:
+                    self.cache.remember(self.base_url, mod_id, modsbase_url=mirror_url)
+            except EngineError as e:
+                if e.status not in (404, 410):
+                    raise
+                logging.info(f"[http] cached page for {mod_id} is gone. forgetting it.")
+                self.cache.invalidate(self.base_url, mod_id)
+
+        if response is None:
+            mod_page = self.find_mod_page(mod_id)
+            logging.info(f"[http] found mod page: {mod_page}")
+            mirror_url = self.find_mirror_link(mod_page)
+            logging.info(f"[http] found mirror link: {mirror_url}")
+            if self.cache:
+                self.cache.remember(self.base_url, mod_id, article_url=mod_page, modsbase_url=mirror_url)
+            response = self.resolve(mirror_url)
+        return response
+
+    def store(self, mod_id, resolved):
+        path = self.save(resolved)
+        size = path.stat().st_size
+        logging.info(f"[http] saved {path.name} ({size} bytes)")
+        if self.cache:
+            self.cache.remember(self.base_url, mod_id, zip_name=path.name, zip_size=size)
+        return path
+
+    def fetch(self, mod_id):
+        return self.store(mod_id, self.locate(mod_id))
@@ -0,0 +1,224 @@
+# filename: job_queue.py
+# a batch's progress on disk instead of in a for loop. every mod is a row that moves
+#   queued -> resolving -> downloading -> downloaded (-> extracted), or -> failed
+# and every move is committed right away. kill the run at mod 350 and --resume starts at 351.
+# sqlite in wal mode, so more than one process can take jobs from the same file.
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+JOBS_NAME = ".jobs.sqlite"
+
+QUEUED = "queued"
+RESOLVING = "resolving"
+DOWNLOADING = "downloading"
+DOWNLOADED = "downloaded"
+EXTRACTED = "extracted"
+FAILED = "failed"
+STATES = (QUEUED, RESOLVING, DOWNLOADING, DOWNLOADED, EXTRACTED, FAILED)
+# somebody is on it
+ACTIVE = (RESOLVING, DOWNLOADING)
+# nothing left to do
+FINISHED = (DOWNLOADED, EXTRACTED, FAILED)
+
+# a job nobody touched for this long belongs to a process that isn't coming back
+DEFAULT_STALE_AFTER = 3600
+# other processes hold the write lock for milliseconds. waiting this long means something's wrong.
+BUSY_TIMEOUT = 30
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def owner_name():
+    # host:pid. threads of one process share it, the store only cares about processes.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobStore:
+    def __init__(self, path, stale_after=DEFAULT_STALE_AFTER):
+        self.path = Path(path)
+        self.stale_after = stale_after
+        self.owner = owner_name()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # autocommit. transactions are explicit, so claims can take the write lock up front.
+        self.db = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    mod_id TEXT PRIMARY KEY,
+                    position INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    base_url TEXT,
+                    owner TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    kind TEXT,
+                    error TEXT,
+                    archive TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, base_url, position)")
+
+    def transaction(self, fn):
+        # BEGIN IMMEDIATE takes the write lock before reading, so two processes can't claim the same row
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.db)
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            return result
+
+    def reset(self, mod_ids, base_url=None):
+        # a fresh run. whatever the last one left behind is forgotten.
+        def reset(db):
+            db.execute("DELETE FROM jobs")
+            self.insert(db, mod_ids, base_url)
+        self.transaction(reset)
+
+    def add(self, mod_ids, base_url=None):
+        # new ids go to the end. ones we already have keep their state.
+        return self.transaction(lambda db: self.insert(db, mod_ids, base_url))
+
+    def insert(self, db, mod_ids, base_url):
+        start = db.execute("SELECT COALESCE(MAX(position), 0) FROM jobs").fetchone()[0]
+        now = time.time()
+        before = db.total_changes
+        db.executemany(
+            "INSERT OR IGNORE INTO jobs (mod_id, position, state, base_url, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [(str(m), start + i + 1, QUEUED, base_url, now) for i, m in enumerate(mod_ids)],
+        )
+        return db.total_changes - before
+
+    def recover(self):
+        # jobs that were being worked on by a process that's gone go back in the queue
+        host = socket.gethostname()
+        now = time.time()
+
+        def recover(db):
+            rows = db.execute(f"SELECT mod_id, owner, updated_at FROM jobs WHERE state IN ({','.join('?' * len(ACTIVE))})", ACTIVE).fetchall()
+            lost = []
+            for mod_id, owner, updated_at in rows:
+                owner_host, _, pid = (owner or "").rpartition(":")
+                if owner_host == host and pid.isdigit():
+                    dead = not process_alive(int(pid))
+                else:
+                    dead = updated_at + self.stale_after < now
+                if dead:
+                    lost.append(mod_id)
+            db.executemany("UPDATE jobs SET state = ?, owner = NULL, not_before = 0, updated_at = ? WHERE mod_id = ?", [(QUEUED, now, m) for m in lost])
+            return lost
+        lost = self.transaction(recover)
+        if lost:
+            logging.info(f"jobs: {len(lost)} mods were in progress when the last run died. they're queued again.")
+        return lost
+
+    def claim(self, base_url=None):
+        # the next queued job, now ours. None if there's nothing to take right now.
+        now = time.time()
+
+        def claim(db):
+            row = db.execute(
+                "SELECT mod_id FROM jobs WHERE state = ? AND not_before <= ? AND (? IS NULL OR base_url = ?) ORDER BY position LIMIT 1",
+                (QUEUED, now, base_url, base_url),
+            ).fetchone()
+            if not row:
+                return None
+            db.execute("UPDATE jobs SET state = ?, owner = ?, attempts = attempts + 1, updated_at = ? WHERE mod_id = ?", (RESOLVING, self.owner, now, row[0]))
+            return row[0]
+        return self.transaction(claim)
+
+    def take(self, mod_id):
+        # claims one particular job (a retry that's due). False if another process got it first.
+        def take(db):
+            cursor = db.execute(
+                "UPDATE jobs SET state = ?, owner = ?, attempts = attempts + 1, updated_at = ? WHERE mod_id = ? AND state = ?",
+                (RESOLVING, self.owner, time.time(), str(mod_id), QUEUED),
+            )
+            return cursor.rowcount == 1
+        return self.transaction(take)
+
+    def move(self, mod_id, state, **fields):
+        # one checkpoint. fields can be base_url, kind, error, archive, not_before.
+        if state not in STATES:
+            raise ValueError(f"unknown job state '{state}'")
+        fields["owner"] = None if state in FINISHED or state == QUEUED else self.owner
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        values = list(fields.values())
+
+        def move(db):
+            db.execute(f"UPDATE jobs SET state = ?, {columns}, updated_at = ? WHERE mod_id = ?", [state] + values + [time.time(), str(mod_id)])
+        self.transaction(move)
+
+    def route(self, routes):
+        # mod id -> base url, for jobs that didn't know their site yet
+        self.transaction(lambda db: db.executemany("UPDATE jobs SET base_url = ? WHERE mod_id = ?", [(b, str(m)) for m, b in routes.items()]))
+
+    def release(self):
+        # end of this process's run. whatever it still holds goes back for the next one.
+        def release(db):
+            return db.execute(
+                f"UPDATE jobs SET state = ?, owner = NULL, updated_at = ? WHERE owner = ? AND state IN ({','.join('?' * len(ACTIVE))})",
+                (QUEUED, time.time(), self.owner) + ACTIVE,
+            ).rowcount
+        return self.transaction(release)
+
+    def ids(self, state, base_url=None):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT mod_id FROM jobs WHERE state = ? AND (? IS NULL OR base_url = ?) ORDER BY position",
+                (state, base_url, base_url),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def sites(self):
+        # base url -> queued job ids. None is the key for jobs nobody routed yet.
+        with self.lock:
+            rows = self.db.execute("SELECT base_url, mod_id FROM jobs WHERE state = ? ORDER BY position", (QUEUED,)).fetchall()
+        sites = {}
+        for base_url, mod_id in rows:
+            sites.setdefault(base_url, []).append(mod_id)
+        return sites
+
+    def archives(self):
+        # mod id -> archive name, for every job that got as far as a finished download
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT mod_id, archive FROM jobs WHERE state IN (?, ?) AND archive IS NOT NULL ORDER BY position",
+                (DOWNLOADED, EXTRACTED),
+            ).fetchall()
+        return dict(rows)
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def state(self, mod_id):
+        with self.lock:
+            row = self.db.execute("SELECT state FROM jobs WHERE mod_id = ?", (str(mod_id),)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,93 @@
+# filename: manifest.py
+# keeps track of what's already in the download folder, so sync mode can skip it.
+# mod id -> archive name, size, sha256, steam's last-updated time.
+import json
+import time
+import hashlib
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # windows. no flock there, so one process per folder.
+    fcntl = None
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def folder_lock(folder):
+    # more than one process can work on a folder (--resume). only one writes the manifest at a time.
+    if fcntl is None:
+        yield
+        return
+    with open(Path(folder) / ".manifest.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Manifest:
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / MANIFEST_NAME
+        self.entries = self.read()
+        # what this instance recorded. save() puts these on top of whatever is on disk by then.
+        self.changed = set()
+
+    def read(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get("mods", {})
+        except (OSError, ValueError) as e:
+            logging.warning(f"manifest is broken ({e}). pretending it's empty.")
+            return {}
+
+    def save(self):
+        # write-then-rename so a crash doesn't leave half a manifest
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with folder_lock(self.folder):
+            entries = self.read()
+            entries.update({m: self.entries[m] for m in self.changed})
+            self.entries = entries
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump({"mods": self.entries}, f, indent=4, sort_keys=True)
+            tmp.replace(self.path)
+
+    def record(self, mod_id, archive_path, steam_updated=None, sha256=None):
+        archive_path = Path(archive_path)
+        self.entries[str(mod_id)] = {
+            "archive": archive_path.name,
+            "size": archive_path.stat().st_size,
+            "sha256": sha256 or file_sha256(archive_path),
+            "steam_updated": steam_updated,
+            "downloaded_at": time.time(),
+        }
+        self.changed.add(str(mod_id))
+
+    def is_current(self, mod_id, steam_updated=None):
+        # current means: we have it, it's the size we wrote down, and steam hasn't updated it since.
+        entry = self.entries.get(str(mod_id))
+        if not entry:
+            return False
+        archive = self.folder / entry["archive"]
+        if not archive.exists() or archive.stat().st_size != entry["size"]:
+            return False
+        if steam_updated and (entry.get("steam_updated") or 0) < steam_updated:
+            return False
+        return True
@@ -0,0 +1,101 @@
+# filename: memory_budget.py
+# firefox grows with every ad-laden page it sees. this is how much it's using (the whole
+# process tree, not just the parent), how many files it has open, and how much all the
+# workers of a run may use together before one of them gets restarted.
+import os
+import threading
+
+DEFAULT_RECYCLE_AFTER = 50
+DEFAULT_MAX_RSS_MB = 1500
+# open files of the main firefox process. leaked tabs and sockets push this up.
+DEFAULT_MAX_HANDLES = 1000
+
+
+def process_rss(pid):
+    # resident memory of a process in bytes. linux only, None elsewhere.
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, TypeError):
+        pass
+    return None
+
+
+def descendants(pid):
+    # every process under pid. firefox likes to spawn a lot of them.
+    parents = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # the name can have spaces and parens in it. ppid is right after the last ')'.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    found, todo = [], [pid]
+    while todo:
+        children = parents.get(todo.pop(), [])
+        found += children
+        todo += children
+    return found
+
+
+def tree_rss(pid):
+    # pid plus its content processes. shared pages get counted twice, so it's on the high side.
+    own = process_rss(pid)
+    if own is None:
+        return None
+    return own + sum(process_rss(child) or 0 for child in descendants(pid))
+
+
+def open_handles(pid):
+    # open file descriptors. None if we can't look.
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+
+
+class MemoryBudget:
+    # shared by the workers of a run. each browser may use its fair share of the total.
+    def __init__(self, total_mb=None, per_browser_mb=DEFAULT_MAX_RSS_MB):
+        self.total = total_mb * 2**20 if total_mb else None
+        self.per_browser = per_browser_mb * 2**20 if per_browser_mb else None
+        self.current = {}   # browser key -> last rss
+        self.peaks = {}     # browser key -> highest rss seen
+        self.peak_total = 0
+        self.lock = threading.Lock()
+
+    def update(self, key, rss):
+        with self.lock:
+            self.current[key] = rss
+            self.peaks[key] = max(self.peaks.get(key, 0), rss)
+            self.peak_total = max(self.peak_total, sum(self.current.values()))
+
+    def forget(self, key):
+        # that browser is gone. its share goes back to the others.
+        with self.lock:
+            self.current.pop(key, None)
+
+    def limit(self):
+        with self.lock:
+            browsers = max(1, len(self.current))
+        limits = [x for x in (self.per_browser, self.total / browsers if self.total else None) if x]
+        return min(limits) if limits else None
+
+    def over(self, key):
+        # a reason to restart this browser, or None
+        with self.lock:
+            rss = self.current.get(key)
+        limit = self.limit()
+        if rss and limit and rss > limit:
+            return f"firefox is at {rss // 2**20} MB, its limit is {int(limit) // 2**20} MB"
+        return None
+
+    def peak(self):
+        with self.lock:
+            return max(self.peaks.values(), default=0), self.peak_total
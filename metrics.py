@@ -0,0 +1,185 @@
+# filename: metrics.py
+# where a 40 second mod actually goes. every phase gets timed, with bytes and retries,
+# written out as json lines while it runs and as a prometheus text file at the end.
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+JSONL_NAME = "metrics.jsonl"
+PROM_NAME = "metrics.prom"
+PROM_PREFIX = "mod_harvester"
+
+
+def percentile(values, p):
+    # nearest rank. good enough for "is search slower than last week".
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def label_string(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    def __init__(self, folder=None):
+        # folder is where the files go. None keeps everything in memory for the summary.
+        self.folder = Path(folder) if folder else None
+        self.samples = {}    # phase -> list of sample dicts
+        self.counters = {}   # (name, labels tuple) -> count
+        self.gauges = {}     # (name, labels tuple) -> value
+        self.lock = threading.Lock()
+        # the phase each thread is in right now, so retries land on the right one
+        self.active = threading.local()
+        self.jsonl = None
+        if self.folder:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            self.jsonl = open(self.folder / JSONL_NAME, "a", encoding="utf-8")
+
+    def observe(self, phase, seconds, mod_id=None, nbytes=None, retries=0, ok=True):
+        sample = {"ts": round(time.time(), 3), "phase": phase, "seconds": round(seconds, 4), "mod_id": mod_id, "bytes": nbytes, "retries": retries, "ok": ok}
+        with self.lock:
+            self.samples.setdefault(phase, []).append(sample)
+            if self.jsonl:
+                self.jsonl.write(json.dumps(sample) + "\n")
+                self.jsonl.flush()
+        return sample
+
+    @contextmanager
+    def phase(self, name, mod_id=None):
+        # yields a dict. set "bytes" on it if the phase moved any.
+        record = {"bytes": None, "retries": 0}
+        outer = getattr(self.active, "record", None)
+        self.active.record = record
+        started = time.monotonic()
+        ok = False
+        try:
+            yield record
+            ok = True
+        finally:
+            self.active.record = outer
+            self.observe(name, time.monotonic() - started, mod_id=mod_id, nbytes=record["bytes"], retries=record["retries"], ok=ok)
+
+    def count(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+        record = getattr(self.active, "record", None)
+        if record is not None and name.endswith("retries"):
+            record["retries"] += n
+
+    def gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def peak(self, name, value, **labels):
+        # a gauge that only goes up
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if value > self.gauges.get(key, value - 1):
+                self.gauges[key] = value
+
+    def summary(self):
+        # phase -> count, failures, p50, p95, total seconds, total bytes
+        with self.lock:
+            samples = {phase: list(items) for phase, items in self.samples.items()}
+        result = {}
+        for phase, items in samples.items():
+            durations = [s["seconds"] for s in items]
+            result[phase] = {
+                "count": len(items),
+                "failed": sum(1 for s in items if not s["ok"]),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "total": sum(durations),
+                "bytes": sum(s["bytes"] or 0 for s in items),
+                "retries": sum(s["retries"] for s in items),
+            }
+        return result
+
+    def log_summary(self):
+        summary = self.summary()
+        if not summary:
+            return summary
+        logging.info("--- where the time went ---")
+        width = max(len(phase) for phase in summary)
+        for phase, s in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+            extra = ""
+            if s["bytes"]:
+                extra += f", {s['bytes'] / 2**20:.1f} MB"
+            if s["retries"]:
+                extra += f", {s['retries']} retries"
+            if s["failed"]:
+                extra += f", {s['failed']} failed"
+            logging.info(f"{phase:<{width}}  n={s['count']:<4} p50={s['p50']:.2f}s p95={s['p95']:.2f}s total={s['total']:.1f}s{extra}")
+        with self.lock:
+            counters = dict(self.counters)
+        for (name, labels), value in sorted(counters.items()):
+            logging.info(f"{name}{label_string(dict(labels))}: {value}")
+        return summary
+
+    def prometheus(self):
+        lines = []
+        summary = self.summary()
+        name = f"{PROM_PREFIX}_phase_seconds"
+        lines += [f"# HELP {name} time spent per phase.", f"# TYPE {name} summary"]
+        for phase, s in sorted(summary.items()):
+            for quantile in ("0.5", "0.95"):
+                value = s["p50"] if quantile == "0.5" else s["p95"]
+                lines.append(f"{name}{label_string({'phase': phase, 'quantile': quantile})} {value}")
+            lines.append(f"{name}_sum{label_string({'phase': phase})} {s['total']}")
+            lines.append(f"{name}_count{label_string({'phase': phase})} {s['count']}")
+        for field, help_text in (("bytes", "bytes moved per phase."), ("retries", "retries per phase."), ("failed", "failed attempts per phase.")):
+            name = f"{PROM_PREFIX}_phase_{field}_total"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for phase, s in sorted(summary.items()):
+                lines.append(f"{name}{label_string({'phase': phase})} {s[field]}")
+
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        typed = set()
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for (metric, labels), value in sorted(values.items()):
+                full = f"{PROM_PREFIX}_{metric}" + ("_total" if kind == "counter" else "")
+                if full not in typed:
+                    lines.append(f"# TYPE {full} {kind}")
+                    typed.add(full)
+                lines.append(f"{full}{label_string(dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        path = Path(path) if path else (self.folder / PROM_NAME if self.folder else None)
+        if not path:
+            return None
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        tmp.replace(path)
+        return path
+
+    def finish(self):
+        # end of a run. summary in the log, prometheus file on disk.
+        self.log_summary()
+        path = self.write_prometheus()
+        if path:
+            logging.info(f"metrics written to {path} and {path.with_name(JSONL_NAME)}")
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.jsonl:
+                self.jsonl.close()
+                self.jsonl = None
@@ -6,77 +6,154 @@ import sys
 import argparse
 import logging
 import platform
-import zipfile
 import json
 import re
+import queue
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs
-
-# setup logging. force it to be useful.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
-
-# check dependencies. if you don't have them, that's your problem.
-STARTUP_ERROR = None
-try:
-    import geckodriver_autoinstaller
-    from selenium import webdriver
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.webdriver.firefox.options import Options as FirefoxOptions
-except ImportError as e:
-    STARTUP_ERROR = str(e)
+
+from preset_registry import PRESETS, DEFAULT_BASE_URL
+from http_engine import HttpEngine, EngineError, USER_AGENT
+from resumable import RangeDownloader, ResumeError
+from resolution_cache import ResolutionCache, DEFAULT_CACHE_PATH, DEFAULT_TTL, CACHE_DIR
+from manifest import Manifest
+from steam_api import SteamClient, SteamCache, SteamApiError, parse_mod_id, post_form, throttled
+from download_tracker import DownloadTracker
+from extractor import ExtractionPipeline, DEFAULT_EXTRACT_WORKERS
+from verifier import VerificationPipeline, quarantine
+from metrics import Metrics
+from archive_store import ArchiveStore, DEFAULT_STORE_PATH
+from filelinks import LINK_MODES
+from lean import apply_lean, blocklist_for
+from endpoints import EndpointManager
+from throttle import Throttle, DEFAULT_RATE, DEFAULT_MAX_IN_FLIGHT
+from job_queue import JobStore, JOBS_NAME, QUEUED, DOWNLOADING, DOWNLOADED, EXTRACTED, FAILED
+from retry import RetryScheduler, RunDirectory, ModFailure, classify, SEARCH_MISS, SITE_DOWN, TIMEOUT, SETUP, CORRUPT, OTHER, DEFAULT_RETRIES, DEFAULT_RETRY_DELAY
+from session_pool import SessionPool, serve, submit, DEFAULT_PORT
+from memory_budget import MemoryBudget, tree_rss, open_handles, DEFAULT_RECYCLE_AFTER, DEFAULT_MAX_RSS_MB, DEFAULT_MAX_HANDLES
+
+# selenium takes longer to import than the rest of the script together, and --help or an
+# http-only run never touch it. it gets loaded the first time something needs firefox.
+geckodriver_autoinstaller = webdriver = By = WebDriverWait = EC = FirefoxOptions = TimeoutException = None
+_selenium_error = None
+
+
+def load_selenium():
+    # check dependencies. if you don't have them, that's your problem.
+    global geckodriver_autoinstaller, webdriver, By, WebDriverWait, EC, FirefoxOptions, TimeoutException, _selenium_error
+    if webdriver or _selenium_error:
+        return _selenium_error
+    try:
+        import geckodriver_autoinstaller
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.firefox.options import Options as FirefoxOptions
+        from selenium.common.exceptions import TimeoutException
+    except ImportError as e:
+        _selenium_error = str(e)
+    return _selenium_error
+
+
+class HarvesterError(Exception):
+    # something the harvester can't work around (no selenium, no firefox). the cli exits on it, embedders catch it.
+    pass
 
 # --- config ---
 
-# generated this list. don't touch it. i don't know why half of these exist.
-GAME_PRESETS = {
-    "Cities: Skylines": {"app_id": "255710", "base_url": "https://smods.ru"},
-    "Hearts of Iron IV": {"app_id": "394360", "base_url": "https://hearts-of-iron-4.smods.ru"},
-    "Stellaris": {"app_id": "281990", "base_url": "https://catalogue.smods.ru"},
-    "RimWorld": {"app_id": "294100", "base_url": "https://catalogue.smods.ru"},
-    "Crusader Kings III": {"app_id": "1158310", "base_url": "https://catalogue.smods.ru"},
-    "Europa Universalis IV": {"app_id": "236850", "base_url": "https://catalogue.smods.ru"},
-    "Darkest Dungeon": {"app_id": "262060", "base_url": "https://catalogue.smods.ru"},
-    "Barotrauma": {"app_id": "602960", "base_url": "https://catalogue.smods.ru"},
-    "Teardown": {"app_id": "1167630", "base_url": "https://catalogue.smods.ru"},
-    "Total War: WARHAMMER III": {"app_id": "1142710", "base_url": "https://catalogue.smods.ru"},
-    "Garry's Mod": {"app_id": "4000", "base_url": "https://catalogue.smods.ru"},
-    "XCOM 2": {"app_id": "268500", "base_url": "https://catalogue.smods.ru"},
-    "Sid Meier's Civilization VI": {"app_id": "289070", "base_url": "https://catalogue.smods.ru"},
-    "Terraria": {"app_id": "105600", "base_url": "https://catalogue.smods.ru"},
-    "Project Zomboid": {"app_id": "108600", "base_url": "https://catalogue.smods.ru"},
-    "Darkest Dungeon II": {"app_id": "1940340", "base_url": "https://catalogue.smods.ru"}
+# how long each kind of wait is allowed to take, in seconds. we poll until the
+# thing actually happens instead of sleeping a fixed amount and hoping.
+DEFAULT_TIMEOUTS = {
+    "page": 20,        # elements on normal pages
+    "popup": 1.0,      # spam tabs that may or may not open after a click
+    "window": 10,      # tabs that are supposed to open
+    "cookie": 2,       # cookie banner, if there even is one
+    "countdown": 60,   # the modsbase timer
+    "download": 30,    # firefox creating the file after the last click
+    "stall": 120,      # a transfer that hasn't grown in this long is dead
 }
+DEFAULT_POLL_INTERVAL = 0.25
+
+# where smods sends you for the actual file, and which tabs are allowed to stay open.
+# the benchmark points these at localhost.
+DEFAULT_MIRROR_DOMAIN = "modsbase.com"
+DEFAULT_TRUSTED_DOMAINS = ("modsbase.com", "smods.ru")
 
-# fallback for when logic fails (which is often)
-DEFAULT_BASE_URL = "https://catalogue.smods.ru"
+# modsbase enables the button when the timer runs out. ask the page instead of guessing.
+COUNTDOWN_DONE_JS = """
+var btn = document.getElementById('downloadbtn');
+if (!btn || btn.disabled) return null;
+var timer = document.getElementById('countdown');
+if (timer && timer.offsetParent !== null && parseInt(timer.textContent, 10) > 0) return null;
+return btn;
+"""
 
-# external config because hardcoding is "bad practice" apparently
-external_presets_path = Path("verified_presets.json")
-if external_presets_path.exists():
+# --- wait conditions. all of them take the driver because WebDriverWait says so. ---
+
+def new_window_opened(initial_handles):
+    return lambda driver: len(driver.window_handles) > len(initial_handles)
+
+def window_on_domain(domain):
+    def check(driver):
+        for handle in driver.window_handles:
+            driver.switch_to.window(handle)
+            if domain in driver.current_url:
+                return handle
+        return False
+    return check
+
+def countdown_finished(driver):
+    return driver.execute_script(COUNTDOWN_DONE_JS)
+
+def download_claimed(tracker, mod_id, before):
+    return lambda driver: tracker.claim(mod_id, before) or False
+
+# geckodriver_autoinstaller phones home every time. once a day is plenty.
+GECKODRIVER_STAMP = CACHE_DIR / "geckodriver.json"
+GECKODRIVER_RECHECK = 24 * 3600
+_geckodriver_ready = False
+
+def ensure_geckodriver():
+    global _geckodriver_ready
+    if _geckodriver_ready:
+        return
     try:
-        with open(external_presets_path, 'r') as f:
-            external_presets = json.load(f)
-            # prioritize external file. obviously.
-            for name, data in external_presets.items():
-                # normalize keys
-                clean_name = name.replace(" Mods", "")
-                # strip legacy archive path if present (lazy migration)
-                url = data.get("base_url", "")
-                if "/archives/" in url:
-                    url = url.split("/archives/")[0]
-                GAME_PRESETS[clean_name] = {"app_id": data.get("app_id"), "base_url": url}
+        with open(GECKODRIVER_STAMP, "r") as f:
+            stamp = json.load(f)
+        if os.path.exists(stamp["path"]) and time.time() - stamp["checked_at"] < GECKODRIVER_RECHECK:
+            folder = os.path.dirname(stamp["path"])
+            if folder not in os.environ.get("PATH", "").split(os.pathsep):
+                os.environ["PATH"] = folder + os.pathsep + os.environ.get("PATH", "")
+            _geckodriver_ready = True
+            return
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    logging.info("checking geckodriver...")
+    # try auto-install, but don't die if it fails or hangs
+    try:
+        path = geckodriver_autoinstaller.install()
+        if path:
+            GECKODRIVER_STAMP.parent.mkdir(parents=True, exist_ok=True)
+            with open(GECKODRIVER_STAMP, "w") as f:
+                json.dump({"path": str(path), "checked_at": time.time()}, f)
     except Exception as e:
-        # i don't care enough to print the stack trace
-        print(f"warning: verified_presets.json is broken: {e}", flush=True)
+        logging.warning(f"auto-install failed ({e}). assuming geckodriver is in path.")
+    _geckodriver_ready = True
+
+def preset_for_app(app_id):
+    # app id -> (game name, base url). unknown games get the generic catalogue.
+    return PRESETS.for_app(app_id)
 
 class ModHarvester:
-    def __init__(self, base_url=None, app_id=None, download_folder="Mod_Downloads", mod_file=None, profile_path=None, headless=True, unzip=False):
-        if STARTUP_ERROR:
-            print(f"error: required libraries missing. {STARTUP_ERROR}. pip install selenium geckodriver-autoinstaller", flush=True)
-            sys.exit(1)
-            
+    def __init__(self, base_url=None, app_id=None, download_folder="Mod_Downloads", mod_file=None, profile_path=None, headless=True, unzip=False, workers=1, engine="browser", timeouts=None, poll_interval=DEFAULT_POLL_INTERVAL, cache_path=DEFAULT_CACHE_PATH, cache_ttl=DEFAULT_TTL, sync=False, unzip_workers=DEFAULT_EXTRACT_WORKERS, reextract=False, segments=1, collections=None, steam=None, metrics_dir=None, mirror_domain=DEFAULT_MIRROR_DOMAIN, trusted_domains=DEFAULT_TRUSTED_DOMAINS, retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY, run_dir=None, store_path=None, store_link="auto", lean=False, recycle_after=DEFAULT_RECYCLE_AFTER, max_rss_mb=DEFAULT_MAX_RSS_MB, memory_budget_mb=None, max_handles=DEFAULT_MAX_HANDLES, failover=True, rate=DEFAULT_RATE, max_in_flight=DEFAULT_MAX_IN_FLIGHT, resume=False, verify=True):
+        if engine == "browser" and load_selenium():
+            raise HarvesterError(f"required libraries missing. {load_selenium()}. pip install selenium geckodriver-autoinstaller")
+
         self.base_url = base_url
         self.app_id = app_id
         self.download_folder = Path(download_folder).resolve()
@@ -84,25 +161,112 @@ class ModHarvester:
         self.profile_path = profile_path
         self.headless = headless
         self.unzip = unzip
+        self.unzip_workers = unzip_workers
+        self.reextract = reextract
+        # set while a run is going and --unzip is on. archives go in as they finish.
+        self.pipeline = None
+        # workers hand their finished archives up to whoever spawned them
+        self.parent = None
+        self.workers = max(1, int(workers or 1))
+        # "browser" is the old way. "http" skips firefox unless a page confuses it.
+        self.engine = engine
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.poll_interval = poll_interval
+        self.mirror_domain = mirror_domain
+        self.trusted_domains = tuple(trusted_domains)
+        # firefox without images, fonts, autoplay, popups and ad hosts. presets can say otherwise per site.
+        self.lean = lean
+        # whether the firefox that's running right now is lean
+        self.lean_active = False
+        # sites where lean mode broke a page this run. they get the full browser from then on.
+        self.lean_broken = set()
+        # a fresh firefox every recycle_after mods, or when it gets too fat. its place in the list stays.
+        self.recycle_after = recycle_after
+        self.max_handles = max_handles
+        self.mods_on_driver = 0
+        # memory of every firefox in the run. workers share it, so they share the total too.
+        self.budget = MemoryBudget(memory_budget_mb, max_rss_mb)
+        # every phase gets timed in here. workers share their parent's.
+        self.metrics = Metrics(metrics_dir)
+        # requests per second and at once, per host, for everything this run does. workers share it.
+        self.throttle = Throttle(rate, max_in_flight, metrics=self.metrics)
+        # probes a game's site and its mirrors, picks the fastest, and stops using hosts that keep failing
+        self.endpoints = EndpointManager(metrics=self.metrics, throttle=self.throttle) if failover else None
+        # failed mods get another go after the batch, with growing waits in between
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # screenshots, page sources and failed ids. one folder per run, nothing gets overwritten.
+        self.run_dir = RunDirectory(run_dir or self.download_folder / ".runs" / time.strftime("%Y%m%d-%H%M%S"))
+        # one copy of every archive across output folders. None keeps the old one-folder-one-copy way.
+        self.store = ArchiveStore(store_path, link=store_link) if store_path else None
+        # mod id -> sha256 for archives that came out of the store
+        self.stored = {}
+        # every archive gets checked (size, sha256, crcs) before it's extracted or written down.
+        # the results go into <output>/index.json. set while a run is going.
+        self.verify = verify
+        self.verifier = None
+        # mod id -> size the server announced. workers share it, the top one checks against it.
+        self.expected_sizes = {}
+        # mod id -> sha256 of the archive, from the check. the manifest doesn't hash it again.
+        self.hashes = {}
+        # mod id -> {"error", "attempts"} for archives that came out broken
+        self.corrupt = {}
+        # mod id -> {"kind", "error", "attempts"}. successes get taken out again.
+        self.failures = {}
+        # spam tabs killed for the current mod. lots of them means we're stuck in a popup loop.
+        self.popups_this_mod = 0
+        # remembers search results between runs. None means always search.
+        self.cache = ResolutionCache(cache_path, cache_ttl) if cache_path else None
+        # batch progress on disk (<output>/.jobs.sqlite). resume picks up where the last run stopped.
+        self.jobs = None
+        self.resume = resume
+        # the site came from -u or from where we found the mod before. first tries go straight there,
+        # mirrors only get probed once that fails.
+        self.site_known = False
+        # sync mode skips mods the manifest says we already have
+        self.sync = sync
+        # mod id -> archive name, for whatever this run downloaded
+        self.downloads = {}
+        # mod id -> final zip link, so a stalled browser download can be finished over http
+        self.zip_urls = {}
+        self.segments = segments
+        self.steam_details = {}
+        # workshop collections to expand into mod ids (batch mode)
+        self.collections = [parse_mod_id(c) or c for c in collections or []]
+        # bulk steam web api lookups, cached. tests can hand in their own.
+        self.steam = steam or SteamClient(post=throttled(post_form, self.throttle), cache=SteamCache())
+        # watches the download folder and knows which file is whose
+        self.tracker = DownloadTracker(self.download_folder, stall_after=self.timeouts["stall"], on_complete=self.archive_ready, metrics=self.metrics)
+        # workers share a profile dir. firefox locks it, so they get a copy.
+        self.copy_profile = False
         self.driver = None
         self.wait = None
+        self.main_window_handle = None
+        self.browser_pid = None
         self.start_time = time.time()
         
-    def setup_driver(self):
-        logging.info("checking geckodriver...")
-        
-        # try auto-install, but don't die if it fails or hangs
-        try:
-            geckodriver_autoinstaller.install()
-        except Exception as e:
-            logging.warning(f"auto-install failed ({e}). assuming geckodriver is in path.")
+    def lean_for(self, base_url):
+        # --lean is the default, a preset's "lean" key overrides it for its site
+        if base_url in self.lean_broken:
+            return False
+        preset = PRESETS.for_base_url(base_url) or {}
+        return bool(preset.get("lean", self.lean))
+
+    def setup_driver(self, lean=None):
+        if load_selenium():
+            raise HarvesterError(f"firefox needs selenium. {load_selenium()}. pip install selenium geckodriver-autoinstaller")
+        ensure_geckodriver()
         
         logging.info("launching firefox...")
         options = FirefoxOptions()
         if self.headless:
             options.add_argument("--headless")
         
-        if self.profile_path:
+        if self.profile_path and self.copy_profile:
+            logging.info(f"using copy of profile: {self.profile_path}")
+            options.profile = self.profile_path
+        elif self.profile_path:
             logging.info(f"using profile: {self.profile_path}")
             options.add_argument("-profile")
             options.add_argument(self.profile_path)
@@ -116,23 +280,27 @@ class ModHarvester:
         options.set_preference("browser.download.dir", str(self.download_folder))
         options.set_preference("browser.download.useDownloadDir", True)
         options.set_preference("browser.helperApps.neverAsk.saveToDisk", "application/zip, application/octet-stream")
+
+        lean = self.lean_for(self.base_url) if lean is None else lean
+        if lean:
+            apply_lean(options, blocklist_for(PRESETS.for_base_url(self.base_url)))
         
         try:
-            self.driver = webdriver.Firefox(options=options)
+            with self.step("driver startup"):
+                self.driver = webdriver.Firefox(options=options)
             self.driver.set_page_load_timeout(30)
-            self.wait = WebDriverWait(self.driver, 20)
-            logging.info("firefox is alive.")
+            self.wait = WebDriverWait(self.driver, self.timeouts["page"], poll_frequency=self.poll_interval)
+            self.main_window_handle = self.driver.current_window_handle
+            self.browser_pid = self.driver.capabilities.get("moz:processID")
+            self.lean_active = lean
+            logging.info("firefox is alive." + (" lean, too." if lean else ""))
         except Exception as e:
-            logging.error(f"failed to start firefox: {e}")
-            logging.error("make sure firefox is installed and geckodriver is in your path.")
-            sys.exit(1)
+            raise HarvesterError(f"failed to start firefox: {e}. make sure firefox is installed and geckodriver is in your path.") from e
 
     def resolve_steam_url(self, url):
         # find the mod id from the url
         # usually ?id=XXXXX
-        parsed = urlparse(url)
-        params = parse_qs(parsed.query)
-        mod_id = params.get('id', [None])[0]
+        mod_id = parse_mod_id(url)
         
         if not mod_id:
             logging.error(f"could not parse mod id from url: {url}")
@@ -140,42 +308,28 @@ class ModHarvester:
 
         logging.info(f"detected mod id: {mod_id}")
 
-        # if we already have app_id and base_url from flags, just use them
-        if self.app_id and self.base_url:
+        # if we already have the base url from flags, just use it. the app id is only for finding the site.
+        if self.base_url:
+            self.site_known = True
             return mod_id, self.app_id, self.base_url
 
-        # otherwise, we have to go look for it. sigh.
-        if not self.driver:
-            self.setup_driver()
+        # a mod we found before is wherever we found it. no steam, no firefox.
+        known = self.cache.sites(mod_id) if self.cache else []
+        if known:
+            logging.info(f"remembered {mod_id} on {known[0]}. not asking steam.")
+            self.site_known = True
+            return mod_id, self.app_id, known[0]
 
-        logging.info(f"visiting steam to find app id: {url}")
-        self.driver.get(url)
-        
+        # otherwise, we have to go look for it. ask the api first, it's one small request (cached for a day).
         found_app_id = None
-        
-        # try method 1: the app hub link
-        try:
-            # this works on most workshop pages
-            element = self.driver.find_element(By.CSS_SELECTOR, "div.apphub_HeaderStandardTop")
-            # it might be in a data attribute? no, usually easier to regex the page source if this fails.
-            # actually, let's look for the 'All Games' breadcrumb or check the url of the game hub
-        except:
-            pass
-            
-        # try method 2: regex the page source. reliable and ugly.
-        try:
-            import re
-            # look for "appid": 12345 or data-appid="12345"
-            match = re.search(r'"appid":\s*(\d+)', self.driver.page_source)
-            if match:
-                found_app_id = match.group(1)
-            else:
-                # try another pattern
-                match = re.search(r'data-appid="(\d+)"', self.driver.page_source)
-                if match:
-                    found_app_id = match.group(1)
-        except Exception as e:
-            logging.warning(f"regex failed: {e}")
+        with self.step("steam resolve", mod_id):
+            try:
+                found_app_id = self.steam.app_ids([mod_id]).get(mod_id)
+            except SteamApiError as e:
+                logging.warning(f"{e}. asking firefox instead.")
+        if not found_app_id:
+            with self.step("steam resolve", mod_id):
+                found_app_id = self.scrape_app_id(url)
 
         if not found_app_id:
             logging.error("could not determine app id. defaulting to generic smods. good luck.")
@@ -185,28 +339,166 @@ class ModHarvester:
         logging.info(f"found app id: {found_app_id}")
         
         # now find the right smods url
-        target_base_url = DEFAULT_BASE_URL
-        
-        # check if we have a preset for this app id
-        for game, data in GAME_PRESETS.items():
-            if data["app_id"] == found_app_id:
-                logging.info(f"matched preset: {game}")
-                target_base_url = data["base_url"]
-                break
+        game, target_base_url = preset_for_app(found_app_id)
+        if game:
+            logging.info(f"matched preset: {game}")
         
         return mod_id, found_app_id, target_base_url
 
-    def safe_click(self, element, expected_domain=None):
+    def scrape_app_id(self, url):
+        # the old way. load the workshop page and dig the app id out of it.
+        if not url.startswith("http"):
+            url = f"https://steamcommunity.com/sharedfiles/filedetails/?id={url}"
+        if not self.driver:
+            self.setup_driver()
+
+        logging.info(f"visiting steam to find app id: {url}")
+        try:
+            self.load(url)
+        except ModFailure as e:
+            logging.warning(f"steam won't show the page: {e}")
+            return None
+        
+        # regex the page source. reliable and ugly.
+        try:
+            # look for "appid": 12345 or data-appid="12345"
+            match = re.search(r'"appid":\s*(\d+)', self.driver.page_source)
+            if match:
+                return match.group(1)
+            # try another pattern
+            match = re.search(r'data-appid="(\d+)"', self.driver.page_source)
+            if match:
+                return match.group(1)
+        except Exception as e:
+            logging.warning(f"regex failed: {e}")
+        return None
+
+    def expand_collections(self):
+        try:
+            mod_ids = self.steam.expand(self.collections)
+        except SteamApiError as e:
+            logging.error(f"could not expand collections: {e}")
+            return []
+        return mod_ids
+
+    def browser_rss(self):
+        # the whole firefox, content processes included
+        return tree_rss(self.browser_pid) if self.browser_pid else None
+
+    def browser_mode(self):
+        return "lean" if self.lean_active else "full"
+
+    def load(self, url, mod_id=None):
+        # driver.get, timed per browser mode so lean and full can be compared
+        started = time.monotonic()
+        ok = False
+        try:
+            with self.throttle.slot(url):
+                self.driver.get(url)
+            ok = True
+        finally:
+            self.metrics.observe(f"page load ({self.browser_mode()})", time.monotonic() - started, mod_id=mod_id, ok=ok)
+        reason = self.throttle.report(url, title=self.driver.title)
+        if reason:
+            raise ModFailure(SITE_DOWN, f"{url} is pushing back ({reason})")
+
+    def sample_rss(self):
+        # firefox's memory after a mod. the peak is what decides whether the box swaps.
+        rss = self.browser_rss()
+        if rss:
+            self.budget.update(self, rss)
+            self.metrics.gauge("browser_rss_bytes", rss, mode=self.browser_mode())
+            self.metrics.peak("browser_rss_peak_bytes", rss, mode=self.browser_mode())
+        return rss
+
+    def needs_recycle(self):
+        # a reason to start over with a fresh firefox, or None
+        if not self.driver:
+            return None
+        if self.recycle_after and self.mods_on_driver >= self.recycle_after:
+            return f"did {self.mods_on_driver} mods"
+        reason = self.budget.over(self)
+        if reason:
+            return reason
+        handles = open_handles(self.browser_pid) if self.browser_pid else None
+        if handles:
+            self.metrics.peak("browser_handles_peak", handles)
+            if self.max_handles and handles > self.max_handles:
+                return f"firefox has {handles} files open"
+        return None
+
+    def keep_fresh(self):
+        # between mods. the next mod is still the next one, it just gets a new firefox.
+        reason = self.needs_recycle()
+        if not reason:
+            return False
+        logging.info(f"restarting firefox: {reason}.")
+        self.metrics.count("driver_recycles")
+        # running downloads die with firefox
+        self.wait_for_downloads()
+        self.quit_driver()
+        self.setup_driver()
+        return True
+
+    def driver_healthy(self):
+        # a dead firefox still looks like a driver object. poke it.
+        if not self.driver:
+            return False
+        try:
+            self.driver.execute_script("return 1;")
+            return len(self.driver.window_handles) >= 1
+        except Exception:
+            return False
+
+    def quit_driver(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+        self.driver = None
+        self.wait = None
+        self.main_window_handle = None
+        self.browser_pid = None
+        self.mods_on_driver = 0
+        self.budget.forget(self)
+
+    @contextmanager
+    def step(self, name, mod_id=None):
+        # times a phase and logs it. if something is slow, this is where you'll see it.
+        # yields the metrics record, set "bytes" on it if the phase moved any.
+        started = time.monotonic()
+        try:
+            with self.metrics.phase(name, mod_id) as record:
+                yield record
+        finally:
+            logging.info(f"step '{name}' took {time.monotonic() - started:.2f}s")
+
+    def wait_until(self, condition, timeout_key, what, required=True):
+        # polls until the condition is truthy. required waits raise, optional ones return None.
+        timeout = self.timeouts[timeout_key]
+        waiter = WebDriverWait(self.driver, timeout, poll_frequency=self.poll_interval)
+        try:
+            return waiter.until(condition)
+        except TimeoutException:
+            if required:
+                raise TimeoutException(f"gave up waiting {timeout}s for {what}")
+            return None
+
+    def safe_click(self, element, expected_domain=None, expect_window=False):
         # clicks things. handles the million spam tabs that pop up.
         # if a tab opens and it's not the site proper, i kill it.
         current_handle = self.driver.current_window_handle
         initial_handles = self.driver.window_handles
+        # clicks that go somewhere count against that host's rate too
+        self.throttle.wait(element.get_attribute("href") or self.driver.current_url)
         
         # force js click because selenium is trash
         self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-        time.sleep(0.5)
         self.driver.execute_script("arguments[0].click();", element)
-        time.sleep(2)
+
+        # popups show up fast or not at all. only wait long if a tab is supposed to open.
+        self.wait_until(new_window_opened(initial_handles), "window" if expect_window else "popup", "a new tab", required=False)
         
         new_handles = self.driver.window_handles
         if len(new_handles) > len(initial_handles):
@@ -220,7 +512,7 @@ class ModHarvester:
                     is_safe = False
                     if expected_domain and expected_domain in current_url:
                         is_safe = True
-                    elif "modsbase.com" in current_url or "smods.ru" in current_url:
+                    elif any(domain in current_url for domain in self.trusted_domains):
                         is_safe = True
                     # blank pages sometimes mean the download actually started. weird.
                     elif current_url == "about:blank":
@@ -229,10 +521,12 @@ class ModHarvester:
                     if not is_safe:
                         logging.warning("closing spam popup. nice try.")
                         self.driver.close()
+                        self.metrics.count("popups_killed")
+                        self.popups_this_mod += 1
                         self.driver.switch_to.window(current_handle)
                         # if we closed a popup, the click was likely intercepted. try again.
                         logging.info("retrying click...")
-                        time.sleep(1)
+                        self.metrics.count("click_retries")
                         try:
                             self.driver.execute_script("arguments[0].click();", element)
                         except:
@@ -241,92 +535,128 @@ class ModHarvester:
                         logging.info("popup seems legit. staying.")
                         return
 
+    def open_cached_page(self, mod_id, url):
+        # goes straight to the mod page we found last time. False if it's gone.
+        logging.info(f"cache hit for {mod_id}: {url}")
+        self.load(url, mod_id)
+        gone = self.driver.execute_script(
+            "return !!(document.body && document.body.classList.contains('error404'))"
+            " || /not found/i.test(document.title);"
+        )
+        if gone:
+            logging.info(f"cached page for {mod_id} is gone. forgetting it.")
+            self.cache.invalidate(self.base_url, mod_id)
+            return False
+        return True
+
     def download_mod(self, mod_id, main_window_handle):
+        modsbase_url = None
+        self.mods_on_driver += 1
         try:
             logging.info(f"--- processing mod: {mod_id} ---")
             self.driver.switch_to.window(main_window_handle)
             
-            # search for the mod since we can't guess the url
-            search_url = f"{self.base_url}/?s={mod_id}"
-            logging.info(f"searching: {search_url}")
-            self.driver.get(search_url)
-            
-            # click the first result
-            try:
-                # look for the first article link (smods usually creates a grid or list)
-                # selector: article a
-                result_link = self.wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "article a")))
-                target_url = result_link.get_attribute("href")
-                logging.info(f"found mod page: {target_url}")
-                # use js click because headless firefox is picky about scrolling
-                self.driver.execute_script("arguments[0].click();", result_link)
-            except Exception as e:
-                logging.error(f"search failed. could not find result for {mod_id}. error: {e}")
-                raise e
+            # search for the mod since we can't guess the url. unless we already did.
+            with self.step("search", mod_id):
+                cached = self.cache.get(self.base_url, mod_id) if self.cache else None
+                if not (cached and self.open_cached_page(mod_id, cached["article_url"])):
+                    search_url = f"{self.base_url}/?s={mod_id}"
+                    logging.info(f"searching: {search_url}")
+                    self.load(search_url, mod_id)
+                    
+                    # click the first result
+                    try:
+                        # look for the first article link (smods usually creates a grid or list)
+                        # selector: article a
+                        result_link = self.wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "article a")))
+                        target_url = result_link.get_attribute("href")
+                        logging.info(f"found mod page: {target_url}")
+                        # use js click because headless firefox is picky about scrolling
+                        self.driver.execute_script("arguments[0].click();", result_link)
+                        if self.cache:
+                            self.cache.remember(self.base_url, mod_id, article_url=target_url)
+                    except Exception as e:
+                        logging.error(f"search failed. could not find result for {mod_id}. error: {e}")
+                        raise ModFailure(SEARCH_MISS, f"no search result for {mod_id}") from e
 
             # find the download button. it moves around to annoy me.
-            try:
-                # specific modsbase redirect link
-                download_link_element = self.wait.until(EC.element_to_be_clickable((By.XPATH, "//a[contains(@href, 'modsbase.com')]")))
-                logging.info(f"found modsbase link: {download_link_element.get_attribute('href')}")
-            except Exception:
+            with self.step("mod page", mod_id):
                 try:
-                     # ck3 style
-                    download_link_element = self.wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "skymods-excerpt-btn")))
-                except:
-                     # desperation
-                    download_link_element = self.wait.until(EC.element_to_be_clickable((By.PARTIAL_LINK_TEXT, "Download")))
-
-            logging.info("found initial download link. clicking...")
-            self.safe_click(download_link_element, expected_domain="modsbase.com")
-            time.sleep(3)
-
-            # popups are the absolute worst thing on the internet.
-            for handle in self.driver.window_handles:
-                if handle != main_window_handle:
-                    self.driver.switch_to.window(handle)
-                    if "modsbase.com" in self.driver.current_url:
-                        logging.info(f"switched to modsbase: {self.driver.current_url}")
-                        break 
-            
-            # kill the cookie banner. die.
-            try:
-                cookie_button = WebDriverWait(self.driver, 5).until(EC.element_to_be_clickable((By.XPATH, "//*[contains(text(), 'Accept')]")))
-                cookie_button.click()
-                time.sleep(1) 
-            except Exception:
-                pass
+                    # specific modsbase redirect link
+                    download_link_element = self.wait.until(EC.element_to_be_clickable((By.XPATH, f"//a[contains(@href, '{self.mirror_domain}')]")))
+                    modsbase_url = download_link_element.get_attribute('href')
+                    logging.info(f"found modsbase link: {modsbase_url}")
+                    if self.cache:
+                        self.cache.remember(self.base_url, mod_id, modsbase_url=modsbase_url)
+                except Exception:
+                    try:
+                         # ck3 style
+                        download_link_element = self.wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "skymods-excerpt-btn")))
+                    except:
+                         # desperation
+                        download_link_element = self.wait.until(EC.element_to_be_clickable((By.PARTIAL_LINK_TEXT, "Download")))
 
-            # wait for the valid buttons. finding this id took me 2 hours.
-            logging.info("waiting for timer...")
-            # use presence_of_element_located so ad overlays don't block detection
-            create_link_button = self.wait.until(EC.presence_of_element_located((By.ID, "downloadbtn")))
-            # extra wait for safety
-            time.sleep(6) 
-            
-            logging.info("clicking 'create download link'.")
-            self.safe_click(create_link_button)
+                logging.info("found initial download link. clicking...")
+                self.safe_click(download_link_element, expected_domain=self.mirror_domain, expect_window=True)
+
+            with self.step("modsbase", mod_id):
+                # popups are the absolute worst thing on the internet.
+                handle = self.wait_until(window_on_domain(self.mirror_domain), "window", "the modsbase tab", required=False)
+                if handle:
+                    logging.info(f"switched to modsbase: {self.driver.current_url}")
+                elif self.lean_active and modsbase_url:
+                    # the popup blocker ate the new tab. just go there in this one.
+                    logging.info("no modsbase tab, the popup blocker probably ate it. opening it here.")
+                    self.load(modsbase_url, mod_id)
+                else:
+                    logging.warning("never saw a modsbase tab. trying whatever is open.")
+                
+                # kill the cookie banner. die.
+                cookie_button = self.wait_until(EC.element_to_be_clickable((By.XPATH, "//*[contains(text(), 'Accept')]")), "cookie", "the cookie banner", required=False)
+                if cookie_button:
+                    try:
+                        cookie_button.click()
+                    except Exception:
+                        pass
+
+                # wait for the valid buttons. finding this id took me 2 hours.
+                # use presence_of_element_located so ad overlays don't block detection
+                self.wait.until(EC.presence_of_element_located((By.ID, "downloadbtn")))
+
+            with self.step("modsbase timer", mod_id):
+                logging.info("waiting for timer...")
+                create_link_button = self.wait_until(countdown_finished, "countdown", "the modsbase timer")
             
-            final_download_link = self.wait.until(EC.element_to_be_clickable((By.PARTIAL_LINK_TEXT, ".zip")))
-            logging.info(f"found final button. linking to: {final_download_link.get_attribute('href')}")
-            logging.info("downloading...")
-            self.safe_click(final_download_link)
+            with self.step("create link", mod_id):
+                logging.info("clicking 'create download link'.")
+                self.safe_click(create_link_button)
+                
+                final_download_link = self.wait.until(EC.element_to_be_clickable((By.PARTIAL_LINK_TEXT, ".zip")))
+                zip_url = final_download_link.get_attribute('href')
+                logging.info(f"found final button. linking to: {zip_url}")
+                if zip_url:
+                    self.zip_urls[mod_id] = zip_url
+                if self.cache:
+                    self.cache.remember(self.base_url, mod_id, zip_name=final_download_link.text.strip() or None)
+
+            with self.step("download start", mod_id):
+                logging.info("downloading...")
+                self.checkpoint(mod_id, DOWNLOADING)
+                before = self.tracker.snapshot()
+                self.safe_click(final_download_link)
+                # the transfer keeps going while we click through the next mod
+                self.downloads[mod_id] = self.wait_until(download_claimed(self.tracker, mod_id, before), "download", "firefox to start the download")
             
             logging.info(f"success: download started for {mod_id}.")
-            time.sleep(5)
+            return True
 
         except Exception as e:
             logging.error(f"error processing {mod_id}: {e}")
-            if self.driver:
-                try:
-                    self.driver.save_screenshot("error_screenshot.png")
-                    logging.info("screenshot saved to error_screenshot.png")
-                    with open("error_page_source.html", "w", encoding="utf-8") as f:
-                        f.write(self.driver.page_source)
-                except:
-                    pass
+            self.record_failure(mod_id, e)
+            return False
         
         finally:
+            self.sample_rss()
             # cleanup tabs
             if len(self.driver.window_handles) > 1:
                 for handle in self.driver.window_handles:
@@ -335,57 +665,255 @@ class ModHarvester:
                         self.driver.close()
                 self.driver.switch_to.window(main_window_handle)
 
-    def process_unzip(self):
-        logging.info("scanning for files to extract...")
-        # wait a bit for writers to close
-        time.sleep(5) 
-        
-        count = 0
-        for file_path in self.download_folder.glob("*.zip"):
-            # check if file was modified after start time
-            if file_path.stat().st_mtime > self.start_time:
-                try:
-                    logging.info(f"extracting: {file_path.name}")
-                    with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                        zip_ref.extractall(self.download_folder)
-                    logging.info(f"extracted {file_path.name}")
-                    count += 1
-                except zipfile.BadZipFile:
-                    logging.error(f"failed to extract {file_path.name}: bad zip")
-                except Exception as e:
-                    logging.error(f"failed to extract {file_path.name}: {e}")
-        
-        if count == 0:
-            logging.info("no new files extracted.")
+    def record_failure(self, mod_id, error):
+        # works out what kind of failure it was and saves whatever evidence there is
+        url = source = screenshot = page_text = None
+        if self.driver:
+            try:
+                url = self.driver.current_url
+                source = self.driver.page_source
+                screenshot = self.driver.save_screenshot
+                # firefox's "can't connect" page
+                page_text = f"{self.driver.title}\n{source[:20000]}" + ("\nproblem loading page" if url.startswith("about:neterror") else "")
+            except Exception:
+                pass
+        kind = classify(error, page_text=page_text, popups=self.popups_this_mod)
+        failure = self.failures.setdefault(mod_id, {"attempts": 0})
+        failure.update(kind=kind, error=str(error))
+        failure["attempts"] += 1
+        logging.warning(f"{mod_id}: failed ({kind}).")
+        self.run_dir.record(mod_id, kind, error, url=url, screenshot=screenshot, page_source=source)
+        return kind
+
+    def fetch_mod(self, mod_id):
+        # try the cheap way first. firefox only if the cheap way chokes.
+        self.popups_this_mod = 0
+        if self.engine == "http":
+            try:
+                engine = HttpEngine(self.base_url, self.download_folder, mirror_domain=self.mirror_domain, cache=self.cache, segments=self.segments, throttle=self.throttle)
+                with self.step("http resolve", mod_id):
+                    resolved = engine.locate(mod_id)
+                self.checkpoint(mod_id, DOWNLOADING)
+                with self.step("transfer", mod_id) as record:
+                    path = engine.store(mod_id, resolved)
+                    record["bytes"] = path.stat().st_size
+                self.downloads[mod_id] = path.name
+                self.expected_sizes[mod_id] = engine.expected.get(path.name)
+                self.archive_ready(mod_id, path.name)
+                logging.info(f"success: {mod_id} downloaded without a browser.")
+                return True
+            except EngineError as e:
+                if classify(e) == SITE_DOWN:
+                    # firefox won't have better luck
+                    logging.error(f"http engine can't reach the site for {mod_id} ({e}).")
+                    self.record_failure(mod_id, e)
+                    return False
+                logging.warning(f"http engine gave up on {mod_id} ({e}). falling back to firefox.")
+
+        if not self.driver:
+            self.setup_driver()
+        if self.download_mod(mod_id, self.main_window_handle):
+            return True
+        if not self.lean_active or self.failures.get(mod_id, {}).get("kind") in (SEARCH_MISS, SITE_DOWN):
+            return False
+        return self.retry_without_lean(mod_id)
+
+    def retry_without_lean(self, mod_id):
+        # maybe the page needed something lean mode blocked. same mod again with everything on.
+        # if that works, the site stays on the full browser for the rest of the run.
+        logging.warning(f"{mod_id}: failed in lean mode. trying again with the full browser.")
+        self.metrics.count("lean_fallbacks")
+        # downloads still running belong to this firefox. let them finish first.
+        self.wait_for_downloads()
+        self.quit_driver()
+        self.setup_driver(lean=False)
+        if not self.download_mod(mod_id, self.main_window_handle):
+            return False
+        logging.warning(f"lean mode breaks {self.base_url}. using the full browser there from now on. set \"lean\": false in its preset to skip the detour.")
+        self.lean_broken.add(self.base_url)
+        return True
+
+    def lookup_steam_details(self, mod_ids):
+        try:
+            # fresh, not cached. this is where time_updated comes from.
+            return self.steam.details(mod_ids, max_age=0)
+        except SteamApiError as e:
+            logging.warning(f"{e}. can't tell what steam updated, going by what's on disk.")
+            return {}
+
+    def sync_filter(self, mod_ids):
+        # only keep mods that are new, missing, or updated on steam since we got them
+        manifest = Manifest(self.download_folder)
+        self.steam_details.update(self.lookup_steam_details(mod_ids))
+        todo = [m for m in mod_ids if not manifest.is_current(m, self.steam_details.get(m, {}).get("time_updated"))]
+        logging.info(f"sync: {len(mod_ids) - len(todo)} mods up to date, {len(todo)} to fetch.")
+        return todo
+
+    def record_downloads(self, mod_ids=None):
+        # writes what we just got into the manifest. sync mode reads it next time.
+        downloads = {m: n for m, n in self.downloads.items() if mod_ids is None or m in mod_ids}
+        if not downloads:
+            return
+        manifest = Manifest(self.download_folder)
+        missing = [m for m in downloads if m not in self.steam_details]
+        if missing:
+            self.steam_details.update(self.lookup_steam_details(missing))
+        for mod_id, name in downloads.items():
+            path = self.download_folder / name if name else None
+            if not path or not self.tracker.is_done(name) or not path.exists() or path.stat().st_size == 0:
+                logging.warning(f"{mod_id}: expected {name} but it isn't there. not recording it.")
+                continue
+            steam_updated = self.steam_details.get(mod_id, {}).get("time_updated")
+            sha256 = self.stored.get(mod_id) or self.hashes.get(mod_id)
+            if self.store:
+                sha256 = self.store.add(mod_id, path, steam_updated, sha256=sha256)
+            manifest.record(mod_id, path, steam_updated, sha256=sha256)
+        manifest.save()
+        logging.info(f"manifest updated with {len(downloads)} mods.")
+
+    def reuse_stored(self, mod_ids):
+        # whatever the store already has (and steam hasn't updated since) gets linked in, not downloaded
+        if not self.store or not mod_ids:
+            return mod_ids
+        missing = [m for m in mod_ids if m not in self.steam_details]
+        if missing:
+            self.steam_details.update(self.lookup_steam_details(missing))
+        todo = []
+        for mod_id in mod_ids:
+            entry = self.store.checkout(mod_id, self.download_folder, self.steam_details.get(mod_id, {}).get("time_updated"))
+            if not entry:
+                todo.append(mod_id)
+                continue
+            self.stored[mod_id] = entry["sha256"]
+            self.downloads[mod_id] = entry["archive"]
+            self.archive_ready(mod_id, entry["archive"])
+        if len(todo) < len(mod_ids):
+            logging.info(f"store: {len(mod_ids) - len(todo)} mods already stored, {len(todo)} to download.")
+        return todo
+
+    def archive_ready(self, mod_id, name):
+        # a download just finished. workers pass it up, the top one checks and extracts it.
+        if self.parent:
+            self.parent.downloads[mod_id] = name
+            self.parent.take_archive(self.download_folder / name)
+            self.parent.archive_ready(mod_id, name)
+            return
+        self.checkpoint(mod_id, DOWNLOADED, archive=name)
+        if self.verifier:
+            self.verifier.submit(mod_id, self.download_folder / name, self.expected_sizes.pop(mod_id, None))
+        elif self.pipeline:
+            self.pipeline.submit(mod_id, self.download_folder / name)
+
+    def verified(self, mod_id, result):
+        # the archive is checked. good ones go on to extraction, broken ones out of the way.
+        if result["status"] == "ok":
+            self.hashes[mod_id] = result["sha256"]
+            self.corrupt.pop(mod_id, None)
+            if self.pipeline:
+                self.pipeline.submit(mod_id, result["path"])
+            return
+        self.metrics.count("corrupt_archives")
+        quarantine(result["path"])
+        self.downloads.pop(mod_id, None)
+        corrupt = self.corrupt.setdefault(mod_id, {"attempts": 0})
+        corrupt["error"] = result["error"]
+        corrupt["attempts"] += 1
+        self.run_dir.record(mod_id, CORRUPT, result["error"])
+        # with a job store it goes back in the queue. a worker still taking jobs picks it up, or --resume does.
+        if self.jobs and corrupt["attempts"] <= self.retries:
+            logging.warning(f"{mod_id}: downloading it again.")
+            self.checkpoint(mod_id, QUEUED, kind=CORRUPT, error=result["error"], not_before=0)
+        else:
+            self.checkpoint(mod_id, FAILED, kind=CORRUPT, error=result["error"])
+
+    def finish_verification(self):
+        # waits for the checks still running. call before writing the manifest, so broken archives stay out of it.
+        if not self.verifier:
+            return
+        logging.info("waiting for verification to catch up...")
+        self.verifier.close()
+        self.verifier = None
+        for mod_id, corrupt in self.corrupt.items():
+            self.failures[mod_id] = {"kind": CORRUPT, "error": corrupt["error"], "attempts": corrupt["attempts"]}
+
+    def take_archive(self, path):
+        target = self.download_folder / path.name
+        if target.exists():
+            target.unlink()
+        shutil.move(str(path), str(target))
+
+    def start_pipeline(self):
+        if self.verify:
+            self.verifier = VerificationPipeline(self.download_folder, metrics=self.metrics, on_done=self.verified)
+        if self.unzip:
+            tree_root = self.store.trees if self.store else None
+            link = self.store.link if self.store else "auto"
+            self.pipeline = ExtractionPipeline(self.download_folder, workers=self.unzip_workers, skip_current=not self.reextract, metrics=self.metrics, tree_root=tree_root, link=link, on_done=self.extracted)
+
+    def extracted(self, mod_id, result):
+        if result["status"] == "failed":
+            # the archive is fine to keep. the error is there for whoever looks.
+            self.checkpoint(mod_id, DOWNLOADED, error=f"extraction failed: {result.get('error')}")
         else:
-            logging.info(f"extracted {count} archives.")
+            self.checkpoint(mod_id, EXTRACTED)
+
+    def checkpoint(self, mod_id, state, **fields):
+        # one step of a mod's progress, on disk right away. only batch runs keep a job store.
+        if not self.jobs:
+            return
+        try:
+            self.jobs.move(mod_id, state, **fields)
+        except sqlite3.Error as e:
+            logging.warning(f"jobs: could not record {mod_id} as {state}: {e}")
+
+    def finish_pipeline(self):
+        # checks first. the good archives they find still go to extraction.
+        self.finish_verification()
+        if self.pipeline:
+            logging.info("waiting for extraction to catch up...")
+            self.pipeline.close()
+            self.pipeline = None
+
+    def finish_metrics(self):
+        # end of the run. the summary goes in the log, the files go wherever --metrics said.
+        browser, total = self.budget.peak()
+        if browser:
+            logging.info(f"peak firefox memory: {browser / 2**20:.0f} MB for one browser, {total / 2**20:.0f} MB for all of them.")
+            self.metrics.gauge("browser_rss_run_peak_bytes", browser)
+            self.metrics.gauge("browser_rss_total_peak_bytes", total)
+        self.metrics.finish()
 
     def wait_for_downloads(self):
         logging.info("waiting for files. don't close me.")
-        # wait up to 5 minutes
-        timeout = 300
-        start = time.time()
-        while time.time() - start < timeout:
-            # check for .part or .crdownload files (temp junk)
-            temp_files = list(self.download_folder.glob("*.part")) + list(self.download_folder.glob("*.crdownload"))
-            # check for completed zips
-            zip_files = list(self.download_folder.glob("*.zip"))
-            
-            if temp_files:
-                logging.info(f"still downloading... {len(temp_files)} files active.")
-                time.sleep(2)
-                continue
-                
-            if zip_files:
-                # if size > 0 it's probably real. probably.
-                if any(f.stat().st_size > 0 for f in zip_files):
-                    logging.info("download looks done.")
-                    time.sleep(1) # safety buffer
-                    return
-            
-            time.sleep(1)
-            
-        logging.warning("download timed out. i gave it 5 minutes. it's not happening.")
+        # only the files this run started count. old zips in the folder don't fool it anymore.
+        stuck = [name for name in self.tracker.wait() if not self.resume_stalled(name)]
+        if stuck:
+            logging.warning(f"gave up on {len(stuck)} stalled downloads: {', '.join(stuck)}")
+        else:
+            logging.info("downloads look done.")
+
+    def resume_stalled(self, name):
+        # firefox gave up on it. fetch the same link with range requests, starting from its .part.
+        download = self.tracker.downloads.get(name)
+        url = self.zip_urls.get(download.mod_id) if download else None
+        if not url:
+            return False
+        logging.info(f"{download.mod_id}: firefox stalled on {name}. trying to resume over http.")
+        self.metrics.count("resume_retries")
+        downloader = RangeDownloader(self.download_folder, headers={"User-Agent": USER_AGENT}, segments=self.segments, throttle=self.throttle)
+        try:
+            path = downloader.download(url, seed_from=self.download_folder / (name + ".part"))
+        except ResumeError as e:
+            logging.warning(f"{download.mod_id}: resume failed ({e}).")
+            return False
+        self.expected_sizes[download.mod_id] = downloader.expected.get(path.name)
+        if path.name == name:
+            self.tracker.finish(name)
+        else:
+            logging.warning(f"{download.mod_id}: server called it {path.name}, not {name}.")
+            self.downloads[download.mod_id] = path.name
+            self.archive_ready(download.mod_id, path.name)
+        return True
 
     def run_single(self, url):
         # ensure folder exists
@@ -403,109 +931,568 @@ class ModHarvester:
         self.app_id = app_id
         self.base_url = base_url
         
-        if not self.driver:
-            self.setup_driver()
-            
+        self.start_pipeline()
         try:
-            self.download_mod(mod_id, self.driver.current_window_handle)
-            self.wait_for_downloads()
+            if self.reuse_stored([mod_id]):
+                self.download_ids([mod_id])
+            self.finish_verification()
+            self.record_downloads()
             logging.info(f"--- check '{self.download_folder}' ---")
-            
-            if self.unzip:
-                time.sleep(2)
-                self.process_unzip()
         finally:
-            if self.driver:
-                self.driver.quit()
+            self.finish_pipeline()
+            self.quit_driver()
+            self.report_failures()
+            self.finish_metrics()
 
     def run_batch(self):
         # standard list processing
         if not self.download_folder.exists():
             self.download_folder.mkdir(parents=True, exist_ok=True)
             
-        if not self.mod_file or not self.mod_file.exists():
+        jobs_path = self.download_folder / JOBS_NAME
+        resuming = self.resume and jobs_path.exists()
+        has_file = self.mod_file and self.mod_file.exists()
+        if not has_file and not self.collections and not resuming:
             logging.error("mod list file not found.")
             return
  
-        with open(self.mod_file, 'r') as f:
-            mod_ids = [line.strip() for line in f if line.strip()]
+        mod_ids = read_mod_ids(self.mod_file) if has_file else []
+        if self.collections:
+            mod_ids = list(dict.fromkeys(mod_ids + self.expand_collections()))
             
-        if not mod_ids:
+        if not mod_ids and not resuming:
             logging.error("no mod ids found.")
             return
  
         logging.info(f"found {len(mod_ids)} mods.")
-        self.setup_driver()
-        
+
+        # every mod is a job on disk from here on. a new run starts the list over, --resume doesn't.
+        self.jobs = JobStore(jobs_path)
+        if resuming:
+            self.jobs.recover()
+            added = self.jobs.add(mod_ids, self.base_url)
+            counts = self.jobs.counts()
+            logging.info(f"resuming: {', '.join(f'{n} {state}' for state, n in sorted(counts.items()))}" + (f", {added} new." if added else "."))
+            self.adopt_finished()
+        else:
+            self.jobs.reset(mod_ids, self.base_url)
+        mod_ids = self.jobs.ids(QUEUED)
+
+        if self.sync and mod_ids:
+            todo = self.sync_filter(mod_ids)
+            for mod_id in set(mod_ids) - set(todo):
+                self.checkpoint(mod_id, DOWNLOADED)
+            mod_ids = todo
+        if not mod_ids:
+            logging.info("everything is up to date. nothing to do." if self.sync else "nothing left to do.")
+            self.jobs.close()
+            self.jobs = None
+            return
+
+        self.start_pipeline()
         try:
-            if not self.base_url:
-                logging.error("no base url provided for batch mode. use -u.")
-                return
- 
-            main_window_handle = self.driver.current_window_handle
-            for mod_id in mod_ids:
-                try:
-                    self.download_mod(mod_id, main_window_handle)
-                except Exception as e:
-                    logging.error(f"failed to download {mod_id}: {e}")
-            
-            self.wait_for_downloads()
+            self.reuse_stored(mod_ids)
+            # one site for everything if -u was given. otherwise each mod goes to its game's site.
+            # jobs remember their site, so a resumed run only asks steam about new ones.
+            sites = self.jobs.sites()
+            unresolved = []
+            if sites.get(None):
+                routed, unresolved = self.route_mods(sites.pop(None))
+                self.jobs.route({m: base_url for base_url, ids in routed.items() for m in ids})
+                for base_url, ids in routed.items():
+                    sites.setdefault(base_url, []).extend(ids)
+                for mod_id in unresolved:
+                    self.checkpoint(mod_id, FAILED, kind="unknown game", error="steam doesn't know which game this is")
+            groups = sites
+
+            if len(groups) == 1:
+                self.base_url, group_ids = next(iter(groups.items()))
+                self.download_ids(group_ids)
+            elif groups:
+                self.run_groups(groups)
+            self.finish_verification()
+            self.record_downloads()
             logging.info("--- batch finished ---")
-            
-            if self.unzip:
-                time.sleep(2)
-                self.process_unzip()
-            
+            if unresolved:
+                logging.warning(f"could not figure out the game for {len(unresolved)} mods: {', '.join(unresolved)}")
         finally:
+            self.finish_pipeline()
+            self.finish_jobs()
+            self.report_failures()
+            self.finish_metrics()
+
+    def adopt_finished(self):
+        # a killed run never got to write its manifest. what its jobs say was downloaded goes in now.
+        known = Manifest(self.download_folder).entries
+        missed = {m: name for m, name in self.jobs.archives().items() if m not in known}
+        if not missed:
+            return
+        self.downloads.update(missed)
+        self.record_downloads(list(missed))
+
+    def finish_jobs(self):
+        # whatever this process still holds (a ctrl+c, a download that never finished) is queued for --resume
+        if not self.jobs:
+            return
+        released = self.jobs.release()
+        counts = self.jobs.counts()
+        logging.info(f"jobs: {', '.join(f'{n} {state}' for state, n in sorted(counts.items()))}.")
+        if counts.get(QUEUED):
+            logging.info(f"{counts[QUEUED]} mods still queued{f' ({released} were interrupted)' if released else ''}. run it again with --resume to finish them.")
+        self.jobs.close()
+        self.jobs = None
+
+    def download_ids(self, mod_ids):
+        # downloads a list against self.base_url. parallel if there are workers.
+        if self.workers > 1:
+            self.run_parallel(mod_ids)
+            return
+
+        if self.engine == "browser" and not self.driver:
+            self.setup_driver()
+        scheduler = self.new_scheduler()
+        # the site these mods were routed to. each mod may end up on one of its mirrors.
+        site = self.base_url
+        try:
+            for mod_id in self.retry_queue(mod_ids, scheduler, site):
+                self.attempt(self, mod_id, scheduler, site)
+                # anything that finished meanwhile goes off to extraction now
+                self.tracker.poll()
+                self.keep_fresh()
+            
             if self.driver:
-                self.driver.quit()
+                self.wait_for_downloads()
+        finally:
+            self.quit_driver()
+            self.settle_failures(scheduler)
+
+    def new_scheduler(self):
+        return RetryScheduler(retries=self.retries, base_delay=self.retry_delay)
+
+    def retry_queue(self, mod_ids, scheduler, site=None):
+        # everything once, in order. then the failures again as their backoff runs out.
+        # with a job store the order comes from there, claimed one at a time.
+        if self.jobs:
+            while not scheduler.stopped:
+                mod_id = self.jobs.claim(site)
+                if mod_id is None:
+                    break
+                yield mod_id
+            if scheduler.stopped:
+                scheduler.skipped(self.jobs.ids(QUEUED, site))
+                return
+        else:
+            for index, mod_id in enumerate(mod_ids):
+                if scheduler.stopped:
+                    scheduler.skipped(mod_ids[index:])
+                    return
+                yield mod_id
+        while True:
+            mod_id = self.next_retry(scheduler)
+            if mod_id is None:
+                return
+            yield mod_id
+
+    def next_work(self, work, site=None):
+        # the next fresh mod for a worker. None once there are none.
+        if self.jobs:
+            return self.jobs.claim(site)
+        try:
+            return work.get_nowait()
+        except queue.Empty:
+            return None
+
+    def next_retry(self, scheduler):
+        # a retry that's due. another process may have claimed it from the job store meanwhile.
+        while True:
+            mod_id = scheduler.next_due()
+            if mod_id is None or not self.jobs or self.jobs.take(mod_id):
+                return mod_id
+            logging.info(f"{mod_id}: another process took it.")
+
+    def attempt(self, harvester, mod_id, scheduler, site=None):
+        # one try at one mod. returns (ok, final). final is False if it got requeued.
+        scheduler.started(mod_id)
+        chosen = None
+        try:
+            if site and harvester.endpoints and harvester.site_known and mod_id not in harvester.failures:
+                # no probes for a site we already know works. the circuit still hears how it went.
+                chosen = harvester.base_url = site
+            elif site and harvester.endpoints:
+                chosen = harvester.base_url = harvester.endpoints.choose(site)
+            ok = harvester.fetch_mod(mod_id)
+        except HarvesterError as e:
+            logging.error(f"failed to download {mod_id}: {e}")
+            harvester.record_failure(mod_id, ModFailure(SETUP, str(e)))
+            ok = False
+        except Exception as e:
+            logging.error(f"failed to download {mod_id}: {e}")
+            harvester.record_failure(mod_id, e)
+            ok = False
+        if ok:
+            if chosen:
+                harvester.endpoints.succeeded(chosen)
+            scheduler.succeeded(mod_id)
+            self.failures.pop(mod_id, None)
+            return True, True
+        kind = self.failures.get(mod_id, {}).get("kind", OTHER)
+        if chosen and kind in (SITE_DOWN, TIMEOUT):
+            harvester.endpoints.failed(chosen)
+        requeued = scheduler.failed_with(mod_id, kind)
+        error = self.failures.get(mod_id, {}).get("error")
+        if requeued:
+            # other processes on the same job store have to respect the backoff too
+            due = scheduler.pending.get(mod_id, time.monotonic())
+            self.checkpoint(mod_id, QUEUED, kind=kind, error=error, not_before=time.time() + max(0, due - time.monotonic()))
+        else:
+            self.checkpoint(mod_id, FAILED, kind=kind, error=error)
+        return False, not requeued
+
+    def settle_failures(self, scheduler):
+        # mods we never got to because the site went down count as failed too
+        for mod_id, kind in scheduler.failed.items():
+            self.failures.setdefault(mod_id, {"kind": kind, "error": "not tried, the site looked down", "attempts": 0})
+
+    def report_failures(self):
+        if not self.failures:
+            return
+        kinds = {}
+        for failure in self.failures.values():
+            kinds[failure["kind"]] = kinds.get(failure["kind"], 0) + 1
+        summary = ", ".join(f"{n} {kind}" for kind, n in sorted(kinds.items()))
+        path = self.run_dir.write_failed(self.failures)
+        logging.warning(f"{len(self.failures)} mods failed ({summary}). ids are in {path}, run it again with -f.")
+
+    def route_mods(self, mod_ids):
+        # asks steam which game each mod is for and sorts them by smods site
+        try:
+            with self.step("steam resolve"):
+                app_ids = self.steam.app_ids(mod_ids)
+        except SteamApiError as e:
+            logging.error(f"could not look up games for the batch: {e}. use -u.")
+            return {}, list(mod_ids)
+        groups = {}
+        unresolved = []
+        for mod_id in mod_ids:
+            app_id = app_ids.get(mod_id)
+            if not app_id:
+                unresolved.append(mod_id)
+                continue
+            _, base_url = preset_for_app(app_id)
+            groups.setdefault(base_url, []).append(mod_id)
+        for base_url, group_ids in groups.items():
+            logging.info(f"routing {len(group_ids)} mods to {base_url}")
+        return groups, unresolved
+
+    def run_groups(self, groups):
+        # every site gets its own harvester and they all run at once. workers get split between them.
+        workers_each = max(1, self.workers // len(groups))
+        children = []
+        threads = []
+        for index, (base_url, group_ids) in enumerate(groups.items()):
+            child = self.spawn_worker(f"group_{index}", base_url=base_url)
+            child.workers = workers_each
+            child.download_folder.mkdir(parents=True, exist_ok=True)
+            children.append(child)
+            t = threading.Thread(target=self.run_group, args=(child, group_ids), name=f"group-{index}")
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        for child in children:
+            self.merge_worker_folder(child.download_folder)
+
+    def run_group(self, child, mod_ids):
+        try:
+            child.download_ids(mod_ids)
+        except HarvesterError as e:
+            logging.error(f"group for {child.base_url} could not start: {e}. skipping {len(mod_ids)} mods.")
+        except Exception as e:
+            logging.error(f"group for {child.base_url} died: {e}")
+
+    def spawn_worker(self, index, base_url=None):
+        # a clone with its own firefox and its own folder. no sharing toys.
+        worker = ModHarvester(
+            base_url=base_url or self.base_url,
+            app_id=None if base_url else self.app_id,
+            download_folder=self.download_folder / f".worker_{index}",
+            profile_path=self.profile_path,
+            headless=self.headless,
+            engine=self.engine,
+            timeouts=self.timeouts,
+            poll_interval=self.poll_interval,
+            cache_path=None,
+            segments=self.segments,
+            steam=self.steam,
+            mirror_domain=self.mirror_domain,
+            trusted_domains=self.trusted_domains,
+            lean=self.lean,
+            recycle_after=self.recycle_after,
+            max_handles=self.max_handles,
+            failover=False
+        )
+        worker.endpoints = self.endpoints
+        worker.jobs = self.jobs
+        worker.throttle = self.throttle
+        worker.lean_broken = self.lean_broken
+        worker.budget = self.budget
+        worker.cache = self.cache
+        worker.metrics = self.metrics
+        worker.failures = self.failures
+        worker.expected_sizes = self.expected_sizes
+        worker.run_dir = self.run_dir
+        worker.tracker.metrics = self.metrics
+        worker.parent = self
+        worker.copy_profile = True
+        worker.start_time = self.start_time
+        # same site as ours, same trust. a group child got its site from a preset, so it probes.
+        worker.site_known = self.site_known and not base_url
+        return worker
+
+    def worker_loop(self, index, work, progress, scheduler):
+        worker = self.spawn_worker(index)
+        worker.download_folder.mkdir(parents=True, exist_ok=True)
+        try:
+            if worker.engine == "browser":
+                worker.setup_driver()
+        except HarvesterError as e:
+            logging.error(f"worker {index} could not start firefox: {e}. it's out.")
+            return
+
+        site = worker.base_url
+        try:
+            while not scheduler.stopped:
+                mod_id = self.next_work(work, site)
+                if mod_id is None:
+                    # the queue is done. help out with retries until there are none left.
+                    mod_id = self.next_retry(scheduler)
+                    if mod_id is None:
+                        break
+                ok, final = self.attempt(worker, mod_id, scheduler, site)
+                progress(index, mod_id, ok, final)
+                worker.tracker.poll()
+                worker.keep_fresh()
+
+            if worker.driver:
+                worker.wait_for_downloads()
+        finally:
+            worker.quit_driver()
+            self.merge_worker_folder(worker.download_folder)
+
+    def merge_worker_folder(self, folder):
+        # move finished stuff up into the real folder. leave the half-baked junk.
+        for file_path in folder.iterdir():
+            if file_path.suffix in (".part", ".crdownload"):
+                logging.warning(f"leaving unfinished file behind: {file_path}")
+                continue
+            self.take_archive(file_path)
+        try:
+            folder.rmdir()
+        except OSError:
+            pass
+
+    def run_parallel(self, mod_ids):
+        # n browsers, one queue. it's not rocket science, it's just threads.
+        work = queue.Queue()
+        # with a job store the workers claim from there instead
+        for mod_id in mod_ids if not self.jobs else []:
+            work.put(mod_id)
+
+        total = len(mod_ids)
+        lock = threading.Lock()
+        stats = {"done": 0, "failed": []}
+        started = time.time()
+
+        def progress(index, mod_id, ok, final=True):
+            if not final:
+                logging.info(f"{mod_id} failed, queued for a retry (worker {index})")
+                return
+            with lock:
+                stats["done"] += 1
+                if not ok:
+                    stats["failed"].append(mod_id)
+                elapsed = max(time.time() - started, 1e-6)
+                rate = stats["done"] / (elapsed / 60)
+                status = "ok" if ok else "FAILED"
+                logging.info(f"[{stats['done']}/{total}] {mod_id} {status} (worker {index}) - {rate:.1f} mods/min")
+
+        worker_count = min(self.workers, total)
+        logging.info(f"starting {worker_count} workers.")
+        scheduler = self.new_scheduler()
+        threads = []
+        for index in range(worker_count):
+            t = threading.Thread(target=self.worker_loop, args=(index, work, progress, scheduler), name=f"worker-{index}")
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        elapsed = time.time() - started
+        rate = stats["done"] / max(elapsed / 60, 1e-6)
+        logging.info(f"processed {stats['done']}/{total} mods in {elapsed:.0f}s ({rate:.1f} mods/min).")
+        if stats["failed"]:
+            logging.warning(f"failed: {', '.join(stats['failed'])}")
+        leftover = list(work.queue) if not self.jobs else self.jobs.ids(QUEUED, self.base_url)
+        if leftover:
+            if scheduler.stopped:
+                scheduler.skipped(leftover)
+            logging.warning(f"{len(leftover)} mods never got picked up." + ("" if scheduler.stopped else " all workers died."))
+        self.settle_failures(scheduler)
+        return stats
 
 # --- main ---
 
+def read_mod_ids(path):
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def parse_waits(values):
+    # turns ["countdown=90", "popup=0.5"] into a dict. typos get yelled at.
+    timeouts = {}
+    for value in values or []:
+        name, _, seconds = value.partition("=")
+        if name not in DEFAULT_TIMEOUTS or not seconds:
+            raise argparse.ArgumentTypeError(f"bad --wait '{value}'. known waits: {', '.join(DEFAULT_TIMEOUTS)}")
+        try:
+            timeouts[name] = float(seconds)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad --wait '{value}'. seconds have to be a number.")
+    return timeouts
+
 def main():
+    # setup logging. force it to be useful. only for the cli, embedders keep their own.
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
     parser = argparse.ArgumentParser(description="downloads steam mods. no gui.")
     
-    # allow a single url as a positional arg
-    parser.add_argument('url', nargs='?', help="steam workshop url to download")
+    # allow a single url (or just the id) as a positional arg
+    parser.add_argument('url', nargs='?', help="steam workshop url or mod id to download")
     
     # flags for advanced/batch usage
     parser.add_argument('-u', '--base_url', type=str, help="manually set base url")
     parser.add_argument('-a', '--app_id', type=str, help="manually set app id")
     parser.add_argument('-p', '--profile', type=str, help="firefox profile path")
-    parser.add_argument('-f', '--file', type=str, default="mod_ids.txt", help="file with mod ids (batch mode)")
+    parser.add_argument('-c', '--collection', action='append', help="workshop collection url or id (batch mode, repeatable)")
+    parser.add_argument('-f', '--file', type=str, help="file with mod ids (batch mode, default mod_ids.txt)")
     parser.add_argument('-o', '--output', type=str, default="Mod_Downloads", help="where to put the files")
     parser.add_argument('--headless', action='store_true', help="run invisible")
     parser.add_argument('--unzip', action='store_true', help="auto-unzip stuff")
+    parser.add_argument('--unzip-workers', type=int, default=DEFAULT_EXTRACT_WORKERS, help="how many archives to extract at once")
+    parser.add_argument('--reextract', action='store_true', help="extract even if the folder already matches the archive")
+    parser.add_argument('--no-verify', action='store_true', help="don't check archives (size, sha256, crcs) or write index.json")
+    parser.add_argument('--segments', type=int, default=1, help="split big downloads into this many parallel range requests (http engine)")
+    parser.add_argument('--engine', choices=["browser", "http"], help="http skips firefox unless a page confuses it. default: http for one mod, browser for batches.")
+    parser.add_argument('--wait', action='append', metavar="NAME=SECONDS", help=f"override a wait timeout ({', '.join(DEFAULT_TIMEOUTS)})")
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL, help="how often waits check again, in seconds")
+    parser.add_argument('--cache', type=str, default=str(DEFAULT_CACHE_PATH), help="where to remember resolved mod pages")
+    parser.add_argument('--no-cache', action='store_true', help="always search, remember nothing")
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 3600, help="hours before a remembered page is searched again")
+    parser.add_argument('--sync', action='store_true', help="batch mode: only fetch mods that are new or updated since last time")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="parallel firefox sessions (batch mode, or warm sessions with --serve)")
+    parser.add_argument('--serve', action='store_true', help="stay running with warm firefox sessions and take jobs from --remote")
+    parser.add_argument('--remote', action='store_true', help="send the url (or the ids in -f) to a running --serve instead")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="local port for --serve/--remote")
+    parser.add_argument('--recycle-after', type=int, default=DEFAULT_RECYCLE_AFTER, help="restart firefox after this many mods (0 = never)")
+    parser.add_argument('--resume', action='store_true', help="batch mode: carry on where the last run in this -o stopped. more processes with --resume help out.")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help="how many more times a failed mod gets tried after the batch")
+    parser.add_argument('--retry-delay', type=float, default=DEFAULT_RETRY_DELAY, help="seconds before the first retry. doubles every time.")
+    parser.add_argument('--run-dir', type=str, help="where failed ids and per-mod diagnostics go (default: <output>/.runs/<time>)")
+    parser.add_argument('--store', type=str, nargs='?', const=str(DEFAULT_STORE_PATH), metavar="DIR", help=f"keep one copy of every archive in a shared store and link it into -o (default {DEFAULT_STORE_PATH})")
+    parser.add_argument('--store-link', choices=LINK_MODES, default="auto", help="how the store puts files into -o. auto tries reflink, then hardlink, then copy.")
+    parser.add_argument('--metrics', type=str, metavar="DIR", help="write per-phase timings to DIR/metrics.jsonl and DIR/metrics.prom")
+    parser.add_argument('--lean', action='store_true', help="firefox without images, fonts, autoplay, popups and ad/tracker hosts. presets can turn it on or off per site.")
+    parser.add_argument('--max-rss', type=int, default=DEFAULT_MAX_RSS_MB, help="restart firefox when it uses more MB than this")
+    parser.add_argument('--memory-budget', type=int, metavar="MB", help="MB all firefox workers may use together. each gets its share.")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="requests per second per host, across all workers (0 = no limit). presets can set their own.")
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT, help="requests at once per host, across all workers")
+    parser.add_argument('--no-failover', action='store_true', help="always use the game's own smods site, even when it's down or slow")
+    parser.add_argument('--max-handles', type=int, default=DEFAULT_MAX_HANDLES, help="restart firefox when it has more files open than this")
     
     args = parser.parse_args()
+    try:
+        timeouts = parse_waits(args.wait)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    cache_path = None if args.no_cache else args.cache
+    cache_ttl = args.cache_ttl * 3600
+
+    options = dict(
+        base_url=args.base_url,
+        app_id=args.app_id,
+        download_folder=args.output,
+        profile_path=args.profile,
+        headless=args.headless,
+        unzip=args.unzip,
+        unzip_workers=args.unzip_workers,
+        reextract=args.reextract,
+        # one mod shouldn't wait for firefox to boot. the http engine still falls back to it if it has to.
+        engine=args.engine or ("http" if args.url and not args.serve else "browser"),
+        timeouts=timeouts,
+        poll_interval=args.poll,
+        cache_path=cache_path,
+        cache_ttl=cache_ttl,
+        segments=args.segments,
+        metrics_dir=args.metrics,
+        retries=args.retries,
+        retry_delay=args.retry_delay,
+        run_dir=args.run_dir,
+        store_path=args.store,
+        store_link=args.store_link,
+        lean=args.lean,
+        recycle_after=args.recycle_after,
+        max_rss_mb=args.max_rss,
+        memory_budget_mb=args.memory_budget,
+        max_handles=args.max_handles,
+        failover=not args.no_failover,
+        rate=args.rate,
+        max_in_flight=args.max_in_flight,
+        resume=args.resume,
+        verify=not args.no_verify
+    )
 
     # logic flow:
+    # 0. --remote hands the work to a daemon, --serve is the daemon
     # 1. if url is provided, run single mode (auto-detects app id if not provided)
     # 2. if no url, but flags provided, try batch mode
     # 3. otherwise, print help, because i deleted the menu.
 
+    try:
+        run_cli(parser, args, options)
+    except HarvesterError as e:
+        print(f"error: {e}", flush=True)
+        sys.exit(1)
+
+def run_cli(parser, args, options):
+    if args.remote:
+        targets = [args.url] if args.url else read_mod_ids(args.file or "mod_ids.txt")
+        if not targets:
+            parser.error("--remote needs a url or a -f file with ids")
+        try:
+            for result in submit(targets, port=args.port, base_url=args.base_url, app_id=args.app_id):
+                status = "ok" if result.get("ok") else f"FAILED ({result.get('error') or 'see daemon log'})"
+                print(f"{result.get('target')}: {status} {result.get('archive') or ''}".rstrip(), flush=True)
+        except OSError as e:
+            print(f"error: no daemon on port {args.port}? ({e})", flush=True)
+            sys.exit(1)
+        return
+
+    if args.serve:
+        harvester = ModHarvester(**options)
+        pool = SessionPool(harvester, size=args.workers, recycle_after=args.recycle_after, max_rss_mb=args.max_rss)
+        serve(pool, port=args.port)
+        return
+
     if args.url:
-        harvester = ModHarvester(
-            base_url=args.base_url,
-            app_id=args.app_id,
-            download_folder=args.output,
-            profile_path=args.profile,
-            headless=args.headless,
-            unzip=args.unzip
-        )
+        harvester = ModHarvester(**options)
         harvester.run_single(args.url)
         return
 
-    if args.base_url and args.app_id:
-        harvester = ModHarvester(
-            base_url=args.base_url,
-            app_id=args.app_id,
-            download_folder=args.output,
-            mod_file=args.file,
-            profile_path=args.profile,
-            headless=args.headless,
-            unzip=args.unzip
-        )
+    # batch mode. without -u each mod gets routed to its own game's site.
+    if args.file or args.collection or args.resume or (args.base_url and args.app_id):
+        harvester = ModHarvester(mod_file=args.file or "mod_ids.txt", workers=args.workers, sync=args.sync, collections=args.collection, **options)
         harvester.run_batch()
         return
         
@@ -0,0 +1,186 @@
+# filename: preset_registry.py
+# which smods site belongs to which game. built-in list plus verified_presets.json,
+# loaded the first time somebody asks, indexed by app id and by name.
+import os
+import re
+import json
+import logging
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+
+# generated this list. don't touch it. i don't know why half of these exist.
+BUILTIN_PRESETS = {
+    "Cities: Skylines": {"app_id": "255710", "base_url": "https://smods.ru"},
+    "Hearts of Iron IV": {"app_id": "394360", "base_url": "https://hearts-of-iron-4.smods.ru"},
+    "Stellaris": {"app_id": "281990", "base_url": "https://catalogue.smods.ru"},
+    "RimWorld": {"app_id": "294100", "base_url": "https://catalogue.smods.ru"},
+    "Crusader Kings III": {"app_id": "1158310", "base_url": "https://catalogue.smods.ru"},
+    "Europa Universalis IV": {"app_id": "236850", "base_url": "https://catalogue.smods.ru"},
+    "Darkest Dungeon": {"app_id": "262060", "base_url": "https://catalogue.smods.ru"},
+    "Barotrauma": {"app_id": "602960", "base_url": "https://catalogue.smods.ru"},
+    "Teardown": {"app_id": "1167630", "base_url": "https://catalogue.smods.ru"},
+    "Total War: WARHAMMER III": {"app_id": "1142710", "base_url": "https://catalogue.smods.ru"},
+    "Garry's Mod": {"app_id": "4000", "base_url": "https://catalogue.smods.ru"},
+    "XCOM 2": {"app_id": "268500", "base_url": "https://catalogue.smods.ru"},
+    "Sid Meier's Civilization VI": {"app_id": "289070", "base_url": "https://catalogue.smods.ru"},
+    "Terraria": {"app_id": "105600", "base_url": "https://catalogue.smods.ru"},
+    "Project Zomboid": {"app_id": "108600", "base_url": "https://catalogue.smods.ru"},
+    "Darkest Dungeon II": {"app_id": "1940340", "base_url": "https://catalogue.smods.ru"}
+}
+
+# fallback for when logic fails (which is often)
+DEFAULT_BASE_URL = "https://catalogue.smods.ru"
+
+# next to the script, not wherever you happened to run it from. override with the env var.
+DEFAULT_PRESETS_PATH = Path(os.environ.get("MOD_HARVESTER_PRESETS") or Path(__file__).resolve().parent / "verified_presets.json")
+
+
+def name_key(name):
+    # "Stellaris Mods", "stellaris", "Darkest Dungeon® II" -> all the same kind of key
+    name = re.sub(r"[®™©]", "", name)
+    name = re.sub(r"\s+mods$", "", name.strip(), flags=re.IGNORECASE)
+    return " ".join(name.lower().split())
+
+
+def clean_base_url(url):
+    # strip legacy archive path if present (lazy migration)
+    if "/archives/" in url:
+        url = url.split("/archives/")[0]
+    return url.rstrip("/")
+
+
+class PresetRegistry:
+    def __init__(self, path=DEFAULT_PRESETS_PATH, builtin=BUILTIN_PRESETS):
+        self.path = Path(path) if path else None
+        self.builtin = builtin
+        self.presets = {}    # name key -> preset dict
+        self.by_app_id = {}  # app id -> name key
+        self.by_base_url = {}  # base url -> every preset on that site, merged
+        self.conflicts = []
+        self.problems = []
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            for name, data in self.builtin.items():
+                self.add(name, data, source="built-in")
+            for name, data in self.read_file().items():
+                self.add(name, data, source=self.path.name)
+            self.reindex()
+            self.loaded = True
+            for conflict in self.conflicts:
+                logging.warning(f"preset conflict: {conflict}")
+
+    def read_file(self):
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("top level should be an object")
+            return data
+        except (OSError, ValueError) as e:
+            # i don't care enough to print the stack trace
+            logging.warning(f"{self.path.name} is broken: {e}")
+            return {}
+
+    def validate(self, name, data):
+        if not isinstance(data, dict):
+            return None, "not an object"
+        base_url = clean_base_url(str(data.get("base_url") or ""))
+        parsed = urlparse(base_url)
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            return None, f"bad base_url '{data.get('base_url')}'"
+        app_id = str(data.get("app_id") or "").strip()
+        if app_id and not app_id.isdigit():
+            return None, f"bad app_id '{app_id}'"
+        cleaned = dict(data)
+        cleaned.update(base_url=base_url, app_id=app_id)
+        return cleaned, None
+
+    def add(self, name, data, source="api"):
+        # later sources win, but empty app ids never wipe out a known one
+        cleaned, problem = self.validate(name, data)
+        if problem:
+            self.problems.append(f"{name} ({source}): {problem}")
+            logging.warning(f"skipping preset {name} from {source}: {problem}")
+            return
+        key = name_key(name)
+        existing = self.presets.get(key)
+        if existing:
+            if not cleaned["app_id"]:
+                cleaned["app_id"] = existing["app_id"]
+            if existing["base_url"] != cleaned["base_url"] and existing["source"] == source:
+                self.conflicts.append(
+                    f"'{existing['name']}' -> {existing['base_url']} vs '{name}' -> {cleaned['base_url']} in {source}. using the second."
+                )
+            # first name wins. "Stellaris Mods" is still Stellaris.
+            cleaned["name"] = existing["name"]
+        else:
+            cleaned["name"] = name
+        cleaned["source"] = source
+        self.presets[key] = cleaned
+
+    def reindex(self):
+        self.by_app_id = {}
+        self.by_base_url = {}
+        for key, preset in self.presets.items():
+            # for sites shared by many games, the first one that sets a key wins
+            merged = self.by_base_url.get(preset["base_url"])
+            self.by_base_url[preset["base_url"]] = dict(preset, **(merged or {}))
+            app_id = preset["app_id"]
+            if not app_id:
+                continue
+            other = self.by_app_id.get(app_id)
+            if other and self.presets[other]["base_url"] != preset["base_url"]:
+                self.conflicts.append(f"app {app_id} is both '{self.presets[other]['name']}' and '{preset['name']}'. using the first.")
+                continue
+            self.by_app_id.setdefault(app_id, key)
+
+    def for_app(self, app_id):
+        # app id -> (game name, base url). unknown games get the generic catalogue.
+        self.ensure_loaded()
+        key = self.by_app_id.get(str(app_id))
+        if not key:
+            return None, DEFAULT_BASE_URL
+        return self.presets[key]["name"], self.presets[key]["base_url"]
+
+    def for_base_url(self, base_url):
+        # the preset behind a site, for per-site settings like "lean". None if nobody claims it.
+        # looked up for every mod, so it comes out of the index reindex() built.
+        self.ensure_loaded()
+        merged = self.by_base_url.get(clean_base_url(str(base_url or "")))
+        return dict(merged) if merged else None
+
+    def get(self, name):
+        self.ensure_loaded()
+        return self.presets.get(name_key(name))
+
+    def names(self):
+        self.ensure_loaded()
+        return [p["name"] for p in self.presets.values()]
+
+    def items(self):
+        self.ensure_loaded()
+        return [(p["name"], p) for p in self.presets.values()]
+
+    def save_file(self, presets):
+        # writes the scraped presets out. the built-in ones stay in the code.
+        with self.lock:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(presets, f, indent=4)
+            tmp.replace(self.path)
+            self.loaded = False
+            self.presets, self.by_app_id, self.by_base_url, self.conflicts, self.problems = {}, {}, {}, [], []
+
+
+# shared instance. nothing is read until the first lookup.
+PRESETS = PresetRegistry()
@@ -1,14 +1,34 @@
-import json
 import time
 import re
+import argparse
 import logging
-from pathlib import Path
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-import geckodriver_autoinstaller
+import http.client
+import urllib.request
+import urllib.error
+from urllib.parse import urlparse, parse_qs, urljoin
+from concurrent.futures import ThreadPoolExecutor
+
+from preset_registry import PRESETS, BUILTIN_PRESETS
+from http_engine import parse_page, USER_AGENT
+from steam_api import SteamClient, SteamCache, SteamApiError, post_form, throttled
+from throttle import Throttle, page_title
+
+# the browser mode needs these. the http crawl doesn't.
+try:
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+    import geckodriver_autoinstaller
+except ImportError:
+    webdriver = None
+
+CATALOGUE_URL = "https://catalogue.smods.ru/"
+# links on the catalogue that aren't games
+IGNORED_LINKS = ["Home", "About Us", "Privacy Policy", "Cookie Policy", "How To Install Mods", "Catalogue"]
+# entries verified more recently than this get left alone
+DEFAULT_MAX_AGE_DAYS = 7
 
 # setup logging. if it crashes, i want to know why.
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,14 +40,23 @@ def setup_driver():
     driver = webdriver.Firefox(options=options)
     return driver
 
-def scrape_presets():
+def visit(driver, url, throttle):
+    # firefox page loads wait their turn per host too. a captcha slows the host down like a 429 would.
+    with throttle.slot(url):
+        driver.get(url)
+    if throttle.report(url, title=driver.title):
+        raise ValueError(f"{url} wants a captcha")
+
+def scrape_presets(rate=2.0):
     driver = setup_driver()
     wait = WebDriverWait(driver, 10)
     presets = {}
+    # one firefox, so one page at a time anyway
+    throttle = Throttle(rate=rate, max_in_flight=1)
 
     try:
         logging.info("Navigating to catalogue...")
-        driver.get("https://catalogue.smods.ru/")
+        visit(driver, CATALOGUE_URL, throttle)
         
         # grab every link. yes, all of them. efficiency is for people with time.
         links = driver.find_elements(By.TAG_NAME, "a")
@@ -37,7 +66,7 @@ def scrape_presets():
             text = link.text.strip()
             if href and "smods.ru" in href and text:
                 # ignore the useless pages
-                if text in ["Home", "About Us", "Privacy Policy", "Cookie Policy", "How To Install Mods", "Catalogue"]:
+                if text in IGNORED_LINKS:
                     continue
                 if "archives" in href: # specific mods. not what i'm looking for.
                     continue
@@ -48,12 +77,7 @@ def scrape_presets():
         logging.info(f"Found {len(game_links)} potential game links.")
 
         # checking the popular ones. i don't care about your indie gem right now.
-        target_games = [
-            "Cities: Skylines", "Stellaris", "Hearts of Iron IV", "RimWorld", 
-            "Crusader Kings III", "Europa Universalis IV", "Darkest Dungeon", 
-            "Barotrauma", "Teardown", "Total War: WARHAMMER III", "Garry's Mod", 
-            "XCOM 2", "Sid Meier's Civilization VI", "Terraria", "Project Zomboid"
-        ]
+        target_games = list(BUILTIN_PRESETS)
         
         verified_count = 0
         
@@ -66,7 +90,7 @@ def scrape_presets():
 
             logging.info(f"Checking {name} at {url}...")
             try:
-                driver.get(url)
+                visit(driver, url, throttle)
                 
                 # click the first thing i see to guess the pattern.
                 try:
@@ -84,6 +108,10 @@ def scrape_presets():
                         app_match = re.search(r'app=(\d+)', url) or re.search(r'app=(\d+)', mod_url)
                         if app_match:
                             app_id = app_match.group(1)
+                        else:
+                            # the registry might already know it
+                            known = PRESETS.get(name)
+                            app_id = known["app_id"] if known else ""
                         
                         presets[name] = {
                             "app_id": app_id, 
@@ -105,11 +133,140 @@ def scrape_presets():
     finally:
         driver.quit()
 
-    # dump it all into a file and hope it works.
-    with open("verified_presets.json", "w") as f:
-        json.dump(presets, f, indent=4)
-    
-    logging.info(f"Saved {len(presets)} verified presets to verified_presets.json")
+    # merge it into what's there instead of nuking it.
+    merge_presets(presets)
+
+# --- http crawl. the whole catalogue, a few pages at a time, no firefox. ---
+
+def fetch_html(url, throttle=None, timeout=30):
+    # throttle is the same per-host limiter the harvester uses. it slows down when smods pushes back.
+    if not throttle:
+        return read_html(url, timeout)
+    with throttle.slot(url):
+        try:
+            page_url, html = read_html(url, timeout)
+        except urllib.error.HTTPError as e:
+            throttle.report(url, status=e.code)
+            raise
+    if throttle.report(url, title=page_title(html)):
+        raise ValueError(f"{url} wants a captcha")
+    return page_url, html
+
+def read_html(url, timeout=30):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        charset = response.headers.get_content_charset() or "utf-8"
+        return response.geturl(), response.read().decode(charset, errors="replace")
+
+def find_game_links(html, page_url):
+    games = {}
+    for anchor in parse_page(html).anchors:
+        href = urljoin(page_url, anchor["href"])
+        text = anchor["text"]
+        if not href or "smods.ru" not in href or not text:
+            continue
+        if text in IGNORED_LINKS or "archives" in href:
+            continue
+        games.setdefault(text, href)
+    return games
+
+APP_LINK_PATTERN = re.compile(r'(?:store\.steampowered\.com|steamcommunity\.com)/app/(\d+)')
+MOD_LINK_PATTERN = re.compile(r'steamcommunity\.com/sharedfiles/filedetails/\?id=(\d+)')
+
+def inspect_game(name, url, throttle):
+    # one game page -> base url, app id if the page gives it away, and a sample mod id if not
+    page_url, html = fetch_html(url, throttle)
+    app_id = parse_qs(urlparse(url).query).get("app", [""])[0]
+    if not app_id:
+        match = APP_LINK_PATTERN.search(html)
+        app_id = match.group(1) if match else ""
+
+    parsed = parse_page(html)
+    mod_url = next((urljoin(page_url, a["href"]) for a in parsed.anchors if a["in_article"] and a["href"]), None)
+    if not mod_url:
+        raise ValueError("no articles on the page")
+    origin = urlparse(mod_url)
+    result = {"name": name, "base_url": f"{origin.scheme}://{origin.netloc}", "app_id": app_id, "sample_mod_id": None}
+
+    if not app_id:
+        # the mod page links back to steam. steam knows the app. the number in the article url is
+        # the site's own post id, not a workshop id.
+        _, mod_html = fetch_html(mod_url, throttle)
+        match = MOD_LINK_PATTERN.search(mod_html)
+        result["sample_mod_id"] = match.group(1) if match else None
+    return result
+
+def merge_presets(found, now=None):
+    # updates the entries we found, keeps everything else. app ids never get blanked.
+    now = now or time.time()
+    existing = PRESETS.read_file()
+    for name, data in found.items():
+        old = existing.get(name, {})
+        entry = dict(old)
+        entry.update(data)
+        entry["app_id"] = data.get("app_id") or old.get("app_id", "")
+        entry["last_verified"] = now
+        existing[name] = entry
+    PRESETS.save_file(existing)
+    logging.info(f"Merged {len(found)} verified presets into {PRESETS.path} ({len(existing)} total)")
+
+def crawl_catalogue(workers=4, rate=2.0, max_age_days=DEFAULT_MAX_AGE_DAYS, steam=None):
+    # per host now, like the harvester. steam gets its own bucket.
+    throttle = Throttle(rate=rate, max_in_flight=workers)
+    logging.info("Fetching catalogue...")
+    page_url, html = fetch_html(CATALOGUE_URL, throttle)
+    games = find_game_links(html, page_url)
+    logging.info(f"Found {len(games)} potential game links.")
+
+    # only re-check what's stale
+    existing = PRESETS.read_file()
+    cutoff = time.time() - max_age_days * 86400
+    stale = {n: u for n, u in games.items() if (existing.get(n, {}).get("last_verified") or 0) < cutoff}
+    logging.info(f"{len(games) - len(stale)} fresh, checking {len(stale)}.")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(inspect_game, name, url, throttle): name for name, url in stale.items()}
+        for future, name in futures.items():
+            try:
+                results[name] = future.result()
+            except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+                logging.warning(f"Skipping {name}: {e}")
+
+    # whatever is still missing an app id gets looked up on steam in one go
+    samples = {r["sample_mod_id"]: name for name, r in results.items() if not r["app_id"] and r["sample_mod_id"]}
+    if samples:
+        steam = steam or SteamClient(post=throttled(post_form, throttle), cache=SteamCache())
+        try:
+            app_ids = steam.app_ids(list(samples))
+        except SteamApiError as e:
+            logging.warning(f"Steam lookup failed: {e}")
+            app_ids = {}
+        for mod_id, name in samples.items():
+            results[name]["app_id"] = app_ids.get(mod_id, "")
+
+    found = {}
+    for name, r in results.items():
+        found[name] = {"app_id": r["app_id"], "base_url": r["base_url"]}
+        logging.info(f"VERIFIED: {name} -> {r['base_url']} (app {r['app_id'] or '?'})")
+    if found:
+        merge_presets(found)
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="figures out which smods site belongs to which game.")
+    parser.add_argument('--full', action='store_true', help="crawl the whole catalogue over http instead of the popular games in firefox")
+    parser.add_argument('--workers', type=int, default=4, help="game pages fetched at once (--full)")
+    parser.add_argument('--rate', type=float, default=2.0, help="max requests per second per host. halves on its own if smods pushes back.")
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_DAYS, help="days before a verified entry gets checked again (--full)")
+    args = parser.parse_args()
+
+    if args.full:
+        crawl_catalogue(workers=args.workers, rate=args.rate, max_age_days=args.max_age)
+        return
+    if webdriver is None:
+        parser.error("browser mode needs selenium and geckodriver-autoinstaller. or use --full.")
+    scrape_presets(rate=args.rate)
 
 if __name__ == "__main__":
-    scrape_presets()
+    main()
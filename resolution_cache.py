@@ -0,0 +1,98 @@
+# filename: resolution_cache.py
+# remembers where mods live so we don't search smods for the same id every night.
+# (base_url, mod_id) -> article url, modsbase url, zip name/size. sqlite because it's just there.
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "mod_harvester"
+DEFAULT_CACHE_PATH = CACHE_DIR / "resolutions.sqlite"
+# a week. smods doesn't move pages around that often.
+DEFAULT_TTL = 7 * 24 * 3600
+
+FIELDS = ("article_url", "modsbase_url", "zip_name", "zip_size")
+
+
+def site_key(base_url):
+    # "https://site/" and "https://site" are the same site. the http engine strips it, -u may not.
+    return str(base_url).rstrip("/")
+
+
+class ResolutionCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # workers are threads. one connection, one lock, no drama.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS resolutions (
+                    base_url TEXT NOT NULL,
+                    mod_id TEXT NOT NULL,
+                    article_url TEXT,
+                    modsbase_url TEXT,
+                    zip_name TEXT,
+                    zip_size INTEGER,
+                    resolved_at REAL,
+                    checked_at REAL,
+                    PRIMARY KEY (base_url, mod_id)
+                )
+            """)
+
+    def get(self, base_url, mod_id):
+        # returns a dict, or None if we never saw it or it went stale
+        with self.lock:
+            row = self.db.execute(
+                "SELECT article_url, modsbase_url, zip_name, zip_size, resolved_at, checked_at "
+                "FROM resolutions WHERE base_url = ? AND mod_id = ?",
+                (site_key(base_url), str(mod_id)),
+            ).fetchone()
+        if not row or row[4] is None or row[4] + self.ttl < time.time():
+            return None
+        entry = dict(zip(FIELDS, row[:4]))
+        entry["resolved_at"], entry["checked_at"] = row[4], row[5]
+        return entry
+
+    def remember(self, base_url, mod_id, **fields):
+        # only overwrites what you pass. a fresh article url restarts the ttl clock.
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"unknown cache fields: {', '.join(sorted(unknown))}")
+        now = time.time()
+        values = [fields.get(name) for name in FIELDS]
+        resolved_at = now if fields.get("article_url") else None
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO resolutions (base_url, mod_id, article_url, modsbase_url, zip_name, zip_size, resolved_at, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (base_url, mod_id) DO UPDATE SET "
+                "article_url = COALESCE(excluded.article_url, article_url), "
+                "modsbase_url = COALESCE(excluded.modsbase_url, modsbase_url), "
+                "zip_name = COALESCE(excluded.zip_name, zip_name), "
+                "zip_size = COALESCE(excluded.zip_size, zip_size), "
+                "resolved_at = COALESCE(excluded.resolved_at, resolved_at), "
+                "checked_at = excluded.checked_at",
+                (site_key(base_url), str(mod_id), *values, resolved_at, now),
+            )
+
+    def sites(self, mod_id):
+        # base urls this mod was found on and is still fresh, newest first
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT base_url FROM resolutions WHERE mod_id = ? AND article_url IS NOT NULL AND resolved_at >= ? ORDER BY resolved_at DESC",
+                (str(mod_id), cutoff),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def invalidate(self, base_url, mod_id):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM resolutions WHERE base_url = ? AND mod_id = ?", (site_key(base_url), str(mod_id)))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
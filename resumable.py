@@ -0,0 +1,230 @@
+# filename: resumable.py
+# downloads a file with http range requests, remembers how far it got, and picks up
+# from there next time. big files can be split into segments fetched side by side.
+import re
+import json
+import shutil
+import time
+import logging
+import threading
+import urllib.request
+import urllib.error
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+
+PARTIAL_SUFFIX = ".partial"
+META_SUFFIX = ".partial.json"
+# below this it's not worth opening more connections
+DEFAULT_SEGMENT_THRESHOLD = 64 * 2**20
+# how often progress gets written down, in bytes per segment
+SAVE_EVERY = 4 * 2**20
+
+
+class ResumeError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def filename_from(response):
+    disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", disposition) or re.search(r'filename="?([^";]+)"?', disposition)
+    if match:
+        name = unquote(match.group(1).strip())
+    else:
+        name = unquote(Path(urlparse(response.geturl()).path).name)
+    return Path(name).name
+
+
+def total_size(response):
+    # "bytes 0-99/12345" -> 12345. falls back to content-length for a plain 200.
+    content_range = response.headers.get("Content-Range", "")
+    match = re.match(r"bytes \d+-\d+/(\d+)", content_range)
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    return int(length) if length and response.status == 200 else None
+
+
+class RangeDownloader:
+    def __init__(self, folder, opener=None, headers=None, timeout=30, chunk_size=1 << 16, segments=1, segment_threshold=DEFAULT_SEGMENT_THRESHOLD, throttle=None):
+        self.folder = Path(folder)
+        self.opener = opener or urllib.request.build_opener()
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.segments = max(1, segments)
+        self.segment_threshold = segment_threshold
+        # the same throttle the pages went through. every segment counts as a request to the host.
+        self.throttle = throttle
+        # file name -> size the server announced, for whoever checks the file later
+        self.expected = {}
+        self.lock = threading.Lock()
+
+    def open(self, url, start=None, end=None, referer=None):
+        if not self.throttle:
+            return self.request(url, start, end, referer)
+        with self.throttle.slot(url):
+            try:
+                response = self.request(url, start, end, referer)
+            except ResumeError as e:
+                self.throttle.report(url, status=e.status)
+                raise
+        self.throttle.report(url, status=response.status)
+        return response
+
+    def request(self, url, start=None, end=None, referer=None):
+        request = urllib.request.Request(url, headers=self.headers)
+        if referer:
+            request.add_header("Referer", referer)
+        if start is not None:
+            request.add_header("Range", f"bytes={start}-{'' if end is None else end}")
+        try:
+            return self.opener.open(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise ResumeError(f"http {e.code} for {url}", status=e.code) from e
+        except (urllib.error.URLError, OSError) as e:
+            raise ResumeError(f"could not reach {url}: {e}") from e
+
+    def paths(self, name):
+        return self.folder / (name + PARTIAL_SUFFIX), self.folder / (name + META_SUFFIX)
+
+    def load_meta(self, name, total):
+        partial, meta_path = self.paths(name)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("total") != total or not partial.exists():
+            # different file under the same name. start over.
+            return None
+        return meta
+
+    def save_meta(self, name, meta):
+        _, meta_path = self.paths(name)
+        tmp = meta_path.with_name(meta_path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        tmp.replace(meta_path)
+
+    def plan(self, total):
+        count = self.segments if total >= self.segment_threshold else 1
+        size = -(-total // count)
+        return [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+
+    def seed(self, name, total, source):
+        # firefox's .part is just the first n bytes of the file. use it as a head start.
+        partial, _ = self.paths(name)
+        source = Path(source)
+        if partial.exists() or not source.exists():
+            return None
+        have = min(source.stat().st_size, total)
+        with open(source, "rb") as src, open(partial, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+            dst.truncate(have)
+        logging.info(f"resuming {name} from {have} bytes the browser left behind.")
+        return {"total": total, "segments": [[0, total - 1, have]]}
+
+    def fetch_segment(self, url, name, meta, segment, referer, first_response=None):
+        partial, _ = self.paths(name)
+        start, end, done = segment
+        if start + done > end:
+            return
+        response = first_response or self.open(url, start + done, end, referer)
+        with response, open(partial, "r+b") as f:
+            if response.status != 206 and start + done > 0:
+                raise ResumeError(f"server ignored the range request for {name}")
+            f.seek(start + done)
+            unsaved = 0
+            while start + segment[2] <= end:
+                chunk = response.read(min(self.chunk_size, end - start - segment[2] + 1))
+                if not chunk:
+                    break
+                f.write(chunk)
+                segment[2] += len(chunk)
+                unsaved += len(chunk)
+                if unsaved >= SAVE_EVERY:
+                    f.flush()
+                    with self.lock:
+                        self.save_meta(name, meta)
+                    unsaved = 0
+        with self.lock:
+            self.save_meta(name, meta)
+        if start + segment[2] <= end:
+            raise ResumeError(f"connection dropped in {name} at byte {start + segment[2]}. run it again to resume.")
+
+    def download(self, url, referer=None, seed_from=None):
+        started = time.monotonic()
+        first = self.open(url, 0, None, referer)
+        name = filename_from(first)
+        if not name:
+            first.close()
+            raise ResumeError("server didn't say what the file is called")
+        total = total_size(first)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        partial, _ = self.paths(name)
+
+        if total is None or first.status != 206:
+            # no ranges, no resume. just stream it like a caveman.
+            logging.info(f"{name}: server doesn't do ranges. downloading in one go.")
+            with first, open(partial, "wb") as f:
+                while True:
+                    chunk = first.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            return self.finish(name, total, started)
+
+        meta = self.load_meta(name, total) or (self.seed(name, total, seed_from) if seed_from else None)
+        if meta:
+            first.close()
+            first = None
+            done = sum(s[2] for s in meta["segments"])
+            logging.info(f"{name}: resuming at {done}/{total} bytes.")
+        else:
+            meta = {"total": total, "segments": self.plan(total)}
+            with open(partial, "wb") as f:
+                f.truncate(total)
+            if len(meta["segments"]) > 1:
+                first.close()
+                first = None
+                logging.info(f"{name}: {total} bytes in {len(meta['segments'])} segments.")
+        meta["url"] = url
+        self.save_meta(name, meta)
+
+        segments = meta["segments"]
+        if len(segments) == 1:
+            self.fetch_segment(url, name, meta, segments[0], referer, first)
+        else:
+            errors = []
+
+            def run(segment):
+                try:
+                    self.fetch_segment(url, name, meta, segment, referer)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=run, args=(segment,)) for segment in segments]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if errors:
+                raise errors[0]
+        return self.finish(name, total, started)
+
+    def finish(self, name, total, started):
+        partial, meta_path = self.paths(name)
+        size = partial.stat().st_size
+        if total is not None and size != total:
+            raise ResumeError(f"{name} is {size} bytes, expected {total}. keeping the partial file.")
+        if total is not None:
+            self.expected[name] = total
+        target = self.folder / name
+        partial.replace(target)
+        if meta_path.exists():
+            meta_path.unlink()
+        took = max(time.monotonic() - started, 1e-6)
+        logging.info(f"{name}: verified {size} bytes ({size / took / 2**20:.1f} MB/s).")
+        return target
@@ -0,0 +1,195 @@
+# filename: retry.py
+# failed mods used to get logged and forgotten. now they get a reason, a second (and third)
+# chance after the batch with growing waits, and a folder of evidence that nothing overwrites.
+import re
+import json
+import time
+import random
+import socket
+import logging
+import threading
+from pathlib import Path
+
+SEARCH_MISS = "search miss"
+TIMEOUT = "timeout"
+POPUP_LOOP = "popup loop"
+SITE_DOWN = "site down"
+OTHER = "error"
+# firefox wouldn't start. waiting won't install it.
+SETUP = "setup"
+# the download finished but the archive is cut off or has bad crcs (see verifier.py)
+CORRUPT = "corrupt archive"
+# a search miss won't fix itself by waiting. everything else might.
+RETRYABLE = (TIMEOUT, POPUP_LOOP, SITE_DOWN, CORRUPT, OTHER)
+
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 10
+DEFAULT_MAX_DELAY = 300
+# this many site-down failures in a row and we stop hammering it
+DEFAULT_DOWN_AFTER = 5
+# more spam tabs than this while handling one mod means we're going in circles
+POPUP_LOOP_THRESHOLD = 4
+
+SITE_DOWN_PATTERNS = re.compile(
+    r"502 bad gateway|503 service|service unavailable|gateway time-?out|origin is unreachable|"
+    r"web server is down|problem loading page|unable to connect|server not found|connection refused",
+    re.IGNORECASE,
+)
+
+
+class ModFailure(Exception):
+    # a failure we already know the kind of
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def classify(error, status=None, page_text=None, popups=0):
+    # exception (plus whatever we know about the page) -> one of the kinds above.
+    # a dead site makes everything else fail too, so that gets checked first.
+    status = status or getattr(error, "status", None)
+    message = str(error)
+    if status and (status >= 500 or status == 429):
+        return SITE_DOWN
+    if page_text and SITE_DOWN_PATTERNS.search(page_text):
+        return SITE_DOWN
+    if "could not reach" in message or isinstance(error, (ConnectionError, socket.gaierror)):
+        return SITE_DOWN
+    if isinstance(error, ModFailure):
+        return error.kind
+    if popups >= POPUP_LOOP_THRESHOLD:
+        return POPUP_LOOP
+    if "no search result" in message or "could not find result" in message:
+        return SEARCH_MISS
+    if isinstance(error, (TimeoutError, socket.timeout)) or type(error).__name__ == "TimeoutException" or "timed out" in message or "gave up waiting" in message:
+        return TIMEOUT
+    return OTHER
+
+
+class RetryScheduler:
+    # keeps failed mods until their backoff is over. shared by all workers of a batch.
+    def __init__(self, retries=DEFAULT_RETRIES, base_delay=DEFAULT_RETRY_DELAY, max_delay=DEFAULT_MAX_DELAY, down_after=DEFAULT_DOWN_AFTER, rng=None):
+        self.retries = max(0, retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.down_after = down_after
+        self.rng = rng or random.Random()
+        self.attempts = {}   # mod id -> attempts so far
+        self.pending = {}    # mod id -> monotonic time it may run again
+        self.failed = {}     # mod id -> kind, for the ones that are out of chances
+        self.down_streak = 0
+        self.stopped = False
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def delay(self, attempt):
+        # exponential, capped, with half of it random so workers don't all come back at once
+        base = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return base / 2 + self.rng.uniform(0, base / 2)
+
+    def started(self, mod_id):
+        with self.cond:
+            self.attempts[mod_id] = self.attempts.get(mod_id, 0) + 1
+            self.in_flight += 1
+
+    def succeeded(self, mod_id):
+        with self.cond:
+            self.in_flight -= 1
+            self.down_streak = 0
+            self.failed.pop(mod_id, None)
+            self.cond.notify_all()
+
+    def failed_with(self, mod_id, kind):
+        # returns True if it got requeued
+        with self.cond:
+            self.in_flight -= 1
+            self.down_streak = self.down_streak + 1 if kind == SITE_DOWN else 0
+            if self.down_after and self.down_streak >= self.down_after and not self.stopped:
+                self.stopped = True
+                logging.error(f"{self.down_streak} failures in a row look like the site is down. stopping early.")
+            attempt = self.attempts.get(mod_id, 1)
+            if self.stopped or kind not in RETRYABLE or attempt > self.retries:
+                self.failed[mod_id] = kind
+                self.cond.notify_all()
+                return False
+            wait = self.delay(attempt)
+            self.pending[mod_id] = time.monotonic() + wait
+            logging.info(f"{mod_id}: {kind}. retrying in {wait:.0f}s (attempt {attempt + 1}/{self.retries + 1}).")
+            self.cond.notify_all()
+            return True
+
+    def next_due(self):
+        # blocks until a retry is due. None once nothing is pending and nothing could still fail.
+        with self.cond:
+            while True:
+                if self.stopped:
+                    for mod_id in self.pending:
+                        self.failed[mod_id] = SITE_DOWN
+                    self.pending.clear()
+                    return None
+                if self.pending:
+                    mod_id = min(self.pending, key=self.pending.get)
+                    wait = self.pending[mod_id] - time.monotonic()
+                    if wait <= 0:
+                        del self.pending[mod_id]
+                        return mod_id
+                    self.cond.wait(wait)
+                elif self.in_flight:
+                    self.cond.wait()
+                else:
+                    return None
+
+    def skipped(self, mod_ids):
+        # never tried because we stopped early
+        with self.cond:
+            for mod_id in mod_ids:
+                self.failed.setdefault(mod_id, SITE_DOWN)
+
+
+class RunDirectory:
+    # one folder per run. diagnostics per mod and attempt, failed ids at the end.
+    def __init__(self, root):
+        self.root = Path(root)
+        self.lock = threading.Lock()
+
+    def mod_folder(self, mod_id):
+        folder = self.root / "mods" / str(mod_id)
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder
+
+    def next_attempt(self, mod_id):
+        with self.lock:
+            folder = self.mod_folder(mod_id)
+            attempt = 1 + sum(1 for p in folder.glob("attempt_*.json"))
+            return folder, f"attempt_{attempt}"
+
+    def record(self, mod_id, kind, error, url=None, screenshot=None, page_source=None):
+        # screenshot is a callable that saves a png to the path it's given. firefox does it that way.
+        folder, stem = self.next_attempt(mod_id)
+        info = {"mod_id": mod_id, "kind": kind, "error": str(error), "url": url, "time": time.time()}
+        if screenshot:
+            try:
+                screenshot(str(folder / f"{stem}.png"))
+                info["screenshot"] = f"{stem}.png"
+            except Exception as e:
+                logging.warning(f"{mod_id}: could not save a screenshot: {e}")
+        if page_source:
+            with open(folder / f"{stem}.html", "w", encoding="utf-8") as f:
+                f.write(page_source)
+            info["page_source"] = f"{stem}.html"
+        with open(folder / f"{stem}.json", "w") as f:
+            json.dump(info, f, indent=2)
+        logging.info(f"{mod_id}: diagnostics saved to {folder}")
+        return folder
+
+    def write_failed(self, failed):
+        # mod id -> what went wrong. the ids go one per line, so the file works with -f as-is.
+        if not failed:
+            return None
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / "failed_ids.txt"
+        with open(path, "w") as f:
+            f.write("".join(f"{mod_id}\n" for mod_id in failed))
+        with open(self.root / "failures.json", "w") as f:
+            json.dump(failed, f, indent=2)
+        return path
@@ -0,0 +1,199 @@
+# filename: session_pool.py
+# keeps firefox windows warm between jobs so short runs don't pay for startup every time.
+# use it from python (SessionPool) or run it as a little local daemon (serve / submit).
+import json
+import time
+import queue
+import socket
+import logging
+import threading
+import socketserver
+
+from retry import CORRUPT
+from memory_budget import DEFAULT_RECYCLE_AFTER, DEFAULT_MAX_RSS_MB
+
+DEFAULT_PORT = 8765
+
+
+class PoolClosedError(Exception):
+    pass
+
+
+class Session:
+    def __init__(self, index, harvester):
+        self.index = index
+        self.harvester = harvester
+        self.mods_done = 0
+        self.started = time.time()
+        self.start_rss = None
+
+    def stats(self):
+        rss = self.harvester.browser_rss()
+        return {
+            "session": self.index,
+            "mods_done": self.mods_done,
+            "age": round(time.time() - self.started),
+            "rss_mb": round(rss / 2**20) if rss else None,
+        }
+
+
+class SessionPool:
+    def __init__(self, owner, size=1, recycle_after=DEFAULT_RECYCLE_AFTER, max_rss_mb=DEFAULT_MAX_RSS_MB):
+        # owner is a ModHarvester. sessions are its workers, so archives end up in its folder.
+        self.owner = owner
+        self.size = max(1, size)
+        self.recycle_after = recycle_after
+        self.max_rss = max_rss_mb * 2**20 if max_rss_mb else None
+        self.idle = queue.Queue()
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+        owner.download_folder.mkdir(parents=True, exist_ok=True)
+        owner.start_pipeline()
+        for index in range(self.size):
+            session = Session(index, owner.spawn_worker(index))
+            self.start(session)
+            self.sessions.append(session)
+            self.idle.put(session)
+        logging.info(f"session pool ready: {self.size} warm firefox sessions.")
+
+    def start(self, session):
+        session.harvester.download_folder.mkdir(parents=True, exist_ok=True)
+        session.harvester.setup_driver()
+        session.mods_done = 0
+        session.started = time.time()
+        session.start_rss = session.harvester.browser_rss()
+
+    def recycle(self, session, reason):
+        logging.info(f"recycling session {session.index}: {reason}")
+        session.harvester.quit_driver()
+        self.start(session)
+
+    def needs_recycle(self, session):
+        if self.recycle_after and session.mods_done >= self.recycle_after:
+            return f"did {session.mods_done} mods"
+        rss = session.harvester.browser_rss()
+        if self.max_rss and rss and rss > self.max_rss:
+            return f"firefox is at {rss // 2**20} MB"
+        return None
+
+    def download(self, target, base_url=None, app_id=None):
+        # target is a workshop url or a bare mod id. blocks until a session is free.
+        if self.closed:
+            raise PoolClosedError("pool is closed")
+        session = self.idle.get()
+        try:
+            if not session.harvester.driver_healthy():
+                self.recycle(session, "failed health check")
+            result = self.run_job(session, target, base_url, app_id)
+            session.mods_done += 1
+            reason = self.needs_recycle(session)
+            if reason:
+                self.recycle(session, reason)
+            return result
+        finally:
+            self.idle.put(session)
+
+    def run_job(self, session, target, base_url, app_id):
+        harvester = session.harvester
+        harvester.base_url = base_url
+        harvester.app_id = app_id
+        if str(target).isdigit():
+            mod_id = str(target)
+            harvester.base_url = base_url or self.owner.base_url
+            if not harvester.base_url:
+                return {"target": target, "ok": False, "error": "bare mod id needs a base_url"}
+        else:
+            mod_id, app_id, resolved_base = harvester.resolve_steam_url(target)
+            if not mod_id:
+                return {"target": target, "ok": False, "error": "could not parse mod id"}
+            harvester.app_id, harvester.base_url = app_id, resolved_base
+
+        started = time.time()
+        ok = harvester.fetch_mod(mod_id)
+        if harvester.driver:
+            harvester.wait_for_downloads()
+        if self.owner.verifier:
+            # the manifest only gets archives that passed. a broken one is already out of owner.downloads by now.
+            self.owner.verifier.wait(mod_id)
+        with self.lock:
+            self.owner.record_downloads([mod_id])
+        failure = None if ok else self.owner.failures.get(mod_id)
+        if ok and mod_id in self.owner.corrupt and mod_id not in self.owner.downloads:
+            failure = {"kind": CORRUPT, "error": self.owner.corrupt[mod_id]["error"]}
+        if ok:
+            self.owner.failures.pop(mod_id, None)
+        return {
+            "target": target,
+            "mod_id": mod_id,
+            "ok": bool(ok) and mod_id in self.owner.downloads,
+            "error": f"{failure['kind']}: {failure['error']}" if failure else None,
+            "archive": self.owner.downloads.get(mod_id),
+            "seconds": round(time.time() - started, 2),
+            "session": session.index,
+        }
+
+    def status(self):
+        return {"sessions": [s.stats() for s in self.sessions], "idle": self.idle.qsize()}
+
+    def close(self):
+        self.closed = True
+        for session in self.sessions:
+            session.harvester.quit_driver()
+        self.owner.finish_pipeline()
+        self.owner.finish_metrics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- daemon. one json object per line in, one per line out. localhost only. ---
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                job = json.loads(line)
+                if job.get("cmd") == "status":
+                    result = self.server.pool.status()
+                else:
+                    result = self.server.pool.download(job["target"], job.get("base_url"), job.get("app_id"))
+            except Exception as e:
+                result = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+
+class Daemon(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, pool, port=DEFAULT_PORT):
+        self.pool = pool
+        super().__init__(("127.0.0.1", port), DaemonHandler)
+
+
+def serve(pool, port=DEFAULT_PORT):
+    with Daemon(pool, port) as server:
+        logging.info(f"daemon listening on 127.0.0.1:{port}. ctrl+c to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("shutting down.")
+        finally:
+            pool.close()
+
+
+def submit(targets, port=DEFAULT_PORT, base_url=None, app_id=None, timeout=None):
+    # sends jobs to a running daemon, yields the results as they come back
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        stream = sock.makefile("rwb")
+        for target in targets:
+            job = {"target": target, "base_url": base_url, "app_id": app_id}
+            stream.write((json.dumps(job) + "\n").encode())
+            stream.flush()
+            yield json.loads(stream.readline())
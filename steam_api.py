@@ -0,0 +1,189 @@
+# filename: steam_api.py
+# talks to the steam web api instead of loading workshop pages in firefox.
+# no api key needed for these. valve is generous sometimes.
+import json
+import time
+import logging
+import sqlite3
+import threading
+import urllib.request
+import urllib.error
+from urllib.parse import urlencode, urlparse, parse_qs
+
+from resolution_cache import CACHE_DIR
+
+PUBLISHED_FILE_DETAILS_URL = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
+COLLECTION_DETAILS_URL = "https://api.steampowered.com/ISteamRemoteStorage/GetCollectionDetails/v1/"
+DEFAULT_STEAM_CACHE_PATH = CACHE_DIR / "steam.sqlite"
+# app ids and dependency lists barely change. a day is fine.
+DEFAULT_STEAM_TTL = 24 * 3600
+# what GetCollectionDetails calls a child that is itself a collection
+FILETYPE_COLLECTION = 2
+# steam doesn't document a limit. 100 per request hasn't made it angry yet.
+BATCH_SIZE = 100
+
+
+class SteamApiError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def post_form(url, fields, timeout=30):
+    # the default http layer. swap it out if you want canned responses.
+    data = urlencode(fields).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        raise SteamApiError(f"steam api request to {url} failed: {e}", status=e.code) from e
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise SteamApiError(f"steam api request to {url} failed: {e}") from e
+
+
+def throttled(post, throttle):
+    # the same http layer, but every request waits its turn in the throttle
+    def send(url, fields, timeout=30):
+        with throttle.slot(url):
+            try:
+                result = post(url, fields, timeout=timeout)
+            except SteamApiError as e:
+                throttle.report(url, status=e.status)
+                raise
+        throttle.report(url)
+        return result
+    return send
+
+
+def parse_mod_id(text):
+    # "2858562094" or ".../filedetails/?id=2858562094" -> "2858562094". None if neither.
+    text = str(text).strip()
+    if text.isdigit():
+        return text
+    return parse_qs(urlparse(text).query).get("id", [None])[0]
+
+
+def batched_fields(count_name, ids):
+    fields = {count_name: len(ids)}
+    for i, mod_id in enumerate(ids):
+        fields[f"publishedfileids[{i}]"] = mod_id
+    return fields
+
+
+def get_published_file_details(mod_ids, post=post_form):
+    # mod id -> whatever steam says about it. ids steam doesn't know are just missing.
+    mod_ids = list(dict.fromkeys(str(m) for m in mod_ids))
+    details = {}
+    for start in range(0, len(mod_ids), BATCH_SIZE):
+        batch = mod_ids[start:start + BATCH_SIZE]
+        data = post(PUBLISHED_FILE_DETAILS_URL, batched_fields("itemcount", batch))
+        for item in data.get("response", {}).get("publishedfiledetails", []):
+            # result 1 means ok. anything else is steam shrugging.
+            if item.get("result") == 1:
+                details[str(item["publishedfileid"])] = item
+        logging.info(f"steam api: got details for {len(batch)} ids ({start + len(batch)}/{len(mod_ids)})")
+    return details
+
+
+def get_collection_children(ids, post=post_form):
+    # id -> [(child id, filetype)]. for a collection that's its contents,
+    # for a normal item it's the stuff it requires.
+    ids = list(dict.fromkeys(str(m) for m in ids))
+    children = {}
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        data = post(COLLECTION_DETAILS_URL, batched_fields("collectioncount", batch))
+        # no children is an answer too. remember it so we don't keep asking.
+        children.update((mod_id, []) for mod_id in batch)
+        for item in data.get("response", {}).get("collectiondetails", []):
+            kids = item.get("children", []) if item.get("result") == 1 else []
+            kids = sorted(kids, key=lambda k: k.get("sortorder", 0))
+            children[str(item["publishedfileid"])] = [(str(k["publishedfileid"]), k.get("filetype", 0)) for k in kids]
+    return children
+
+
+class SteamCache:
+    # json blobs in sqlite, keyed by (kind, id). kinds are "details" and "children".
+    def __init__(self, path=DEFAULT_STEAM_CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (kind TEXT NOT NULL, key TEXT NOT NULL, "
+                "value TEXT NOT NULL, fetched_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+            )
+
+    def get_many(self, kind, keys, max_age):
+        found = {}
+        cutoff = time.time() - max_age
+        with self.lock:
+            for key in keys:
+                row = self.db.execute(
+                    "SELECT value FROM entries WHERE kind = ? AND key = ? AND fetched_at >= ?", (kind, key, cutoff)
+                ).fetchone()
+                if row:
+                    found[key] = json.loads(row[0])
+        return found
+
+    def put_many(self, kind, values):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO entries (kind, key, value, fetched_at) VALUES (?, ?, ?, ?)",
+                [(kind, key, json.dumps(value), now) for key, value in values.items()],
+            )
+
+
+class SteamClient:
+    # bulk lookups with a cache in front. post is the http layer, swap it for tests.
+    def __init__(self, post=post_form, cache=None, ttl=DEFAULT_STEAM_TTL):
+        self.post = post
+        self.cache = cache
+        self.ttl = ttl
+
+    def cached(self, kind, ids, fetch, max_age):
+        ids = list(dict.fromkeys(str(m) for m in ids))
+        found = self.cache.get_many(kind, ids, max_age) if self.cache and max_age else {}
+        missing = [m for m in ids if m not in found]
+        if missing:
+            fresh = fetch(missing, post=self.post)
+            if self.cache:
+                self.cache.put_many(kind, fresh)
+            found.update(fresh)
+        return found
+
+    def details(self, ids, max_age=None):
+        # max_age=0 forces a fresh lookup. sync mode wants that for time_updated.
+        return self.cached("details", ids, get_published_file_details, self.ttl if max_age is None else max_age)
+
+    def children(self, ids, max_age=None):
+        return self.cached("children", ids, get_collection_children, self.ttl if max_age is None else max_age)
+
+    def app_ids(self, ids):
+        return {m: str(d.get("consumer_app_id")) for m, d in self.details(ids).items() if d.get("consumer_app_id")}
+
+    def expand(self, collection_ids, include_dependencies=True):
+        # walks collections (and collections inside collections) and returns the mod ids in order.
+        # with include_dependencies, things the mods require come along too.
+        items = []
+        seen = set()
+        frontier = [str(c) for c in collection_ids]
+        seen.update(frontier)
+        while frontier:
+            children = self.children(frontier)
+            next_frontier = []
+            for parent in frontier:
+                for child, filetype in children.get(parent, []):
+                    if child in seen:
+                        continue
+                    seen.add(child)
+                    if filetype == FILETYPE_COLLECTION:
+                        next_frontier.append(child)
+                    else:
+                        items.append(child)
+                        if include_dependencies:
+                            next_frontier.append(child)
+            frontier = next_frontier
+        logging.info(f"expanded {len(collection_ids)} collections into {len(items)} mods.")
+        return items
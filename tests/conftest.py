@@ -0,0 +1,5 @@
+# the modules live next to each other at the top of the repo, not in a package
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,81 @@
+# the shared archive store: one copy per archive, links out, and gc of what nobody uses
+import os
+import time
+import zipfile
+
+import pytest
+
+from archive_store import ArchiveStore
+from extractor import extract_archive
+
+
+def make_zip(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mod.cpp", text)
+    return path
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArchiveStore(tmp_path / "store", link="hardlink")
+    yield store
+    store.close()
+
+
+def test_same_archive_in_two_folders_is_stored_once(store, tmp_path):
+    first = make_zip(tmp_path / "a" / "42.zip", "same")
+    second = make_zip(tmp_path / "b" / "42.zip", "same")
+    assert store.add("42", first) == store.add("42", second)
+    assert os.path.samefile(first, second)
+    assert store.stats()["objects"] == 1 and store.stats()["refs"] == 2
+
+
+def test_checkout_only_hands_out_the_current_version(store, tmp_path):
+    store.add("42", make_zip(tmp_path / "a" / "42.zip", "v1"), steam_updated=100)
+    assert store.checkout("42", tmp_path / "c", steam_updated=200) is None
+    assert store.checkout("42", tmp_path / "c", steam_updated=100)["archive"] == "42.zip"
+    assert (tmp_path / "c" / "42.zip").exists()
+
+
+def test_gc_drops_stale_refs_and_unused_archives_and_their_trees(store, tmp_path):
+    keep = make_zip(tmp_path / "a" / "1.zip", "kept")
+    gone = make_zip(tmp_path / "a" / "2.zip", "dropped")
+    changed = make_zip(tmp_path / "b" / "1.zip", "kept")
+    store.add("1", keep)
+    store.add("2", gone)
+    store.add("1", changed)
+    # shared trees for both, plus an extraction that's still going on
+    for archive in (keep, gone):
+        extract_archive(archive, tmp_path / "out" / archive.stem, tree_root=store.trees, link="hardlink")
+    (store.trees / ".staging").mkdir(exist_ok=True)
+    assert store.stats()["trees"] == 2
+
+    gone.unlink()
+    # replaced by something else under the same name. the ref is stale, the object is still used by a/1.zip.
+    changed.unlink()
+    changed.write_bytes(b"something else entirely")
+
+    before = store.stats()
+    assert store.gc(dry_run=True) == {"refs": 2, "objects": 1, "bytes": before["bytes"] - keep.stat().st_size, "trees": 1}
+    assert store.stats() == before
+
+    result = store.gc()
+    assert (result["refs"], result["objects"], result["trees"]) == (2, 1, 1)
+    assert store.stats()["objects"] == 1 and store.stats()["refs"] == 1 and store.stats()["trees"] == 1
+    assert store.lookup("2") is None
+    assert store.lookup("1") is not None
+    assert (store.trees / ".staging").exists()
+
+
+def test_gc_keeps_young_unreferenced_archives(store, tmp_path, monkeypatch):
+    archive = make_zip(tmp_path / "a" / "2.zip", "dropped")
+    store.add("2", archive)
+    archive.unlink()
+    assert store.gc(keep_days=1)["objects"] == 0
+    assert store.lookup("2") is not None
+    # two days later it's fair game
+    now = time.time() + 2 * 86400
+    monkeypatch.setattr("archive_store.time.time", lambda: now)
+    assert store.gc(keep_days=1)["objects"] == 1
+    assert store.lookup("2") is None
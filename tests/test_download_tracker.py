@@ -0,0 +1,50 @@
+# the tracker watching a download folder the way firefox fills it
+from download_tracker import DownloadTracker
+
+
+def tracker(folder, done):
+    return DownloadTracker(folder, stall_after=60, poll_interval=0, report_every=0, on_complete=lambda mod_id, name: done.append((mod_id, name)))
+
+
+def test_claims_the_new_zip_and_nothing_else(tmp_path):
+    done = []
+    t = tracker(tmp_path, done)
+    before = t.snapshot()
+    (tmp_path / ".manifest.lock").write_text("")
+    (tmp_path / "index.json").write_text("{}")
+    (tmp_path / ".staging").mkdir()
+    assert t.claim("42", before) is None
+    (tmp_path / "42.zip.part").write_bytes(b"x" * 10)
+    assert t.claim("42", before) == "42.zip"
+    t.poll()
+    assert done == [] and t.pending()
+    (tmp_path / "42.zip.part").rename(tmp_path / "42.zip")
+    t.poll()
+    assert done == [("42", "42.zip")]
+    assert t.is_done("42.zip")
+
+
+def test_same_name_gets_claimed_again_after_quarantine(tmp_path):
+    done = []
+    t = tracker(tmp_path, done)
+    before = t.snapshot()
+    (tmp_path / "42.zip").write_bytes(b"broken")
+    assert t.claim("42", before) == "42.zip"
+    t.poll()
+    # the verifier moved it aside and the mod got requeued. firefox saves it under the same name.
+    (tmp_path / "42.zip").rename(tmp_path / "42.zip.corrupt")
+    before = t.snapshot()
+    (tmp_path / "42.zip.part").write_bytes(b"good")
+    assert t.claim("42", before) == "42.zip"
+    assert not t.is_done("42.zip")
+    (tmp_path / "42.zip.part").rename(tmp_path / "42.zip")
+    t.poll()
+    assert done == [("42", "42.zip"), ("42", "42.zip")]
+
+
+def test_running_download_is_not_claimed_twice(tmp_path):
+    t = tracker(tmp_path, [])
+    before = t.snapshot()
+    (tmp_path / "42.zip.part").write_bytes(b"x")
+    assert t.claim("42", before) == "42.zip"
+    assert t.claim("43", before) is None
@@ -0,0 +1,89 @@
+# mirror probes and the circuit breaker
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import endpoints
+from endpoints import EndpointManager
+from retry import ModFailure, SITE_DOWN
+from throttle import Throttle
+
+
+class FrontPageHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status, body = self.server.front
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FrontPageHandler)
+    server.front = (200, b"<html><head><title>Mods</title></head><body>ok</body></html>")
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class CountingThrottle(Throttle):
+    def __init__(self):
+        super().__init__(rate=0, max_in_flight=1)
+        self.reports = []
+
+    def report(self, url, status=None, title=None):
+        self.reports.append((status, title))
+        return super().report(url, status, title)
+
+
+def test_probe_goes_through_the_throttle(server):
+    throttle = CountingThrottle()
+    manager = EndpointManager(path=None, throttle=throttle)
+    assert manager.probe(server.url).ok
+    assert throttle.reports == [(200, "Mods")]
+    server.front = (429, b"slow down")
+    assert not manager.probe(server.url).ok
+    assert throttle.reports[-1][0] == 429
+    # the 429 slowed the host down for everything else too
+    assert throttle.bucket(server.url).rate > 0
+
+
+def test_error_page_counts_as_down(server):
+    server.front = (200, b"<html><head><title>502 Bad Gateway</title></head><body>nginx</body></html>")
+    assert not EndpointManager(path=None).probe(server.url).ok
+
+
+def test_circuit_opens_after_enough_failures_and_closes_on_success(server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(endpoints.time, "time", lambda: now[0])
+    manager = EndpointManager(path=None, break_after=3, cooldown=60)
+    for _ in range(2):
+        manager.failed(server.url)
+    assert manager.choose(server.url) == server.url
+    manager.failed(server.url)
+    with pytest.raises(ModFailure) as e:
+        manager.choose(server.url)
+    assert e.value.kind == SITE_DOWN
+
+    # after the cooldown one try is allowed. failing it doubles the wait.
+    now[0] += 61
+    assert manager.endpoint(server.url).state(now[0]) == "half-open"
+    assert manager.choose(server.url) == server.url
+    manager.failed(server.url)
+    assert manager.endpoint(server.url).cooldown == 120
+    assert manager.endpoint(server.url).state(now[0] + 100) == "open"
+
+    now[0] += 121
+    manager.succeeded(server.url)
+    endpoint = manager.endpoint(server.url)
+    assert endpoint.state(now[0]) == "closed"
+    assert (endpoint.failures, endpoint.cooldown) == (0, 60)
@@ -0,0 +1,59 @@
+# unzipping into mod folders: traversal, bad crcs, and the same mod coming back in one run
+import zipfile
+
+import pytest
+
+from extractor import extract_archive, ExtractionPipeline, UnsafeArchiveError, MARKER_NAME, STAGING_NAME
+
+
+def make_zip(path, files, compression=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, "w", compression) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return path
+
+
+def test_extracts_and_then_skips_an_unchanged_archive(tmp_path):
+    archive = make_zip(tmp_path / "42.zip", {"mod.cpp": "a", "addons/a.pbo": b"x" * 100})
+    result = extract_archive(archive, tmp_path / "out" / "42")
+    assert result["status"] == "extracted" and result["files"] == 2
+    assert (tmp_path / "out" / "42" / "addons" / "a.pbo").read_bytes() == b"x" * 100
+    assert (tmp_path / "out" / "42" / MARKER_NAME).exists()
+    assert extract_archive(archive, tmp_path / "out" / "42")["status"] == "skipped"
+
+
+@pytest.mark.parametrize("name", ["../evil.txt", "addons/../../evil.txt", "/tmp/evil.txt"])
+def test_entries_outside_the_folder_are_refused(tmp_path, name):
+    archive = make_zip(tmp_path / "42.zip", {"mod.cpp": "a", name: "pwned"})
+    with pytest.raises(UnsafeArchiveError):
+        extract_archive(archive, tmp_path / "out" / "42")
+    assert not (tmp_path / "out" / "evil.txt").exists()
+    assert not (tmp_path / "out" / "42").exists()
+    # nothing half done left in staging either
+    assert not any((tmp_path / "out" / STAGING_NAME).iterdir())
+
+
+def test_bad_crc_leaves_the_old_folder_alone(tmp_path):
+    target = tmp_path / "out" / "42"
+    extract_archive(make_zip(tmp_path / "old.zip", {"mod.cpp": "old"}), target)
+    archive = make_zip(tmp_path / "42.zip", {"mod.cpp": b"\0" * 4096}, zipfile.ZIP_STORED)
+    data = bytearray(archive.read_bytes())
+    data[data.index(b"\0" * 64) + 100] ^= 0xFF
+    archive.write_bytes(bytes(data))
+    with pytest.raises(zipfile.BadZipFile):
+        extract_archive(archive, target)
+    assert (target / "mod.cpp").read_text() == "old"
+
+
+def test_pipeline_extracts_a_mod_again_after_a_new_download(tmp_path):
+    done = []
+    pipeline = ExtractionPipeline(tmp_path, workers=1, on_done=lambda mod_id, result: done.append(result["status"]))
+    try:
+        pipeline.submit("42", make_zip(tmp_path / "42.zip", {"mod.cpp": "first"})).result()
+        # same mod, downloaded again in the same run with different contents
+        make_zip(tmp_path / "42.zip", {"mod.cpp": "second"})
+        pipeline.submit("42", tmp_path / "42.zip").result()
+    finally:
+        pipeline.close()
+    assert done == ["extracted", "extracted"]
+    assert (tmp_path / "42" / "mod.cpp").read_text() == "second"
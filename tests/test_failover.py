@@ -0,0 +1,68 @@
+# a site named by -u or the cache gets used as is. mirrors only come into it once it failed.
+import pytest
+
+from mod_harvester import ModHarvester
+from retry import RetryScheduler, ModFailure, SITE_DOWN
+
+SITE = "https://hearts-of-iron-4.smods.ru"
+MIRROR = "https://catalogue.smods.ru"
+
+
+class FakeEndpoints:
+    def __init__(self):
+        self.chosen, self.good, self.bad = [], [], []
+
+    def choose(self, site):
+        self.chosen.append(site)
+        return MIRROR
+
+    def succeeded(self, url):
+        self.good.append(url)
+
+    def failed(self, url):
+        self.bad.append(url)
+
+
+@pytest.fixture
+def harvester(tmp_path):
+    harvester = ModHarvester(base_url=SITE, download_folder=tmp_path, engine="http", cache_path=None)
+    harvester.endpoints = FakeEndpoints()
+    return harvester
+
+
+def fetch(harvester, results):
+    # fetch_mod stand-in. True, or the failure kind to record.
+    def fetch_mod(mod_id):
+        result = results.pop(0)
+        if result is True:
+            return True
+        harvester.record_failure(mod_id, ModFailure(result, "site is down"))
+        return False
+    return fetch_mod
+
+
+def test_known_site_skips_the_probe_until_it_fails(harvester):
+    harvester.site_known = True
+    worker = harvester.spawn_worker(0)
+    assert worker.site_known
+    worker.fetch_mod = fetch(worker, [SITE_DOWN, True])
+    scheduler = RetryScheduler(retries=2, base_delay=0)
+
+    assert harvester.attempt(worker, "42", scheduler, SITE) == (False, False)
+    assert harvester.endpoints.chosen == []
+    assert harvester.endpoints.bad == [SITE]
+
+    # the retry is a failover: now the mirrors get a say
+    assert harvester.attempt(worker, "42", scheduler, SITE) == (True, True)
+    assert harvester.endpoints.chosen == [SITE]
+    assert harvester.endpoints.good == [MIRROR]
+    assert worker.base_url == MIRROR
+
+
+def test_unknown_site_and_group_children_probe(harvester):
+    harvester.site_known = True
+    child = harvester.spawn_worker(0, base_url=MIRROR)
+    assert not child.site_known
+    child.fetch_mod = fetch(child, [True])
+    assert harvester.attempt(child, "42", RetryScheduler(), MIRROR) == (True, True)
+    assert harvester.endpoints.chosen == [MIRROR]
@@ -0,0 +1,33 @@
+# linking archives and folders into place, and what happens where reflinks aren't a thing
+import filelinks
+from filelinks import materialize, materialize_tree
+
+
+def test_without_fcntl_auto_falls_back_to_a_hardlink(tmp_path, monkeypatch):
+    monkeypatch.setattr(filelinks, "fcntl", None)
+    source = tmp_path / "42.zip"
+    source.write_bytes(b"zip")
+    assert materialize(source, tmp_path / "linked.zip") == "hardlink"
+    assert (tmp_path / "linked.zip").read_bytes() == b"zip"
+    assert not (tmp_path / "linked.zip.linking").exists()
+
+
+def test_without_fcntl_reflink_mode_copies(tmp_path, monkeypatch):
+    monkeypatch.setattr(filelinks, "fcntl", None)
+    source = tmp_path / "42.zip"
+    source.write_bytes(b"zip")
+    assert materialize(source, tmp_path / "copied.zip", mode="reflink") == "copy"
+    assert (tmp_path / "copied.zip").stat().st_ino != source.stat().st_ino
+
+
+def test_tree_replaces_the_old_folder(tmp_path):
+    source = tmp_path / "store" / "42"
+    (source / "addons").mkdir(parents=True)
+    (source / "mod.cpp").write_text("new")
+    (source / "addons" / "a.pbo").write_bytes(b"pbo")
+    target = tmp_path / "out" / "42"
+    target.mkdir(parents=True)
+    (target / "stale.txt").write_text("old")
+    counts = materialize_tree(source, target, mode="hardlink")
+    assert counts == {"hardlink": 2}
+    assert sorted(p.name for p in target.rglob("*")) == ["a.pbo", "addons", "mod.cpp"]
@@ -0,0 +1,140 @@
+# the http engine against saved smods and modsbase pages, served from localhost
+import io
+import zipfile
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from http_engine import HttpEngine, EngineError, COUNTDOWN_PATTERN
+from resolution_cache import ResolutionCache
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "http_engine"
+MOD_ID = "2858562094"
+
+
+def make_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("mod/readme.txt", "fixture mod\n")
+        zf.writestr("mod/data.bin", b"x" * 4096)
+    return buffer.getvalue()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, content_type, extra=None, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_fixture(self, name):
+        self.send_body((FIXTURES / name).read_bytes(), "text/html; charset=utf-8")
+
+    def send_zip(self):
+        self.send_body(self.server.archive, "application/zip", {"Content-Disposition": f'attachment; filename="{MOD_ID}.zip"'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.hits.append(("GET", url.path, parse_qs(url.query)))
+        if url.path == "/" and parse_qs(url.query).get("s") == [MOD_ID]:
+            self.send_fixture("search.html")
+        elif url.path == "/" and "s" in parse_qs(url.query):
+            self.send_fixture("search_empty.html")
+        elif url.path == "/archives/118422":
+            self.send_fixture("article.html")
+        elif url.path == f"/mirror/{MOD_ID}":
+            self.send_fixture("modsbase.html")
+        elif url.path == f"/d/hw4q0x2v9k1m/{MOD_ID}.zip":
+            self.send_zip()
+        else:
+            self.send_body(b"<html><body>not found</body></html>", "text/html", status=404)
+
+    def do_POST(self):
+        fields = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode())
+        self.server.hits.append(("POST", self.path, fields))
+        if fields.get("op") != ["download2"] or fields.get("method_free") != ["Create download link"]:
+            self.send_body(b"<html><body>bad form</body></html>", "text/html", status=400)
+        elif self.server.direct:
+            # some mirrors hand over the file as the answer to the form
+            self.send_zip()
+        else:
+            self.send_fixture("link.html")
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.archive = make_zip()
+    server.hits = []
+    server.direct = False
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def engine_for(site, folder, **options):
+    return HttpEngine(site.base_url, folder, honor_countdown=False, **options)
+
+
+def test_fetch_follows_the_link_page(site, tmp_path):
+    path = engine_for(site, tmp_path).fetch(MOD_ID)
+    assert path == tmp_path / f"{MOD_ID}.zip"
+    assert path.read_bytes() == site.archive
+    posts = [hit for hit in site.hits if hit[0] == "POST"]
+    assert len(posts) == 1 and posts[0][2]["id"] == ["hw4q0x2v9k1m"]
+
+
+def test_fetch_takes_a_file_handed_over_by_the_form(site, tmp_path):
+    site.direct = True
+    engine = engine_for(site, tmp_path)
+    path = engine.fetch(MOD_ID)
+    assert path.read_bytes() == site.archive
+    assert engine.expected[path.name] == len(site.archive)
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def test_countdown_is_read_from_the_saved_page():
+    match = COUNTDOWN_PATTERN.search((FIXTURES / "modsbase.html").read_text())
+    assert match and match.group(1) == "5"
+
+
+def test_zero_countdown_doesnt_sleep(tmp_path, monkeypatch):
+    slept = []
+    monkeypatch.setattr("http_engine.time.sleep", slept.append)
+    engine = HttpEngine("http://127.0.0.1", tmp_path)
+    page = (FIXTURES / "modsbase.html").read_text()
+    engine.wait_countdown(COUNTDOWN_PATTERN.sub(lambda m: m.group(0).replace(m.group(1), "0"), page))
+    assert slept == []
+    engine.wait_countdown(page)
+    assert slept and slept[0] >= 5
+
+
+def test_cached_mod_skips_the_search(site, tmp_path):
+    cache = ResolutionCache(tmp_path / "cache.sqlite")
+    engine_for(site, tmp_path / "one", cache=cache).fetch(MOD_ID)
+    site.hits.clear()
+    # a trailing slash is the same site. the cache has to agree.
+    engine = HttpEngine(site.base_url + "/", tmp_path / "two", honor_countdown=False, cache=cache)
+    engine.fetch(MOD_ID)
+    assert not [hit for hit in site.hits if hit[1] in ("/", "/archives/118422")]
+    assert cache.get(site.base_url + "/", MOD_ID)["zip_size"] == len(site.archive)
+
+
+def test_missing_search_result_is_an_engine_error(site, tmp_path):
+    with pytest.raises(EngineError, match="no search result"):
+        engine_for(site, tmp_path).fetch("1")
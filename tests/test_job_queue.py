@@ -0,0 +1,97 @@
+# the sqlite job store: claims from more than one connection, and picking up after a dead run
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from job_queue import JobStore, QUEUED, RESOLVING, DOWNLOADING, DOWNLOADED, FAILED, JOBS_NAME
+
+IDS = [str(100 + i) for i in range(60)]
+
+
+@pytest.fixture
+def stores(tmp_path):
+    opened = [JobStore(tmp_path / JOBS_NAME) for _ in range(2)]
+    opened[0].reset(IDS, base_url="https://smods.ru")
+    yield opened
+    for store in opened:
+        store.close()
+
+
+def test_two_connections_never_claim_the_same_job(stores):
+    claimed = [[] for _ in range(4)]
+
+    def drain(store, into):
+        while True:
+            mod_id = store.claim()
+            if mod_id is None:
+                return
+            into.append(mod_id)
+
+    threads = [threading.Thread(target=drain, args=(stores[i % 2], claimed[i])) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    everything = [m for part in claimed for m in part]
+    assert sorted(everything) == sorted(IDS)
+    assert stores[1].counts() == {RESOLVING: len(IDS)}
+
+
+def test_claim_respects_order_site_and_backoff(stores):
+    first, second = stores
+    first.add(["900"], base_url="https://other.smods.ru")
+    assert first.claim(base_url="https://other.smods.ru") == "900"
+    assert first.claim(base_url="https://other.smods.ru") is None
+    first.move(IDS[0], QUEUED, not_before=time.time() + 60)
+    assert second.claim() == IDS[1]
+    # a retry someone already took can't be taken again
+    first.move(IDS[2], QUEUED)
+    assert second.take(IDS[2])
+    assert not first.take(IDS[2])
+
+
+def test_add_keeps_known_jobs_as_they_are(stores):
+    store = stores[0]
+    store.move(IDS[0], DOWNLOADED, archive="100.zip")
+    assert store.add([IDS[0], "999"]) == 1
+    assert store.state(IDS[0]) == DOWNLOADED
+    assert store.ids(QUEUED)[-1] == "999"
+    assert store.archives() == {IDS[0]: "100.zip"}
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_recover_requeues_only_what_nobody_is_working_on(stores):
+    store = stores[0]
+    host = socket.gethostname()
+    now = time.time()
+    rows = {
+        IDS[0]: (RESOLVING, f"{host}:{dead_pid()}", now),            # this machine, process is gone
+        IDS[1]: (DOWNLOADING, store.owner, now),                    # this process, still going
+        IDS[2]: (DOWNLOADING, "elsewhere:123", now - 2 * 3600),     # other machine, quiet for too long
+        IDS[3]: (DOWNLOADING, "elsewhere:123", now),                # other machine, recent
+        IDS[4]: (FAILED, None, now - 2 * 3600),                     # finished. stays finished.
+    }
+    store.transaction(lambda db: db.executemany(
+        "UPDATE jobs SET state = ?, owner = ?, updated_at = ? WHERE mod_id = ?",
+        [(state, owner, updated, mod_id) for mod_id, (state, owner, updated) in rows.items()],
+    ))
+    assert sorted(stores[1].recover()) == [IDS[0], IDS[2]]
+    assert [store.state(m) for m in IDS[:5]] == [QUEUED, DOWNLOADING, QUEUED, DOWNLOADING, FAILED]
+
+
+def test_release_hands_back_what_this_process_holds(stores):
+    first, second = stores
+    mod_id = first.claim()
+    first.move(mod_id, DOWNLOADING)
+    assert first.release() == 1
+    assert second.state(mod_id) == QUEUED
+    assert second.claim() == mod_id
@@ -0,0 +1,35 @@
+# phase timings: percentiles and the files a run leaves behind
+import json
+
+import pytest
+
+from metrics import Metrics, percentile, JSONL_NAME, PROM_NAME
+
+
+@pytest.mark.parametrize("values, p, expected", [
+    (range(1, 7), 50, 3),
+    (range(1, 11), 50, 5),
+    (range(1, 11), 95, 10),
+    (range(1, 101), 95, 95),
+    ([4, 1, 3], 0, 1),
+    ([4, 1, 3], 100, 4),
+    ([7], 50, 7),
+])
+def test_percentile_is_nearest_rank(values, p, expected):
+    assert percentile(list(values), p) == expected
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 50) is None
+
+
+def test_finish_writes_both_files_and_closes_the_log(tmp_path):
+    metrics = Metrics(tmp_path)
+    with metrics.phase("search", mod_id="42") as record:
+        record["bytes"] = 100
+        metrics.count("search_retries")
+    metrics.finish()
+    assert metrics.jsonl is None
+    lines = [json.loads(line) for line in (tmp_path / JSONL_NAME).read_text().splitlines()]
+    assert [(s["phase"], s["mod_id"], s["bytes"], s["retries"]) for s in lines] == [("search", "42", 100, 1)]
+    assert 'phase="search"' in (tmp_path / PROM_NAME).read_text()
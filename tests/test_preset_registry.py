@@ -0,0 +1,57 @@
+# which site belongs to which game: merging the built-in list with the scraped file
+import json
+
+from preset_registry import PresetRegistry, DEFAULT_BASE_URL
+
+BUILTIN = {
+    "Stellaris": {"app_id": "281990", "base_url": "https://catalogue.smods.ru"},
+    "RimWorld": {"app_id": "294100", "base_url": "https://catalogue.smods.ru", "lean": True},
+    "Cities: Skylines": {"app_id": "255710", "base_url": "https://smods.ru"},
+}
+
+
+def registry(tmp_path, scraped=None):
+    path = tmp_path / "verified_presets.json"
+    if scraped is not None:
+        path.write_text(json.dumps(scraped))
+    return PresetRegistry(path, builtin=BUILTIN)
+
+
+def test_scraped_entries_win_but_keep_known_app_ids(tmp_path):
+    presets = registry(tmp_path, {"Stellaris Mods": {"app_id": "", "base_url": "https://stellaris.smods.ru/"}})
+    assert presets.for_app("281990") == ("Stellaris", "https://stellaris.smods.ru")
+    assert presets.get("stellaris")["source"] == "verified_presets.json"
+    assert presets.for_app("1") == (None, DEFAULT_BASE_URL)
+
+
+def test_same_game_twice_in_one_source_is_a_conflict(tmp_path):
+    presets = registry(tmp_path, {
+        "Teardown": {"app_id": "1167630", "base_url": "https://a.smods.ru"},
+        "Teardown Mods": {"app_id": "1167630", "base_url": "https://b.smods.ru"},
+    })
+    assert presets.for_app("1167630") == ("Teardown", "https://b.smods.ru")
+    assert any("using the second" in c for c in presets.conflicts)
+
+
+def test_two_games_with_one_app_id_keep_the_first(tmp_path):
+    presets = registry(tmp_path, {"Not Stellaris": {"app_id": "281990", "base_url": "https://other.smods.ru"}})
+    assert presets.for_app("281990") == ("Stellaris", "https://catalogue.smods.ru")
+    assert any("using the first" in c for c in presets.conflicts)
+
+
+def test_broken_entries_are_skipped(tmp_path):
+    presets = registry(tmp_path, {"Bad Url": {"base_url": "ftp://x"}, "Bad App": {"app_id": "abc", "base_url": "https://x.smods.ru"}, "Odd": "nope"})
+    assert presets.get("Bad Url") is None and presets.get("Bad App") is None and presets.get("Odd") is None
+    assert len(presets.problems) == 3
+
+
+def test_for_base_url_merges_every_game_on_the_site(tmp_path):
+    presets = registry(tmp_path)
+    shared = presets.for_base_url("https://catalogue.smods.ru/")
+    # stellaris comes first, so its name wins. only rimworld sets lean, so that comes through.
+    assert shared["name"] == "Stellaris" and shared["lean"] is True
+    assert presets.for_base_url("https://smods.ru/archives/12345")["app_id"] == "255710"
+    assert presets.for_base_url("https://nowhere.example") is None
+    # callers get their own copy
+    shared["lean"] = False
+    assert presets.for_base_url("https://catalogue.smods.ru")["lean"] is True
@@ -0,0 +1,59 @@
+# the catalogue crawl against a tiny smods lookalike on localhost
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from preset_scraper import inspect_game
+
+GAME_PAGE = b"""<html><head><title>Mods for Some Game</title></head><body>
+<article><h2><a href="/archives/118422">Realistic Roads</a></h2></article>
+</body></html>"""
+
+ARTICLE_PAGE = b"""<html><head><title>Realistic Roads</title></head><body>
+<p>Original: <a href="https://steamcommunity.com/sharedfiles/filedetails/?id=2858562094">steam workshop</a></p>
+</body></html>"""
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        body = {"/game": GAME_PAGE, "/game?app=294100": GAME_PAGE, "/archives/118422": ARTICLE_PAGE}.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    server.hits = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_sample_mod_id_comes_from_the_steam_link(server):
+    result = inspect_game("Some Game", f"{server.url}/game", None)
+    # 118422 is the site's post id. only the steam link says which workshop item it is.
+    assert result["sample_mod_id"] == "2858562094"
+    assert result["base_url"] == server.url
+    assert result["app_id"] == ""
+
+
+def test_app_in_the_url_skips_the_mod_page(server):
+    result = inspect_game("Some Game", f"{server.url}/game?app=294100", None)
+    assert result["app_id"] == "294100"
+    assert result["sample_mod_id"] is None
+    assert "/archives/118422" not in server.hits
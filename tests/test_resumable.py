@@ -0,0 +1,115 @@
+# range downloads against bench.py's fake modsbase: resume, segments, and servers that don't play along
+import json
+import time
+
+import pytest
+
+from bench import FakeSite, FakeSiteHandler
+from resumable import RangeDownloader, ResumeError, PARTIAL_SUFFIX, META_SUFFIX
+from throttle import Throttle
+
+NAME = "42.zip"
+
+
+class FlakyHandler(FakeSiteHandler):
+    # the bench handler, plus a dropped connection or a deaf ear for ranges when the test asks
+    def send_zip(self, mod_id):
+        site = self.server.site
+        site.ranges.append(self.headers.get("Range"))
+        if site.ignore_ranges:
+            del self.headers["Range"]
+        if site.cut_after is None:
+            super().send_zip(mod_id)
+            return
+        # promise the whole file, send part of it, hang up
+        cut, site.cut_after = site.cut_after, None
+        data = site.archive
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes 0-{len(data) - 1}/{len(data)}")
+        self.send_header("Content-Disposition", f'attachment; filename="{mod_id}.zip"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data[:cut])
+        self.wfile.flush()
+        self.close_connection = True
+
+
+@pytest.fixture
+def site():
+    site = FakeSite(archive_size=1 << 18)
+    site.server.RequestHandlerClass = FlakyHandler
+    site.ranges = []
+    site.ignore_ranges = False
+    site.cut_after = None
+    with site:
+        yield site
+
+
+def url(site):
+    return f"{site.mirror_url}/files/42.zip"
+
+
+def test_resumes_after_a_cut_connection(site, tmp_path):
+    site.cut_after = 100_000
+    downloader = RangeDownloader(tmp_path, chunk_size=4096)
+    with pytest.raises(ResumeError, match="connection dropped"):
+        downloader.download(url(site))
+    # what it got so far stays, with a note of how far that was
+    assert (tmp_path / (NAME + PARTIAL_SUFFIX)).exists()
+    meta = json.loads((tmp_path / (NAME + META_SUFFIX)).read_text())
+    assert meta["segments"][0][2] == 100_000
+
+    site.ranges.clear()
+    path = downloader.download(url(site))
+    assert path.read_bytes() == site.archive
+    assert f"bytes=100000-{len(site.archive) - 1}" in site.ranges
+    assert not (tmp_path / (NAME + META_SUFFIX)).exists()
+    assert downloader.expected[NAME] == len(site.archive)
+
+
+def test_segments_get_put_back_together(site, tmp_path):
+    downloader = RangeDownloader(tmp_path, segments=4, segment_threshold=1, chunk_size=4096)
+    path = downloader.download(url(site))
+    assert path.read_bytes() == site.archive
+    # the probe, then one request per segment
+    segment_requests = [r for r in site.ranges if r != "bytes=0-"]
+    assert len(segment_requests) == 4
+
+
+class CountingThrottle(Throttle):
+    # a real throttle that also writes down every report
+    def __init__(self):
+        super().__init__(rate=0, max_in_flight=2)
+        self.reports = []
+
+    def report(self, url, status=None, title=None):
+        self.reports.append(status)
+        return super().report(url, status, title)
+
+
+def test_segments_go_through_the_throttle(site, tmp_path):
+    throttle = CountingThrottle()
+    downloader = RangeDownloader(tmp_path, segments=4, segment_threshold=1, chunk_size=4096, throttle=throttle)
+    path = downloader.download(url(site))
+    assert path.read_bytes() == site.archive
+    # every request to the host got a slot and a report, and gave the slot back
+    assert len(throttle.reports) == len(site.ranges)
+    assert set(throttle.reports) <= {200, 206}
+    assert all(bucket.in_flight == 0 for bucket in throttle.buckets.values())
+
+
+def test_server_that_ignores_ranges_gets_downloaded_in_one_go(site, tmp_path):
+    site.ignore_ranges = True
+    path = RangeDownloader(tmp_path, segments=4, segment_threshold=1).download(url(site))
+    assert path.read_bytes() == site.archive
+    assert not (tmp_path / (NAME + META_SUFFIX)).exists()
+
+
+def test_finish_refuses_a_file_of_the_wrong_size(tmp_path):
+    downloader = RangeDownloader(tmp_path)
+    (tmp_path / (NAME + PARTIAL_SUFFIX)).write_bytes(b"x" * 10)
+    with pytest.raises(ResumeError, match="expected 20"):
+        downloader.finish(NAME, 20, time.monotonic())
+    assert (tmp_path / (NAME + PARTIAL_SUFFIX)).exists()
+    assert not (tmp_path / NAME).exists()
+    assert NAME not in downloader.expected
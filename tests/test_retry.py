@@ -0,0 +1,90 @@
+# failure kinds and the retry scheduler's backoff
+import random
+import threading
+
+import pytest
+
+from retry import RetryScheduler, ModFailure, classify, SEARCH_MISS, TIMEOUT, SITE_DOWN, POPUP_LOOP, OTHER
+
+
+class Edge(random.Random):
+    # uniform() always picks one end, so the jitter bounds can be checked exactly
+    def __init__(self, high):
+        super().__init__()
+        self.high = high
+
+    def uniform(self, a, b):
+        return b if self.high else a
+
+
+@pytest.mark.parametrize("high", [False, True])
+def test_backoff_doubles_and_stops_at_the_cap(high):
+    scheduler = RetryScheduler(base_delay=10, max_delay=60, rng=Edge(high))
+    full = [10, 20, 40, 60, 60]
+    expected = [d if high else d / 2 for d in full]
+    assert [scheduler.delay(attempt) for attempt in range(1, 6)] == expected
+
+
+def test_retries_until_they_run_out():
+    scheduler = RetryScheduler(retries=2, base_delay=0)
+    for _ in range(2):
+        scheduler.started("42")
+        assert scheduler.failed_with("42", TIMEOUT)
+        assert scheduler.next_due() == "42"
+    scheduler.started("42")
+    assert not scheduler.failed_with("42", TIMEOUT)
+    assert scheduler.failed == {"42": TIMEOUT}
+    assert scheduler.next_due() is None
+
+
+def test_search_miss_is_not_retried():
+    scheduler = RetryScheduler(retries=3, base_delay=0)
+    scheduler.started("42")
+    assert not scheduler.failed_with("42", SEARCH_MISS)
+    assert scheduler.next_due() is None
+
+
+def test_site_down_streak_stops_the_batch():
+    scheduler = RetryScheduler(retries=3, base_delay=60, down_after=3)
+    for mod_id in ("1", "2"):
+        scheduler.started(mod_id)
+        assert scheduler.failed_with(mod_id, SITE_DOWN)
+    scheduler.started("3")
+    assert not scheduler.failed_with("3", SITE_DOWN)
+    # the ones waiting for their retry are given up on too
+    assert scheduler.next_due() is None
+    assert scheduler.failed == {"1": SITE_DOWN, "2": SITE_DOWN, "3": SITE_DOWN}
+
+
+def test_a_success_resets_the_down_streak():
+    scheduler = RetryScheduler(retries=3, base_delay=0, down_after=2)
+    scheduler.started("1")
+    scheduler.failed_with("1", SITE_DOWN)
+    scheduler.started("2")
+    scheduler.succeeded("2")
+    scheduler.started("3")
+    assert scheduler.failed_with("3", SITE_DOWN)
+    assert not scheduler.stopped
+
+
+def test_next_due_waits_for_mods_still_in_flight():
+    scheduler = RetryScheduler(retries=1, base_delay=0)
+    scheduler.started("42")
+    timer = threading.Timer(0.05, scheduler.failed_with, args=("42", TIMEOUT))
+    timer.start()
+    assert scheduler.next_due() == "42"
+    timer.join()
+
+
+@pytest.mark.parametrize("error, kwargs, kind", [
+    (Exception("boom"), {"status": 503}, SITE_DOWN),
+    (Exception("boom"), {"page_text": "502 Bad Gateway"}, SITE_DOWN),
+    (ConnectionError("reset"), {}, SITE_DOWN),
+    (Exception("no search result for 42"), {}, SEARCH_MISS),
+    (TimeoutError(), {}, TIMEOUT),
+    (Exception("boom"), {"popups": 5}, POPUP_LOOP),
+    (ModFailure(SEARCH_MISS, "x"), {}, SEARCH_MISS),
+    (Exception("boom"), {}, OTHER),
+])
+def test_classify(error, kwargs, kind):
+    assert classify(error, **kwargs) == kind
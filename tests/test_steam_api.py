@@ -0,0 +1,84 @@
+# the steam web api with canned json instead of valve
+import time
+
+import steam_api
+from steam_api import SteamClient, SteamCache, BATCH_SIZE, FILETYPE_COLLECTION, PUBLISHED_FILE_DETAILS_URL, COLLECTION_DETAILS_URL
+
+
+class CannedSteam:
+    # answers like the api does, from a dict. remembers every request.
+    def __init__(self, details=None, children=None):
+        self.details = details or {}
+        self.children = children or {}
+        self.calls = []
+
+    def __call__(self, url, fields, timeout=30):
+        ids = [v for k, v in fields.items() if k.startswith("publishedfileids")]
+        self.calls.append((url, ids))
+        if url == COLLECTION_DETAILS_URL:
+            return {"response": {"collectiondetails": [
+                {"publishedfileid": m, "result": 1, "children": [
+                    {"publishedfileid": child, "sortorder": i, "filetype": kind} for i, (child, kind) in enumerate(self.children[m])
+                ]} if m in self.children else {"publishedfileid": m, "result": 9}
+                for m in ids
+            ]}}
+        assert url == PUBLISHED_FILE_DETAILS_URL
+        return {"response": {"publishedfiledetails": [
+            {"publishedfileid": m, "result": 1, **self.details[m]} if m in self.details else {"publishedfileid": m, "result": 9}
+            for m in ids
+        ]}}
+
+
+def test_details_are_fetched_in_batches():
+    ids = [str(1000 + i) for i in range(BATCH_SIZE * 2 + 5)]
+    steam = CannedSteam(details={m: {"consumer_app_id": 255710} for m in ids[:-1]})
+    app_ids = SteamClient(post=steam).app_ids(ids)
+    assert [len(batch) for _, batch in steam.calls] == [BATCH_SIZE, BATCH_SIZE, 5]
+    # the one steam doesn't know is just missing
+    assert len(app_ids) == len(ids) - 1 and app_ids[ids[0]] == "255710"
+    assert ids[-1] not in app_ids
+
+
+def test_nested_collections_expand_in_order_and_cycles_stop():
+    steam = CannedSteam(children={
+        "1": [("10", 0), ("2", FILETYPE_COLLECTION), ("11", 0)],
+        # a collection that contains the one it's in, and a mod we already have
+        "2": [("20", 0), ("1", FILETYPE_COLLECTION), ("10", 0)],
+    })
+    mods = SteamClient(post=steam).expand(["1"], include_dependencies=False)
+    assert mods == ["10", "11", "20"]
+
+
+def test_required_items_come_along():
+    steam = CannedSteam(children={
+        "1": [("10", 0), ("11", 0)],
+        # 10 needs 30, which needs 31. 31 needs 10 again.
+        "10": [("30", 0)],
+        "30": [("31", 0)],
+        "31": [("10", 0)],
+    })
+    client = SteamClient(post=steam)
+    assert client.expand(["1"]) == ["10", "11", "30", "31"]
+    assert client.expand(["1"], include_dependencies=False) == ["10", "11"]
+
+
+def test_cache_answers_until_the_ttl_runs_out(tmp_path, monkeypatch):
+    steam = CannedSteam(details={"5": {"consumer_app_id": 4000}, "6": {"consumer_app_id": 4000}})
+    client = SteamClient(post=steam, cache=SteamCache(tmp_path / "steam.sqlite"), ttl=3600)
+    assert client.app_ids(["5"]) == {"5": "4000"}
+    # cached one from the cache, only the new one from steam
+    assert client.app_ids(["5", "6"]) == {"5": "4000", "6": "4000"}
+    assert [batch for _, batch in steam.calls] == [["5"], ["6"]]
+
+    later = time.time() + 3601
+    monkeypatch.setattr(steam_api.time, "time", lambda: later)
+    client.app_ids(["5"])
+    assert [batch for _, batch in steam.calls][-1] == ["5"]
+
+
+def test_max_age_zero_skips_the_cache(tmp_path):
+    steam = CannedSteam(details={"5": {"time_updated": 1}})
+    client = SteamClient(post=steam, cache=SteamCache(tmp_path / "steam.sqlite"))
+    client.details(["5"])
+    client.details(["5"], max_age=0)
+    assert len(steam.calls) == 2
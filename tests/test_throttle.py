@@ -0,0 +1,93 @@
+# the per-host token bucket, its in-flight cap, and backing off when a host pushes back
+import threading
+import time
+
+from throttle import Throttle, looks_throttled, page_title, DEFAULT_RATE, RECOVER_AFTER, RECOVER_FACTOR
+
+URL = "https://catalogue.smods.ru/archives/1"
+
+
+def test_tokens_come_at_the_configured_rate():
+    throttle = Throttle(rate=20, burst=1)
+    started = time.monotonic()
+    for _ in range(5):
+        throttle.wait(URL)
+    # the first token is there already, the other four take 1/20s each
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+
+
+def test_burst_is_free_and_hosts_dont_share_tokens():
+    throttle = Throttle(rate=1, burst=3)
+    started = time.monotonic()
+    for _ in range(3):
+        throttle.wait(URL)
+    throttle.wait("https://modsbase.com/x")
+    assert time.monotonic() - started < 0.5
+
+
+def test_no_more_than_max_in_flight_at_once():
+    throttle = Throttle(rate=0, max_in_flight=2)
+    inside, peak = [0], [0]
+    lock = threading.Lock()
+
+    def request():
+        with throttle.slot(URL):
+            with lock:
+                inside[0] += 1
+                peak[0] = max(peak[0], inside[0])
+            time.sleep(0.02)
+            with lock:
+                inside[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert throttle.bucket(URL).in_flight == 0
+
+
+def test_429_and_captcha_halve_the_rate_once_per_burst():
+    throttle = Throttle(rate=4)
+    assert throttle.report(URL, status=429) == "http 429"
+    assert throttle.bucket(URL).rate == 2
+    # every worker sees the same 429 at once. that's one push back.
+    throttle.report(URL, status=429)
+    assert throttle.bucket(URL).rate == 2
+    throttle.bucket(URL).slowed_at -= 10
+    assert throttle.report(URL, title="Just a moment...") == "captcha"
+    assert throttle.bucket(URL).rate == 1
+
+
+def test_unlimited_host_gets_a_limit_when_it_complains():
+    throttle = Throttle(rate=0)
+    throttle.report(URL, status=503)
+    assert throttle.bucket(URL).rate == DEFAULT_RATE / 2
+
+
+def test_rate_recovers_after_clean_requests_up_to_the_configured_one():
+    throttle = Throttle(rate=4)
+    throttle.report(URL, status=429)
+    for _ in range(RECOVER_AFTER - 1):
+        throttle.report(URL, status=200)
+    assert throttle.bucket(URL).rate == 2
+    throttle.report(URL, status=200)
+    assert throttle.bucket(URL).rate == 2 * RECOVER_FACTOR
+    for _ in range(RECOVER_AFTER * 10):
+        throttle.report(URL, status=200)
+    assert throttle.bucket(URL).rate == 4
+
+
+def test_overrides_beat_the_defaults():
+    throttle = Throttle(rate=3, max_in_flight=4, overrides={"modsbase.com": {"rate": 0.5, "max_in_flight": 1}})
+    bucket = throttle.bucket("https://modsbase.com/abc")
+    assert (bucket.rate, bucket.max_in_flight) == (0.5, 1)
+    assert throttle.bucket(URL).max_in_flight == 4
+
+
+def test_only_the_title_counts_as_a_captcha():
+    page = "<html><head><title>Mod page</title></head><body>g-recaptcha for comments</body></html>"
+    assert page_title(page) == "Mod page"
+    assert looks_throttled(200, page_title(page)) is None
+    assert looks_throttled(None, "Attention Required! | Cloudflare") == "captcha"
@@ -0,0 +1,93 @@
+# archive checks and index.json, and that the index files next to the archives don't look like downloads
+import os
+import zipfile
+
+import pytest
+
+from download_tracker import looks_like_download
+from manifest import folder_lock
+from verifier import verify_archive, CorruptArchiveError, FolderIndex, VerificationPipeline, INDEX_NAME
+
+
+def make_zip(path, files=None):
+    files = files or {"mod.cpp": b"name = \"test\";\n", "addons/a.pbo": os.urandom(4096)}
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return path
+
+
+def test_good_archive_gets_hashed_inside_and_out(tmp_path):
+    path = make_zip(tmp_path / "42.zip")
+    result = verify_archive(path, expected_size=path.stat().st_size)
+    assert result["status"] == "ok"
+    assert set(result["files"]) == {"mod.cpp", "addons/a.pbo"}
+    assert result["files"]["addons/a.pbo"]["size"] == 4096
+
+
+def test_truncated_archive_is_corrupt(tmp_path):
+    path = make_zip(tmp_path / "42.zip")
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) // 2])
+    with pytest.raises(CorruptArchiveError):
+        verify_archive(path)
+
+
+def test_flipped_bit_fails_the_crc(tmp_path):
+    # stored, so the payload sits in the file as it is and one flipped byte only trips the crc
+    path = tmp_path / "42.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("addons/a.pbo", b"\0" * 4096)
+    data = bytearray(path.read_bytes())
+    data[data.index(b"\0" * 64) + 100] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(CorruptArchiveError):
+        verify_archive(path)
+
+
+def test_size_has_to_match_what_the_server_said(tmp_path):
+    path = make_zip(tmp_path / "42.zip")
+    with pytest.raises(CorruptArchiveError, match="the server said"):
+        verify_archive(path, expected_size=path.stat().st_size + 1)
+
+
+def test_index_saves_merge_with_other_processes(tmp_path):
+    result = verify_archive(make_zip(tmp_path / "1.zip"))
+    first, second = FolderIndex(tmp_path), FolderIndex(tmp_path)
+    first.put("1", result)
+    first.save()
+    second.put("2", dict(result, archive="2.zip"))
+    second.drop("3")
+    second.save()
+    assert set(FolderIndex(tmp_path).entries) == {"1", "2"}
+
+
+def test_index_files_are_not_downloads(tmp_path):
+    # index.json and its lock live in the folder the tracker watches. only the zips count.
+    make_zip(tmp_path / "1.zip")
+    index = FolderIndex(tmp_path)
+    index.put("1", verify_archive(tmp_path / "1.zip"))
+    index.save()
+    (tmp_path / (INDEX_NAME + ".tmp")).write_text("{}")
+    with folder_lock(tmp_path):
+        pass
+    (tmp_path / "2.zip.part").write_bytes(b"x")
+    names = {entry.name for entry in os.scandir(tmp_path) if looks_like_download(entry)}
+    assert names == {"1.zip", "2.zip.part"}
+
+
+def test_wait_returns_after_on_done_ran(tmp_path):
+    # the session pool records a mod right after this. on_done has to have dropped a broken one by then.
+    handled = []
+    pipeline = VerificationPipeline(tmp_path, workers=1, on_done=lambda mod_id, result: handled.append((mod_id, result["status"])))
+    try:
+        (tmp_path / "7.zip").write_bytes(b"not a zip")
+        pipeline.submit("7", tmp_path / "7.zip")
+        result = pipeline.wait("7")
+        assert result["status"] == "failed"
+        assert handled == [("7", "failed")]
+        # nothing running for it any more, so this doesn't block
+        assert pipeline.wait("7")["status"] == "failed"
+        assert pipeline.wait("8") is None
+    finally:
+        pipeline.close()
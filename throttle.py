@@ -0,0 +1,187 @@
+# filename: throttle.py
+# smods, modsbase and steam all soft-ban you if you hit them too hard. every request to a host
+# goes through its bucket here: so many per second, so many at once, across all workers.
+# a 429, a 503 or a captcha page halves the rate for that host. it creeps back up after a
+# run of clean requests.
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from preset_registry import PRESETS
+
+# per host. presets can set "rate" and "max_in_flight" for their site.
+DEFAULT_RATE = 3.0
+DEFAULT_MAX_IN_FLIGHT = 4
+# tokens that can pile up while a host is idle
+DEFAULT_BURST = 6
+MIN_RATE = 0.1
+# clean requests in a row before the rate goes back up a notch
+RECOVER_AFTER = 20
+RECOVER_FACTOR = 1.25
+THROTTLE_STATUSES = (429, 503)
+# checked against the page title only. the body of every smods page has a recaptcha for comments.
+CAPTCHA_PATTERNS = re.compile(r"captcha|are you a robot|attention required|just a moment|too many requests|access denied", re.IGNORECASE)
+TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+def host_of(url):
+    return urlparse(url).netloc or url
+
+
+def page_title(html):
+    match = TITLE_PATTERN.search(html or "")
+    return match.group(1).strip() if match else ""
+
+
+def looks_throttled(status=None, title=None):
+    # the reason we got told to slow down, or None
+    if status in THROTTLE_STATUSES:
+        return f"http {status}"
+    if title and CAPTCHA_PATTERNS.search(title):
+        return "captcha"
+    return None
+
+
+class HostBucket:
+    # token bucket plus an in-flight count for one host
+    def __init__(self, host, rate, burst, max_in_flight):
+        self.host = host
+        self.configured = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_in_flight = max_in_flight
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.clean = 0
+        self.slowed_at = 0
+        self.cond = threading.Condition()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        # blocks until a token is there. call with the condition held.
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.cond.wait((1 - self.tokens) / self.rate)
+
+    def acquire(self, hold=True):
+        with self.cond:
+            while hold and self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.cond.wait()
+            self.take()
+            if hold:
+                self.in_flight += 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def slow_down(self):
+        with self.cond:
+            if not self.rate:
+                # unlimited until now. start from something sane.
+                self.configured = self.rate = DEFAULT_RATE
+            now = time.monotonic()
+            # every worker sees the same 429 at once. that's one push back, not eight.
+            if now - self.slowed_at > 1 / self.rate:
+                self.rate = max(MIN_RATE, self.rate / 2)
+                self.slowed_at = now
+            # and nothing at all for a moment
+            self.tokens = min(self.tokens, 0)
+            self.clean = 0
+            return self.rate
+
+    def went_fine(self):
+        with self.cond:
+            if self.rate >= self.configured:
+                return None
+            self.clean += 1
+            if self.clean < RECOVER_AFTER:
+                return None
+            self.clean = 0
+            self.rate = min(self.configured, self.rate * RECOVER_FACTOR)
+            return self.rate
+
+
+class Throttle:
+    # shared by everything a run does. rate=0 means no limit (until a host complains).
+    def __init__(self, rate=DEFAULT_RATE, max_in_flight=DEFAULT_MAX_IN_FLIGHT, burst=DEFAULT_BURST, metrics=None, overrides=None):
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.burst = burst
+        self.metrics = metrics
+        # host -> {"rate", "max_in_flight"}, on top of the presets
+        self.overrides = dict(overrides or {})
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def settings(self, host):
+        preset = PRESETS.for_base_url(f"https://{host}") or PRESETS.for_base_url(f"http://{host}") or {}
+        settings = {"rate": self.rate, "max_in_flight": self.max_in_flight}
+        settings.update({k: preset[k] for k in ("rate", "max_in_flight") if k in preset})
+        settings.update(self.overrides.get(host, {}))
+        return settings
+
+    def bucket(self, url):
+        host = host_of(url)
+        with self.lock:
+            bucket = self.buckets.get(host)
+        if bucket:
+            return bucket
+        settings = self.settings(host)
+        with self.lock:
+            bucket = self.buckets.setdefault(host, HostBucket(host, float(settings["rate"] or 0), self.burst, int(settings["max_in_flight"] or 0)))
+        self.publish(bucket)
+        return bucket
+
+    def wait(self, url):
+        # a token for a request we can't hold a slot for (a click that navigates somewhere)
+        self.bucket(url).acquire(hold=False)
+
+    @contextmanager
+    def slot(self, url):
+        # a token and a place among the requests in flight to this host
+        bucket = self.bucket(url)
+        bucket.acquire()
+        self.publish(bucket)
+        try:
+            yield bucket
+        finally:
+            bucket.release()
+            self.publish(bucket)
+
+    def report(self, url, status=None, title=None):
+        # after every response. slows the host down if it pushed back, speeds it up if it's been fine.
+        bucket = self.bucket(url)
+        reason = looks_throttled(status, title)
+        if reason:
+            rate = bucket.slow_down()
+            logging.warning(f"{bucket.host} is pushing back ({reason}). down to {rate:.2f} requests/s.")
+            if self.metrics:
+                self.metrics.count("throttled", host=bucket.host, reason=reason)
+        elif bucket.went_fine():
+            logging.info(f"{bucket.host} has been fine for a while. back up to {bucket.rate:.2f} requests/s.")
+        self.publish(bucket)
+        return reason
+
+    def publish(self, bucket):
+        if self.metrics:
+            self.metrics.gauge("host_rate_per_second", round(bucket.rate, 3), host=bucket.host)
+            self.metrics.gauge("host_in_flight", bucket.in_flight, host=bucket.host)
+
+    def rates(self):
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
@@ -0,0 +1,289 @@
+# filename: verifier.py
+# checks every archive as soon as it lands, while the next ones are still downloading.
+# the file gets hashed, its size compared to what the server said, and every entry read
+# through once so zipfile checks its crc. nothing gets written to disk but the index:
+# index.json in the output folder, mod id -> archive, size, sha256 and every file inside.
+# a deploy step can diff two of those and only copy what changed.
+#
+#     python3 verifier.py check Mod_Downloads
+#     python3 verifier.py changed old_index.json Mod_Downloads/index.json
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import logging
+import zipfile
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from manifest import Manifest, folder_lock
+
+INDEX_NAME = "index.json"
+# hashing is cheap, decompressing isn't. two at a time keeps up with downloads without starving extraction.
+DEFAULT_VERIFY_WORKERS = min(2, os.cpu_count() or 1)
+# the index gets written every this many archives, so a killed run doesn't lose all of it
+SAVE_EVERY = 25
+# archives that failed get renamed to this, so nothing deploys them by accident
+CORRUPT_SUFFIX = ".corrupt"
+
+
+class CorruptArchiveError(Exception):
+    # truncated, wrong size, bad crc. the download has to happen again.
+    pass
+
+
+def verify_archive(archive_path, expected_size=None, chunk_size=1 << 20):
+    # runs in a worker process. returns a dict, raises CorruptArchiveError if the archive is bad.
+    started = time.monotonic()
+    archive_path = Path(archive_path)
+    size = archive_path.stat().st_size
+    if expected_size is not None and size != expected_size:
+        raise CorruptArchiveError(f"{archive_path.name} is {size} bytes, the server said {expected_size}")
+
+    digest = hashlib.sha256()
+    with open(archive_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    files = {}
+    try:
+        # a cut-off zip has no central directory at the end. zipfile notices that right here.
+        with zipfile.ZipFile(archive_path, "r") as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                member = hashlib.sha256()
+                # zipfile checks the crc when the member is read to the end
+                with zf.open(info) as src:
+                    for chunk in iter(lambda: src.read(chunk_size), b""):
+                        member.update(chunk)
+                files[info.filename] = {"size": info.file_size, "sha256": member.hexdigest()}
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        raise CorruptArchiveError(f"{archive_path.name}: {e}") from e
+    except (NotImplementedError, RuntimeError) as e:
+        # compression we can't read, or a password. the archive may be fine, we just can't tell.
+        raise CorruptArchiveError(f"{archive_path.name} can't be checked: {e}") from e
+
+    return {"archive": archive_path.name, "status": "ok", "size": size, "sha256": digest.hexdigest(), "files": files, "seconds": time.monotonic() - started}
+
+
+class FolderIndex:
+    # index.json. like the manifest, save() merges with whatever other processes wrote meanwhile.
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / INDEX_NAME
+        self.entries = self.read()
+        self.changed = set()
+        self.dropped = set()
+
+    def read(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get("mods", {})
+        except (OSError, ValueError) as e:
+            logging.warning(f"index is broken ({e}). starting a new one.")
+            return {}
+
+    def put(self, mod_id, result):
+        self.entries[str(mod_id)] = {
+            "archive": result["archive"],
+            "size": result["size"],
+            "sha256": result["sha256"],
+            "verified_at": time.time(),
+            "files": result["files"],
+        }
+        self.changed.add(str(mod_id))
+        self.dropped.discard(str(mod_id))
+
+    def drop(self, mod_id):
+        self.entries.pop(str(mod_id), None)
+        self.dropped.add(str(mod_id))
+        self.changed.discard(str(mod_id))
+
+    def save(self):
+        if not self.changed and not self.dropped:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with folder_lock(self.folder):
+            entries = self.read()
+            entries.update({m: self.entries[m] for m in self.changed})
+            for mod_id in self.dropped:
+                entries.pop(mod_id, None)
+            self.entries = entries
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump({"mods": self.entries}, f, indent=1, sort_keys=True)
+            tmp.replace(self.path)
+        self.changed, self.dropped = set(), set()
+
+
+def quarantine(archive_path):
+    # out of the way of the deploy, but still there to look at
+    archive_path = Path(archive_path)
+    target = archive_path.with_name(archive_path.name + CORRUPT_SUFFIX)
+    try:
+        archive_path.replace(target)
+    except OSError as e:
+        logging.warning(f"could not move {archive_path.name} aside: {e}")
+        return None
+    return target
+
+
+class VerificationPipeline:
+    def __init__(self, output_folder, workers=DEFAULT_VERIFY_WORKERS, metrics=None, on_done=None):
+        self.output_folder = Path(output_folder)
+        # called with (mod id, result) once an archive is checked. status is "ok" or "failed".
+        self.on_done = on_done
+        self.metrics = metrics
+        self.index = FolderIndex(self.output_folder)
+        self.pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        self.jobs = {}  # mod id -> future, while it's being checked
+        self.results = {}
+        self.unsaved = 0
+        # batch workers submit from their own threads, results come back on the pool's
+        self.lock = threading.Lock()
+
+    def submit(self, mod_id, archive_path, expected_size=None):
+        # a mod can come back after a bad archive. only one check per mod at a time though.
+        with self.lock:
+            if mod_id in self.jobs:
+                return self.jobs[mod_id]
+            future = self.pool.submit(verify_archive, str(archive_path), expected_size)
+            future.queued_at = time.monotonic()
+            future.archive_path = Path(archive_path)
+            # set once the result is handled, on_done included. future.result() alone comes too early for that.
+            future.handled = threading.Event()
+            self.jobs[mod_id] = future
+        future.add_done_callback(lambda f, mod_id=mod_id: self.finished(mod_id, f))
+        return future
+
+    def finished(self, mod_id, future):
+        try:
+            result = future.result()
+        except FileNotFoundError as e:
+            result = {"status": "failed", "error": f"archive is gone: {e}"}
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        result["path"] = future.archive_path
+        with self.lock:
+            self.jobs.pop(mod_id, None)
+            self.results[mod_id] = result
+            if result["status"] == "ok":
+                self.index.put(mod_id, result)
+            else:
+                self.index.drop(mod_id)
+            self.unsaved += 1
+            if self.unsaved >= SAVE_EVERY:
+                self.save_index()
+        if self.metrics:
+            seconds = result.get("seconds", time.monotonic() - future.queued_at)
+            self.metrics.observe("verification", seconds, mod_id=mod_id, nbytes=result.get("size"), ok=result["status"] == "ok")
+        if result["status"] == "ok":
+            logging.info(f"verified {result['archive']} ({len(result['files'])} files, {result['size']} bytes)")
+        else:
+            logging.error(f"{mod_id}: archive is broken. {result['error']}")
+        if self.on_done:
+            self.on_done(mod_id, result)
+        future.handled.set()
+
+    def wait(self, mod_id, timeout=None):
+        # blocks until the mod's check (if one is running) is done and handled. returns its result, or None.
+        with self.lock:
+            future = self.jobs.get(mod_id)
+        if future is not None:
+            future.handled.wait(timeout)
+        with self.lock:
+            return self.results.get(mod_id)
+
+    def save_index(self):
+        # call with the lock held
+        try:
+            self.index.save()
+        except OSError as e:
+            logging.warning(f"could not write {INDEX_NAME}: {e}")
+        self.unsaved = 0
+
+    def close(self):
+        # waits for the stragglers, writes the index and says how it went
+        self.pool.shutdown(wait=True)
+        with self.lock:
+            self.save_index()
+        bad = [m for m, r in self.results.items() if r["status"] != "ok"]
+        if self.results:
+            logging.info(f"verification done: {len(self.results) - len(bad)} ok, {len(bad)} broken. index is in {self.index.path}.")
+        return self.results
+
+
+def check_folder(folder, workers=DEFAULT_VERIFY_WORKERS):
+    # everything the manifest says is in the folder, checked again and indexed. returns the broken ones.
+    manifest = Manifest(folder)
+    pipeline = VerificationPipeline(folder, workers=workers)
+    for mod_id, entry in sorted(manifest.entries.items()):
+        pipeline.submit(mod_id, Path(folder) / entry["archive"], entry.get("size"))
+    results = pipeline.close()
+    broken = {m: r["error"] for m, r in results.items() if r["status"] != "ok"}
+    # the manifest wrote down a hash when it was downloaded. same size with different bytes is broken too.
+    for mod_id, result in results.items():
+        expected = manifest.entries[mod_id].get("sha256")
+        if result["status"] == "ok" and expected and result["sha256"] != expected:
+            broken[mod_id] = f"{result['archive']} doesn't match the sha256 in the manifest"
+    return broken
+
+
+def changed_files(old, new):
+    # paths (relative to the output folder) that are new or different in new, and ones that are gone.
+    # archives count as files, and so does every file a mod's folder gets with --unzip.
+    def flatten(entries):
+        paths = {}
+        for mod_id, entry in entries.items():
+            paths[entry["archive"]] = entry["sha256"]
+            for name, info in entry.get("files", {}).items():
+                paths[f"{mod_id}/{name}"] = info["sha256"]
+        return paths
+    before, after = flatten(old), flatten(new)
+    changed = sorted(p for p, digest in after.items() if before.get(p) != digest)
+    gone = sorted(p for p in before if p not in after)
+    return changed, gone
+
+
+def read_index(path):
+    path = Path(path)
+    if path.is_dir():
+        path = path / INDEX_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get("mods", {})
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    parser = argparse.ArgumentParser(description="checks downloaded archives and diffs folder indexes.")
+    parser.add_argument('command', choices=["check", "changed"])
+    parser.add_argument('paths', nargs='+', help="check: output folder. changed: old index, new index (files or folders)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_VERIFY_WORKERS, help="check: archives at once")
+    parser.add_argument('--deleted', action='store_true', help="changed: list files that are gone instead")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        broken = check_folder(args.paths[0], workers=args.workers)
+        for mod_id, error in sorted(broken.items()):
+            print(f"{mod_id}: {error}", flush=True)
+        sys.exit(1 if broken else 0)
+
+    if len(args.paths) != 2:
+        parser.error("changed needs the old index and the new one")
+    changed, gone = changed_files(read_index(args.paths[0]), read_index(args.paths[1]))
+    # one path per line. rsync --files-from takes it as it is.
+    for path in gone if args.deleted else changed:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()